@@ -38,6 +38,25 @@ def create_app():
 
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
+    # Generated receipts/slips are cached on disk; see app/services/receipt_cache.py.
+    app.config['RECEIPT_CACHE_DIR'] = os.getenv('RECEIPT_CACHE_DIR') or os.path.join(app.instance_path, 'receipt_cache')
+    app.config['RECEIPT_CACHE_MAX_BYTES'] = int(os.getenv('RECEIPT_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+    # Optional SQLite file shared by workers for the public page cache (app/services/page_cache.py).
+    app.config['PAGE_CACHE_PATH'] = os.getenv('PAGE_CACHE_PATH') or None
+    # In-process copies of anonymous public pages (app/services/http_cache.py).
+    app.config['PUBLIC_PAGE_CACHE'] = os.getenv('PUBLIC_PAGE_CACHE', '1') == '1'
+    # SMS are queued in sms_outbox and sent by a worker (app/services/sms_outbox.py).
+    # SMS_TRANSPORT: africastalking | fake.  SMS_OUTBOX_WORKER: thread | off (when `flask sms-worker` runs).
+    app.config['SMS_TRANSPORT'] = os.getenv('SMS_TRANSPORT', 'africastalking')
+    app.config['SMS_OUTBOX_WORKER'] = os.getenv('SMS_OUTBOX_WORKER', 'thread')
+    # Hourly expiry of stale payment requests (app/services/payment_expiry.py): thread | off (when cron runs it).
+    app.config['PAYMENT_EXPIRY_SCHEDULE'] = os.getenv('PAYMENT_EXPIRY_SCHEDULE', 'thread')
+    # Server-Sent Events on the pending page hold a worker per open page: enable (1) only
+    # with an async/threaded worker class (gevent, eventlet, gthread); otherwise the page polls.
+    app.config['STATUS_EVENTS'] = os.getenv('STATUS_EVENTS', '0') == '1'
+    # Build the public token filter at startup (app/services/token_filter.py); 0 builds it on first lookup.
+    app.config['TOKEN_FILTER_PRELOAD'] = os.getenv('TOKEN_FILTER_PRELOAD', '1') == '1'
+
     # Respect reverse-proxy headers on Railway so Flask treats requests as HTTPS.
     app.wsgi_app = ProxyFix(app.wsgi_app, x_for=1, x_proto=1, x_host=1, x_port=1)
 
@@ -87,4 +106,15 @@ def create_app():
     app.register_blueprint(auth_bp)
     app.register_blueprint(admin_bp)
 
+    # Session hooks that keep the token lookup table, the admin search index,
+    # the receipt/page caches and the status hub in step with model writes.
+    from .services import admin_digest, catalog, feedback, page_cache, payment_tokens, receipt_cache, search, sms_outbox, status_hub, token_filter  # noqa: F401
+    sms_outbox.init_app(app)
+    from .services import payment_expiry
+    payment_expiry.init_app(app)
+    token_filter.init_app(app)
+
+    from .cli import register_cli
+    register_cli(app)
+
     return app
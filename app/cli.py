@@ -0,0 +1,158 @@
+# app/cli.py
+import click
+
+
+def register_cli(app):
+    """Attach maintenance commands to ``flask`` (run with ``flask --app run <command>``)."""
+
+    @app.cli.command('search-reindex')
+    @click.option('--chunk-size', default=1000, show_default=True, type=int)
+    def search_reindex(chunk_size):
+        """Rebuild the admin search token index from payments and subscriptions."""
+        from app.services.search import rebuild_index
+
+        total = rebuild_index(chunk_size=chunk_size)
+        click.echo(f'Indexed {total} payment/subscription rows.')
+
+    @app.cli.command('payment-tokens-reindex')
+    @click.option('--chunk-size', default=1000, show_default=True, type=int)
+    def payment_tokens_reindex(chunk_size):
+        """Rebuild the tracking code / reference / checkout id lookup table."""
+        from app.services.payment_tokens import rebuild_tokens
+
+        total = rebuild_tokens(chunk_size=chunk_size)
+        click.echo(f'Indexed tokens for {total} payments.')
+
+    @app.cli.command('expire-pending-payments')
+    @click.option('--max-age-hours', default=None, type=int, help='Defaults to PENDING_PAYMENT_MAX_AGE_HOURS.')
+    @click.option('--chunk-size', default=500, show_default=True, type=int)
+    def expire_pending_payments(max_age_hours, chunk_size):
+        """Move stale pending payments to Expired (schedule from cron)."""
+        from app.services.payment_expiry import expire_stale_payments
+
+        total = expire_stale_payments(max_age_hours=max_age_hours, chunk_size=chunk_size)
+        click.echo(f'Expired {total} stale pending payments.')
+
+    @app.cli.command('purge-signup-keys')
+    def purge_signup_keys():
+        """Drop signup idempotency keys older than SIGNUP_IDEMPOTENCY_TTL_SECONDS (schedule from cron)."""
+        from app.services.idempotency import purge_expired
+
+        total = purge_expired()
+        click.echo(f'Purged {total} expired signup keys.')
+
+    @app.cli.command('sms-worker')
+    @click.option('--once', is_flag=True, help='Send everything due, then exit (for cron).')
+    def sms_worker(once):
+        """Deliver queued SMS from sms_outbox (run with SMS_OUTBOX_WORKER=off on the web)."""
+        from concurrent.futures import ThreadPoolExecutor
+
+        from app.services.sms_outbox import get_worker
+
+        worker = get_worker(app)
+        if once:
+            with ThreadPoolExecutor(max_workers=worker.concurrency) as executor:
+                sent, retried, dead = worker.drain(executor)
+            click.echo(f'Sent {sent} SMS, {retried} to retry, {dead} dead.')
+            return
+        click.echo('Delivering queued SMS; Ctrl+C to stop.')
+        try:
+            worker.run()
+        except KeyboardInterrupt:
+            worker.stop()
+
+    @app.cli.command('flush-admin-digest')
+    def flush_admin_digest():
+        """Queue the admin digest SMS now, whatever the window."""
+        from app.services.admin_digest import flush
+
+        total = flush()
+        click.echo(f'Queued a digest of {total} events.' if total else 'No events waiting.')
+
+    @app.cli.command('sms-campaign')
+    @click.argument('name', type=click.Choice(['delivery-reminders', 'renewal-reminders']))
+    @click.option('--days', default=3, show_default=True, type=int, help='Renewal reminders: period ends within.')
+    @click.option('--template', default=None, help='Message template, e.g. "Hi {first_name}, your {plan} ...".')
+    @click.option('--chunk-size', default=1000, show_default=True, type=int)
+    @click.option('--send', is_flag=True, help='Deliver the queued messages from this process before exiting.')
+    def sms_campaign(name, days, template, chunk_size, send):
+        """Queue a bulk SMS campaign (delivery reminders for tomorrow, or renewal reminders)."""
+        from concurrent.futures import ThreadPoolExecutor
+
+        from app.services import sms_campaigns
+        from app.services.sms_outbox import get_worker
+
+        if name == 'renewal-reminders':
+            spec = sms_campaigns.renewal_reminders(within_days=days, template=template)
+        else:
+            spec = sms_campaigns.delivery_reminders(template=template)
+        try:
+            campaign = sms_campaigns.queue_campaign(spec, chunk_size=chunk_size)
+        except ValueError as exc:
+            raise click.BadParameter(str(exc), param_hint='--template')
+        click.echo(f'Campaign {campaign.key}: {campaign.recipients} messages queued.')
+
+        if send:
+            worker = get_worker(app)
+            with ThreadPoolExecutor(max_workers=worker.concurrency) as executor:
+                worker.drain(executor)
+        for status, total in sorted(sms_campaigns.campaign_stats(campaign.id).items()):
+            click.echo(f'  {status}: {total}')
+
+    @app.cli.command('generate-renewals')
+    @click.option('--days', default=7, show_default=True, type=int, help='Renewal window before period end.')
+    @click.option('--chunk-size', default=1000, show_default=True, type=int)
+    @click.option('--notify/--no-notify', default=False, show_default=True, help='SMS each customer their renewal reference.')
+    def generate_renewals(days, chunk_size, notify):
+        """Create pending renewal payments for subscriptions nearing period end."""
+        from app.services.renewals import generate_renewal_payments
+
+        total = generate_renewal_payments(within_days=days, chunk_size=chunk_size, notify=notify)
+        click.echo(f'Created {total} renewal payments.')
+
+    @app.cli.command('reconcile-statement')
+    @click.argument('path', type=click.Path(exists=True, dir_okay=False))
+    @click.option('--dry-run', is_flag=True, help='Match only; do not confirm or queue anything.')
+    def reconcile_statement_command(path, dry_run):
+        """Import an M-Pesa/bank statement CSV and auto-confirm matching payments."""
+        from app.services.reconciliation import reconcile_statement
+
+        with open(path, encoding='utf-8-sig', newline='') as handle:
+            stats = reconcile_statement(handle, dry_run=dry_run)
+        click.echo(
+            f"{stats['lines']} credit lines, {stats['confirmed']} confirmed, "
+            f"{stats['review']} for review, {stats['duplicates']} duplicates."
+        )
+
+    @app.cli.command('export-receipts')
+    @click.option('--from', 'start', required=True, type=click.DateTime(formats=['%Y-%m-%d']))
+    @click.option('--to', 'end', required=True, type=click.DateTime(formats=['%Y-%m-%d']), help='Inclusive.')
+    @click.option('--output', '-o', required=True, type=click.Path(dir_okay=False, writable=True))
+    @click.option('--workers', default=None, type=int, help='Defaults to RECEIPT_EXPORT_WORKERS / CPU count.')
+    def export_receipts(start, end, output, workers):
+        """Write a ZIP of PDF receipts for payments confirmed in a date range."""
+        from datetime import timedelta
+
+        from app.services.receipt_export import write_receipt_archive
+
+        with open(output, 'wb') as handle:
+            total = write_receipt_archive(handle, start, end + timedelta(days=1), workers=workers)
+        click.echo(f'Wrote {total} receipts to {output}.')
+
+    @app.cli.command('generate-statements')
+    @click.option('--output-dir', '-o', required=True, type=click.Path(file_okay=False))
+    @click.option('--workers', default=None, type=int, help='Defaults to STATEMENT_WORKERS / CPU count.')
+    def generate_statements_command(output_dir, workers):
+        """Write month-end PDF account statements for every active subscriber."""
+        from app.services.statements import generate_statements
+
+        total = generate_statements(output_dir, workers=workers)
+        click.echo(f'Wrote {total} statements to {output_dir}.')
+
+    @app.cli.command('pdf-benchmark')
+    @click.option('--count', default=2000, show_default=True, type=int)
+    def pdf_benchmark(count):
+        """Measure receipt PDF rendering throughput."""
+        from app.services.pdf import benchmark
+
+        click.echo(f'{benchmark(count=count):.0f} receipts/second')
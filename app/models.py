@@ -7,7 +7,7 @@ from enum import Enum
 from flask import has_request_context, request
 from flask_login import UserMixin, current_user
 from sqlalchemy import event, inspect
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, column_property
 from werkzeug.security import check_password_hash, generate_password_hash
 
 from . import db
@@ -26,11 +26,25 @@ class PaymentStatus(str, Enum):
     COMPLETED = "Completed"
     FAILED = "Failed"
     CANCELLED = "Cancelled"
+    EXPIRED = "Expired"
 
 
 class ManualPaymentStatus(str, Enum):
     PENDING = "Pending"
     CONFIRMED = "Confirmed"
+    EXPIRED = "Expired"
+
+
+class SmsStatus(str, Enum):
+    PENDING = "Pending"
+    SENDING = "Sending"
+    SENT = "Sent"
+    DEAD = "Dead"
+
+
+class SmsCampaignStatus(str, Enum):
+    QUEUING = "Queuing"
+    QUEUED = "Queued"
 
 
 class DeliveryStatus(str, Enum):
@@ -88,6 +102,7 @@ class Subscription(db.Model):
     __table_args__ = (
         db.UniqueConstraint('plan_id', 'phone_normalized', name='uq_subscriptions_plan_phone_normalized'),
         db.Index('ix_subscriptions_current_period_end', 'current_period_end'),
+        db.Index('ix_subscriptions_delivery_day_id', 'preferred_delivery_day', 'id'),
     )
 
     CANCELLED_RESULT_CODES = {1032, 1037, 1025}
@@ -191,7 +206,7 @@ class Payment(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     subscription_id = db.Column(db.Integer, db.ForeignKey('subscriptions.id'), nullable=True, index=True)
     amount = db.Column(db.Float, nullable=False)
-    mpesa_receipt = db.Column(db.String(50))
+    mpesa_receipt = db.Column(db.String(50), index=True)
     status = db.Column(db.String(50), default=PaymentStatus.PENDING.value, nullable=False)
     payment_status = db.Column(db.String(20), default=ManualPaymentStatus.PENDING.value, nullable=False, index=True)
     payment_date = db.Column(db.DateTime, default=datetime.utcnow)
@@ -209,12 +224,38 @@ class Payment(db.Model):
 
     subscription = db.relationship('Subscription', back_populates='payments')
 
+    def confirm(self, now=None, method='Manual', channel=None, transaction_reference=None, notes=None):
+        """Mark the payment confirmed; the first success grants the subscription a period and trays."""
+        now = now or datetime.utcnow()
+        first_success = self.status != PaymentStatus.COMPLETED.value
+
+        self.status = PaymentStatus.COMPLETED.value
+        self.payment_status = ManualPaymentStatus.CONFIRMED.value
+        self.manual_payment_status = ManualPaymentStatus.CONFIRMED.value
+        self.payment_method = method
+        self.payment_date = now
+        self.instruction_channel = channel
+        self.admin_transaction_reference = transaction_reference
+        self.admin_notes = notes
+
+        sub = self.subscription
+        if sub and first_success:
+            sub.apply_successful_payment(now=now)
+            monthly_trays = sub.plan.trays_per_week * 4
+            sub.trays_allocated_total = (sub.trays_allocated_total or 0) + monthly_trays
+            sub.trays_remaining = (sub.trays_remaining or 0) + monthly_trays
+            sub.delivery_status = "Pending"
+        return first_success
+
     def __repr__(self):
         return f'<Payment {self.id} - {self.status}>'
 
 
 class Delivery(db.Model):
     __tablename__ = 'deliveries'
+    __table_args__ = (
+        db.Index('ix_deliveries_subscription_scheduled', 'subscription_id', 'scheduled_date'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     subscription_id = db.Column(db.Integer, db.ForeignKey('subscriptions.id'), nullable=False, index=True)
@@ -250,12 +291,157 @@ class Feedback(db.Model):
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
-    rating = db.Column(db.Integer, nullable=False)
+    # Old value loaded on change so services.feedback can move the count between stars.
+    rating = column_property(db.Column(db.Integer, nullable=False), active_history=True)
     comment = db.Column(db.Text, nullable=False)
     created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
 
     def __repr__(self):
         return f"<Feedback {self.id} - {self.rating} stars>"
+
+
+class FeedbackRatingCount(db.Model):
+    """Number of feedback entries per star rating, kept current by a session hook (see services.feedback)."""
+    __tablename__ = "feedback_rating_counts"
+
+    rating = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<FeedbackRatingCount {self.rating}: {self.count}>"
+
+
+class ReconciliationItem(db.Model):
+    __tablename__ = 'reconciliation_items'
+
+    STATUS_REVIEW = 'Review'
+    STATUS_RESOLVED = 'Resolved'
+    STATUS_DISMISSED = 'Dismissed'
+
+    id = db.Column(db.Integer, primary_key=True)
+    import_batch = db.Column(db.String(40), nullable=False, index=True)
+    receipt_no = db.Column(db.String(50), nullable=True, index=True)
+    transaction_time = db.Column(db.String(40), nullable=True)
+    amount = db.Column(db.Float, nullable=True)
+    phone = db.Column(db.String(20), nullable=True)
+    account_ref = db.Column(db.String(100), nullable=True)
+    details = db.Column(db.Text, nullable=True)
+    suggested_payment_id = db.Column(db.Integer, db.ForeignKey('payments.id', ondelete='SET NULL'), nullable=True)
+    match_reason = db.Column(db.String(40), nullable=True)
+    status = db.Column(db.String(20), nullable=False, default=STATUS_REVIEW, index=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    suggested_payment = db.relationship('Payment')
+
+    def __repr__(self):
+        return f'<ReconciliationItem {self.id} - {self.status}>'
+
+
+class SearchToken(db.Model):
+    __tablename__ = 'search_tokens'
+    __table_args__ = (
+        db.Index('ix_search_tokens_token_entity', 'token', 'entity_type', 'entity_id', 'weight'),
+        db.Index('ix_search_tokens_entity', 'entity_type', 'entity_id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    entity_type = db.Column(db.String(20), nullable=False)
+    entity_id = db.Column(db.Integer, nullable=False)
+    token = db.Column(db.String(24), nullable=False)
+    weight = db.Column(db.Integer, nullable=False, default=1)
+
+    def __repr__(self):
+        return f'<SearchToken {self.entity_type}:{self.entity_id} {self.token}>'
+
+
+class PaymentToken(db.Model):
+    """Canonical (stripped, upper-cased) customer-facing token -> payment lookup.
+
+    One row per distinct tracking code, reference and checkout id, so public
+    endpoints resolve any of them with a single primary-key probe.
+    """
+    __tablename__ = 'payment_tokens'
+
+    token = db.Column(db.String(100), primary_key=True)
+    payment_id = db.Column(db.Integer, db.ForeignKey('payments.id', ondelete='CASCADE'), nullable=False, index=True)
+    subscription_id = db.Column(db.Integer, nullable=True)
+
+    def __repr__(self):
+        return f'<PaymentToken {self.token} -> {self.payment_id}>'
+
+
+class SignupRequest(db.Model):
+    """Idempotency key of a public signup submission -> the payment it created."""
+    __tablename__ = 'signup_requests'
+
+    key = db.Column(db.String(64), primary_key=True)
+    payment_id = db.Column(db.Integer, db.ForeignKey('payments.id', ondelete='CASCADE'), nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+    def __repr__(self):
+        return f'<SignupRequest {self.key} -> {self.payment_id}>'
+
+
+class SmsCampaign(db.Model):
+    """A bulk send (e.g. tomorrow's delivery reminders); its messages are sms_outbox rows."""
+    __tablename__ = 'sms_campaigns'
+
+    id = db.Column(db.Integer, primary_key=True)
+    key = db.Column(db.String(80), nullable=False, unique=True)
+    kind = db.Column(db.String(40), nullable=False)
+    template = db.Column(db.Text, nullable=False)
+    status = db.Column(db.String(20), nullable=False, default=SmsCampaignStatus.QUEUING.value)
+    cursor = db.Column(db.String(64), nullable=True)
+    recipients = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    queued_at = db.Column(db.DateTime, nullable=True)
+
+    def __repr__(self):
+        return f'<SmsCampaign {self.key} {self.status}>'
+
+
+class SmsOutbox(db.Model):
+    """One queued SMS per recipient; written in the sender's transaction, delivered by services.sms_outbox."""
+    __tablename__ = 'sms_outbox'
+    __table_args__ = (
+        db.Index('ix_sms_outbox_status_next_attempt', 'status', 'next_attempt_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    campaign_id = db.Column(
+        db.Integer, db.ForeignKey('sms_campaigns.id', ondelete='SET NULL'), nullable=True, index=True
+    )
+    kind = db.Column(db.String(40), nullable=False)
+    recipient = db.Column(db.String(20), nullable=False)
+    message = db.Column(db.Text, nullable=False)
+    status = db.Column(db.String(20), nullable=False, default=SmsStatus.PENDING.value)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    claim_token = db.Column(db.String(32), nullable=True, index=True)
+    provider_message_id = db.Column(db.String(100), nullable=True)
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime, nullable=True)
+
+    def __repr__(self):
+        return f'<SmsOutbox {self.id} {self.kind} -> {self.recipient} {self.status}>'
+
+
+class AdminEvent(db.Model):
+    """An admin notification waiting for the next digest SMS (services.admin_digest)."""
+    __tablename__ = 'admin_events'
+
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(40), nullable=False)
+    plan_name = db.Column(db.String(100), nullable=True)
+    amount = db.Column(db.Float, nullable=True)
+    reference = db.Column(db.String(100), nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+    def __repr__(self):
+        return f'<AdminEvent {self.id} {self.kind} {self.reference}>'
+
+
 class AuditLog(db.Model):
     __tablename__ = 'audit_logs'
 
@@ -300,6 +486,20 @@ def _capture_actor():
     return actor_type, actor_id, request_id
 
 
+def record_batch_audit(session, table_name, action, row_ids, changes=None):
+    """Write one compact audit row for a set-based statement that bypasses flush hooks."""
+    actor_type, actor_id, request_id = _capture_actor()
+    session.add(AuditLog(
+        table_name=table_name,
+        row_pk=None,
+        action=action,
+        actor_type=actor_type,
+        actor_id=actor_id,
+        request_id=request_id,
+        after_json=json.dumps({'ids': list(row_ids), 'changes': changes or {}}, default=str),
+    ))
+
+
 @event.listens_for(Session, 'before_flush')
 def _stash_audit_entries(session, flush_context, instances):
     if session.info.get('audit_disabled'):
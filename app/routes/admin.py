@@ -1,12 +1,25 @@
 # app/routes/admin.py
+import io
+import os
 from datetime import datetime, timedelta
 
-from flask import Blueprint, Response, flash, redirect, render_template, request, url_for
+from flask import (
+    Blueprint,
+    Response,
+    flash,
+    jsonify,
+    redirect,
+    render_template,
+    request,
+    stream_with_context,
+    url_for,
+)
 from flask_login import current_user, login_required
 from flask_wtf import FlaskForm
 from markupsafe import escape
-from sqlalchemy import and_, case, func, or_
+from sqlalchemy import and_, case, func
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload
 from wtforms import (
     BooleanField,
     FloatField,
@@ -16,7 +29,7 @@ from wtforms import (
     SubmitField,
     TextAreaField,
 )
-from wtforms.validators import DataRequired, Length, NumberRange
+from wtforms.validators import DataRequired, Length, NumberRange, Optional
 
 from app.models import (
     Delivery,
@@ -25,12 +38,26 @@ from app.models import (
     Payment,
     PaymentConfig,
     PaymentStatus,
+    ReconciliationItem,
+    SmsOutbox,
     Subscription,
     SubscriptionPlan,
     SubscriptionStatus,
     db,
 )
-from app.routes.forms import ConfirmManualPaymentForm, DeliveryUpdateForm, PaymentConfigForm
+from app.routes.forms import (
+    ConfirmManualPaymentForm,
+    DeliveryUpdateForm,
+    PaymentConfigForm,
+    StatementUploadForm,
+)
+from app.services import bulk_actions, circuit_breaker, payment_tokens, receipt_cache, single_flight
+from app.services.sms_transport import get_transport
+from app.services.pdf import render_lines
+from app.services.receipt_export import admin_receipt_lines, iter_receipt_archive
+from app.services.reconciliation import reconcile_statement
+from app.services.statements import iter_statement, statement_filename
+from app.services import search as search_index
 
 
 admin_bp = Blueprint('admin', __name__, url_prefix='/admin')
@@ -53,6 +80,16 @@ class ActionForm(FlaskForm):
     submit = SubmitField('Submit')
 
 
+class BulkSubscriptionActionForm(FlaskForm):
+    action = SelectField('Bulk Action', choices=[
+        ('cancel', 'Cancel selected'),
+        ('delete', 'Delete selected (where eligible)'),
+        ('extend', 'Extend period by N days'),
+    ])
+    days = IntegerField('Days', default=30, validators=[Optional(), NumberRange(min=1, max=365)])
+    submit = SubmitField('Apply')
+
+
 class SubscriptionEditForm(FlaskForm):
     name = StringField('Name', validators=[DataRequired(), Length(max=100)])
     phone = StringField('Phone', validators=[DataRequired(), Length(max=20)])
@@ -81,42 +118,6 @@ class PlanForm(FlaskForm):
     ], default='warning')
 
 
-def _escape_pdf(text):
-    return (text or "").replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
-
-
-def _simple_pdf(lines):
-    text_ops = ["BT", "/F1 12 Tf", "50 790 Td", "14 TL"]
-    for line in lines:
-        text_ops.append(f"({_escape_pdf(line)}) Tj")
-        text_ops.append("T*")
-    text_ops.append("ET")
-    stream = "\n".join(text_ops).encode("latin-1", "replace")
-
-    objs = []
-    objs.append(b"1 0 obj << /Type /Catalog /Pages 2 0 R >> endobj\n")
-    objs.append(b"2 0 obj << /Type /Pages /Kids [3 0 R] /Count 1 >> endobj\n")
-    objs.append(
-        b"3 0 obj << /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
-        b"/Resources << /Font << /F1 5 0 R >> >> /Contents 4 0 R >> endobj\n"
-    )
-    objs.append(f"4 0 obj << /Length {len(stream)} >> stream\n".encode("ascii") + stream + b"\nendstream endobj\n")
-    objs.append(b"5 0 obj << /Type /Font /Subtype /Type1 /BaseFont /Helvetica >> endobj\n")
-
-    out = b"%PDF-1.4\n"
-    offsets = [0]
-    for obj in objs:
-        offsets.append(len(out))
-        out += obj
-    xref_pos = len(out)
-    out += f"xref\n0 {len(offsets)}\n".encode("ascii")
-    out += b"0000000000 65535 f \n"
-    for off in offsets[1:]:
-        out += f"{off:010d} 00000 n \n".encode("ascii")
-    out += f"trailer << /Size {len(offsets)} /Root 1 0 R >>\nstartxref\n{xref_pos}\n%%EOF".encode("ascii")
-    return out
-
-
 def _dashboard_base_query(now):
     display_status_expr = case(
         (Subscription.current_period_end > now, 'active'),
@@ -284,6 +285,7 @@ def dashboard():
     pending = Subscription.query.filter_by(status=SubscriptionStatus.PENDING.value).count()
     delete_form = DeleteForm()
     action_form = ActionForm()
+    bulk_form = BulkSubscriptionActionForm()
     plan_options = SubscriptionPlan.query.filter_by(is_active=True).order_by(SubscriptionPlan.name.asc()).all()
     total_pages = max(1, (total_count + per_page - 1) // per_page)
 
@@ -294,6 +296,7 @@ def dashboard():
         pending=pending,
         delete_form=delete_form,
         action_form=action_form,
+        bulk_form=bulk_form,
         plans=plan_options,
         selected_filters={
             'status': status_filter,
@@ -346,6 +349,41 @@ def cancel_subscription(sub_id):
     return redirect(url_for('admin.dashboard'))
 
 
+@admin_bp.route('/subscriptions/bulk', methods=['POST'])
+def bulk_subscription_action():
+    form = BulkSubscriptionActionForm()
+    if not form.validate_on_submit():
+        flash("Bad request (CSRF validation failed or invalid days).", "danger")
+        return redirect(url_for('admin.dashboard'))
+
+    sub_ids = request.form.getlist('sub_ids', type=int)
+    if not sub_ids:
+        flash("Select at least one subscription.", "warning")
+        return redirect(url_for('admin.dashboard'))
+
+    if form.action.data == 'cancel':
+        outcomes = bulk_actions.bulk_cancel(sub_ids)
+    elif form.action.data == 'delete':
+        outcomes = bulk_actions.bulk_delete(sub_ids)
+    else:
+        outcomes = bulk_actions.bulk_extend(sub_ids, days=form.days.data or 30)
+
+    grouped = {}
+    for sub_id, outcome in sorted(outcomes.items()):
+        grouped.setdefault(outcome, []).append(f'#{sub_id}')
+    summary = '; '.join(
+        f"{outcome.replace('_', ' ')}: {', '.join(ids)}" for outcome, ids in grouped.items()
+    )
+    category = 'warning' if set(grouped) - {
+        bulk_actions.OUTCOME_DELETED, bulk_actions.OUTCOME_EXTENDED, bulk_actions.OUTCOME_CANCELLED
+    } else 'success'
+    if form.action.data == 'delete' and bulk_actions.OUTCOME_CANCELLED in grouped:
+        category = 'warning'
+        summary += '. Hard delete is only allowed after confirmed payment and completed delivery.'
+    flash(f'Bulk {form.action.data} - {summary}', category)
+    return redirect(url_for('admin.dashboard'))
+
+
 @admin_bp.route('/plans')
 def plans():
     plans_list = SubscriptionPlan.query.filter_by(is_active=True).all()
@@ -439,7 +477,11 @@ def delete_subscription(sub_id):
 
     if has_confirmed_payment and delivery_completed:
         try:
+            # Collect the payments' receipt pointers now; the bulk delete below leaves none for the flush hook.
+            receipt_cache.invalidate_subscription_ids([subscription.id])
             Delivery.query.filter_by(subscription_id=subscription.id).delete(synchronize_session=False)
+            search_index.purge_subscription_payments(db.session.connection(), [subscription.id])
+            payment_tokens.purge_subscription_payments(db.session.connection(), [subscription.id])
             Payment.query.filter_by(subscription_id=subscription.id).delete(synchronize_session=False)
             db.session.delete(subscription)
             db.session.commit()
@@ -475,8 +517,15 @@ def payments():
     query_text = (request.args.get('q') or '').strip()
 
     payments_query = Payment.query
-    if payment_status_filter in {ManualPaymentStatus.PENDING.value, ManualPaymentStatus.CONFIRMED.value}:
+    if payment_status_filter in {
+        ManualPaymentStatus.PENDING.value,
+        ManualPaymentStatus.CONFIRMED.value,
+        ManualPaymentStatus.EXPIRED.value,
+    }:
         payments_query = payments_query.filter(Payment.payment_status == payment_status_filter)
+    else:
+        # Expired requests are dead weight; only show them when asked for explicitly.
+        payments_query = payments_query.filter(Payment.payment_status != ManualPaymentStatus.EXPIRED.value)
 
     if has_subscription_filter == 'yes':
         payments_query = payments_query.filter(Payment.subscription_id.isnot(None))
@@ -484,15 +533,7 @@ def payments():
         payments_query = payments_query.filter(Payment.subscription_id.is_(None))
 
     if query_text:
-        like = f"%{query_text}%"
-        payments_query = payments_query.filter(or_(
-            Payment.customer_name.ilike(like),
-            Payment.customer_phone.ilike(like),
-            Payment.reference_id.ilike(like),
-            Payment.tracking_code.ilike(like),
-            Payment.checkout_request_id.ilike(like),
-            Payment.admin_transaction_reference.ilike(like),
-        ))
+        payments_query = payments_query.filter(search_index.payment_criterion(query_text))
 
     payments_list = payments_query.order_by(Payment.payment_date.desc(), Payment.id.desc()).all()
     confirm_form = ConfirmManualPaymentForm()
@@ -507,6 +548,7 @@ def payments():
 
     total_pending = Payment.query.filter_by(payment_status=ManualPaymentStatus.PENDING.value).count()
     total_confirmed = Payment.query.filter_by(payment_status=ManualPaymentStatus.CONFIRMED.value).count()
+    total_expired = Payment.query.filter_by(payment_status=ManualPaymentStatus.EXPIRED.value).count()
     trays_delivered = db.session.query(func.count(Delivery.id)).filter(
         Delivery.status == DeliveryStatus.DELIVERED.value
     ).scalar() or 0
@@ -522,6 +564,7 @@ def payments():
         summary={
             'pending': total_pending,
             'confirmed': total_confirmed,
+            'expired': total_expired,
             'trays_delivered': trays_delivered,
             'trays_remaining': trays_remaining_total,
         },
@@ -534,6 +577,56 @@ def payments():
     )
 
 
+@admin_bp.route('/search')
+def search():
+    query_text = (request.args.get('q') or '').strip()
+    entity_type = (request.args.get('type') or '').strip().lower()
+    if entity_type not in {search_index.ENTITY_PAYMENT, search_index.ENTITY_SUBSCRIPTION}:
+        entity_type = None
+
+    results = search_index.search(query_text, limit=50, entity_type=entity_type) if query_text else []
+    return render_template(
+        'admin/search.html',
+        results=results,
+        selected_filters={'q': query_text, 'type': entity_type or ''},
+    )
+
+
+@admin_bp.route('/search/suggest')
+def search_suggest():
+    query_text = (request.args.get('q') or '').strip()
+    suggestions = []
+    for hit in search_index.search(query_text, limit=8):
+        obj = hit['obj']
+        if hit['type'] == search_index.ENTITY_PAYMENT:
+            label = f"Payment #{obj.id} - {obj.customer_name or '-'} ({obj.reference_id or obj.tracking_code or '-'})"
+            url = url_for('admin.payments', q=obj.reference_id or obj.tracking_code or '')
+        else:
+            label = f"Subscription #{obj.id} - {obj.name} ({obj.location})"
+            url = url_for('admin.edit_subscription', sub_id=obj.id)
+        suggestions.append({'type': hit['type'], 'id': hit['id'], 'label': label, 'url': url})
+    return jsonify({'q': query_text, 'results': suggestions})
+
+
+@admin_bp.route('/metrics/single-flight')
+def single_flight_metrics():
+    """Coalescing counters for the worker that serves this request."""
+    return jsonify({'pid': os.getpid(), 'groups': single_flight.stats()})
+
+
+@admin_bp.route('/metrics/sms')
+def sms_metrics():
+    """Provider latency and breaker state for this worker, plus the outbox backlog by status."""
+    transport = get_transport()
+    outbox = dict(db.session.query(SmsOutbox.status, func.count()).group_by(SmsOutbox.status).all())
+    return jsonify({
+        'pid': os.getpid(),
+        'transport': transport.stats(),
+        'breakers': circuit_breaker.stats(),
+        'outbox': outbox,
+    })
+
+
 @admin_bp.route('/confirm/<int:payment_id>', methods=['POST'])
 def confirm_payment(payment_id):
     form = ConfirmManualPaymentForm()
@@ -542,26 +635,12 @@ def confirm_payment(payment_id):
         return redirect(url_for('admin.payments'))
 
     payment = Payment.query.get_or_404(payment_id)
-    now = datetime.utcnow()
-    first_success = payment.status != PaymentStatus.COMPLETED.value
-
-    payment.status = PaymentStatus.COMPLETED.value
-    payment.payment_status = ManualPaymentStatus.CONFIRMED.value
-    payment.manual_payment_status = ManualPaymentStatus.CONFIRMED.value
-    payment.payment_method = 'Manual'
-    payment.payment_date = now
-    payment.instruction_channel = form.channel.data or None
-    payment.admin_transaction_reference = (form.transaction_reference.data or '').strip() or None
-    payment.admin_notes = (form.admin_notes.data or '').strip() or None
-
-    sub = payment.subscription
-    if sub and first_success:
-        sub.apply_successful_payment(now=now)
-        monthly_trays = sub.plan.trays_per_week * 4
-        sub.trays_allocated_total = (sub.trays_allocated_total or 0) + monthly_trays
-        sub.trays_remaining = (sub.trays_remaining or 0) + monthly_trays
-        sub.delivery_status = "Pending"
-
+    payment.confirm(
+        now=datetime.utcnow(),
+        channel=form.channel.data or None,
+        transaction_reference=(form.transaction_reference.data or '').strip() or None,
+        notes=(form.admin_notes.data or '').strip() or None,
+    )
     db.session.commit()
     flash(f'Payment #{payment.id} confirmed successfully.', 'success')
     return redirect(url_for('admin.payments'))
@@ -625,31 +704,141 @@ def save_payment_config():
     return redirect(url_for('admin.payments'))
 
 
+@admin_bp.route('/reconciliation', methods=['GET', 'POST'])
+def reconciliation():
+    form = StatementUploadForm()
+    if form.validate_on_submit():
+        stream = io.TextIOWrapper(form.statement.data.stream, encoding='utf-8-sig', newline='')
+        try:
+            stats = reconcile_statement(stream, dry_run=form.dry_run.data)
+        except (ValueError, UnicodeDecodeError) as exc:
+            db.session.rollback()
+            flash(f'Could not read statement: {exc}', 'danger')
+            return redirect(url_for('admin.reconciliation'))
+        prefix = 'Dry run: ' if form.dry_run.data else ''
+        flash(
+            f"{prefix}{stats['lines']} credit lines read, {stats['confirmed']} payments confirmed, "
+            f"{stats['review']} sent to review, {stats['duplicates']} duplicates skipped.",
+            'success',
+        )
+        return redirect(url_for('admin.reconciliation'))
+
+    review_items = ReconciliationItem.query.options(
+        joinedload(ReconciliationItem.suggested_payment)
+    ).filter_by(
+        status=ReconciliationItem.STATUS_REVIEW
+    ).order_by(ReconciliationItem.id.desc()).limit(200).all()
+    review_total = ReconciliationItem.query.filter_by(status=ReconciliationItem.STATUS_REVIEW).count()
+
+    return render_template(
+        'admin/reconciliation.html',
+        form=form,
+        action_form=ActionForm(),
+        review_items=review_items,
+        review_total=review_total,
+    )
+
+
+@admin_bp.route('/reconciliation/<int:item_id>/confirm', methods=['POST'])
+def confirm_reconciliation_item(item_id):
+    form = ActionForm()
+    if not form.validate_on_submit():
+        flash("Bad request (CSRF validation failed).", "danger")
+        return redirect(url_for('admin.reconciliation'))
+
+    item = ReconciliationItem.query.get_or_404(item_id)
+    payment_id = request.form.get('payment_id', type=int) or item.suggested_payment_id
+    payment = Payment.query.get(payment_id) if payment_id else None
+    if not payment or payment.payment_status == ManualPaymentStatus.CONFIRMED.value:
+        flash('Pick a pending payment to match this statement line to.', 'warning')
+        return redirect(url_for('admin.reconciliation'))
+
+    payment.confirm(
+        now=datetime.utcnow(),
+        method='M-Pesa',
+        transaction_reference=item.receipt_no,
+        notes=f'Reconciled from statement review (line #{item.id}).',
+    )
+    payment.mpesa_receipt = item.receipt_no
+    item.suggested_payment_id = payment.id
+    item.status = ReconciliationItem.STATUS_RESOLVED
+    db.session.commit()
+    flash(f'Payment #{payment.id} confirmed from statement line {item.receipt_no or item.id}.', 'success')
+    return redirect(url_for('admin.reconciliation'))
+
+
+@admin_bp.route('/reconciliation/<int:item_id>/dismiss', methods=['POST'])
+def dismiss_reconciliation_item(item_id):
+    form = ActionForm()
+    if not form.validate_on_submit():
+        flash("Bad request (CSRF validation failed).", "danger")
+        return redirect(url_for('admin.reconciliation'))
+
+    item = ReconciliationItem.query.get_or_404(item_id)
+    item.status = ReconciliationItem.STATUS_DISMISSED
+    db.session.commit()
+    flash(f'Statement line {item.receipt_no or item.id} dismissed.', 'info')
+    return redirect(url_for('admin.reconciliation'))
+
+
 @admin_bp.route('/payments/<int:payment_id>/receipt')
 def download_payment_receipt(payment_id):
+    cache = receipt_cache.get_cache()
+    cached = cache.lookup(receipt_cache.KIND_ADMIN, payment_id)
+    if cached:
+        return receipt_cache.send_cached(cached)
+
     payment = Payment.query.get_or_404(payment_id)
     if payment.payment_status != ManualPaymentStatus.CONFIRMED.value:
         flash("Receipt is available only for confirmed payments.", "warning")
         return redirect(url_for('admin.payments'))
 
     sub = payment.subscription
-    ref = payment.admin_transaction_reference or payment.reference_id or payment.checkout_request_id or "-"
-    paid_at = payment.payment_date.strftime("%Y-%m-%d %H:%M:%S") if payment.payment_date else "-"
-    lines = [
-        "NESTGOLD PROVISIONS - RECEIPT",
-        "----------------------------------------",
-        f"Payment ID: {payment.id}",
-        f"Reference: {ref}",
-        f"Customer: {payment.customer_name or (sub.name if sub else '-')}",
-        f"Phone: {payment.customer_phone or (sub.phone if sub else '-')}",
-        f"Amount (KES): {payment.amount:.2f}",
-        f"Payment Status: {payment.payment_status}",
-        f"Confirmed At: {paid_at}",
-        f"Plan: {(sub.plan.name if sub and sub.plan else '-')}",
-        f"Trays Remaining: {(sub.trays_remaining if sub else 0)}",
-    ]
-    response = Response(_simple_pdf(lines), mimetype="application/pdf")
-    response.headers["Content-Disposition"] = f'attachment; filename="admin_receipt_{payment.id}.pdf"'
+    lines = admin_receipt_lines(
+        payment,
+        payment.customer_name or (sub.name if sub else None),
+        payment.customer_phone or (sub.phone if sub else None),
+        sub.plan.name if sub and sub.plan else None,
+        sub.trays_remaining if sub else 0,
+    )
+    entry = cache.store(
+        receipt_cache.KIND_ADMIN, [payment.id], f"admin_receipt_{payment.id}.pdf", "application/pdf",
+        lines, lambda: render_lines(lines),
+    )
+    return receipt_cache.send_cached(entry)
+
+
+@admin_bp.route('/receipts/export')
+def export_receipts():
+    """Stream a ZIP of receipts for payments confirmed between ``from`` and ``to`` (inclusive)."""
+    today = datetime.utcnow().date()
+    try:
+        start = datetime.strptime(request.args.get('from') or today.replace(day=1).isoformat(), '%Y-%m-%d')
+        end = datetime.strptime(request.args.get('to') or today.isoformat(), '%Y-%m-%d') + timedelta(days=1)
+    except ValueError:
+        flash('Export dates must be in YYYY-MM-DD format.', 'warning')
+        return redirect(url_for('admin.payments'))
+    if end <= start:
+        flash('Export "to" date must not be before the "from" date.', 'warning')
+        return redirect(url_for('admin.payments'))
+
+    filename = f"receipts_{start:%Y%m%d}_{(end - timedelta(days=1)):%Y%m%d}.zip"
+    # Rendered in this process: no pool inside a web worker (use `flask export-receipts` for big ranges).
+    archive = iter_receipt_archive(start, end, workers=1)
+    response = Response(stream_with_context(archive), mimetype='application/zip')
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+@admin_bp.route('/subscriptions/<int:sub_id>/statement')
+def download_statement(sub_id):
+    chunks = iter_statement(sub_id)
+    if chunks is None:
+        flash('Subscription not found.', 'warning')
+        return redirect(url_for('admin.dashboard'))
+
+    response = Response(stream_with_context(chunks), mimetype='application/pdf')
+    response.headers['Content-Disposition'] = f'attachment; filename="{statement_filename(sub_id, datetime.utcnow())}"'
     return response
 
 
@@ -1,7 +1,8 @@
 ﻿# app/routes/forms.py
 from wtforms import PasswordField, BooleanField, DecimalField, TextAreaField, DateField, RadioField
 from flask_wtf import FlaskForm
-from wtforms import StringField, SelectField, SubmitField
+from flask_wtf.file import FileAllowed, FileField, FileRequired
+from wtforms import HiddenField, StringField, SelectField, SubmitField
 from wtforms.validators import DataRequired, Length, Regexp, NumberRange
 
 class LoginForm(FlaskForm):
@@ -21,6 +22,8 @@ class SubscriptionForm(FlaskForm):
         ("Thursday", "Thursday"),
         ("Friday", "Friday")
     ], validators=[DataRequired()])
+    # Issued with the form so a resubmit (double tap, flaky network) replays the first result.
+    idempotency_key = HiddenField(validators=[Length(max=64)])
     submit = SubmitField("Proceed to Payment")
 
 
@@ -76,6 +79,15 @@ class PaymentConfigForm(FlaskForm):
     instructions_footer = TextAreaField("Instruction Footer", validators=[Length(max=500)])
     submit = SubmitField("Save Payment Details")
 
+class StatementUploadForm(FlaskForm):
+    statement = FileField(
+        "Statement CSV",
+        validators=[FileRequired(), FileAllowed(["csv"], "Upload the statement as a .csv file.")],
+    )
+    dry_run = BooleanField("Dry run (match only, do not confirm)")
+    submit = SubmitField("Import & Reconcile")
+
+
 class FeedbackForm(FlaskForm):
     name = StringField("Your Name", validators=[DataRequired(), Length(max=100)])
     rating = RadioField(
@@ -1,25 +1,31 @@
 ﻿# app/routes/main.py
-from flask import Blueprint, flash, redirect, render_template, url_for
+from flask import Blueprint, flash, redirect, render_template, request, url_for
 
 from app import db
-from app.models import Feedback, SubscriptionPlan
+from app.models import Feedback
 from app.routes.forms import FeedbackForm
+from app.services import catalog
+from app.services import feedback as feedback_service
+from app.services.http_cache import cache_public
 
 main_bp = Blueprint('main', __name__)
 
 
 @main_bp.route('/')
+@cache_public(version=catalog.version)
 def index():
-    plans = SubscriptionPlan.query.all()
+    plans = catalog.plans()
     return render_template('public/index.html', plans=plans)
 
 
 @main_bp.route('/about')
+@cache_public()
 def about():
     return render_template('public/about.html')
 
 
 @main_bp.route('/contact')
+@cache_public()
 def contact():
     return render_template('public/contact.html')
 
@@ -39,5 +45,16 @@ def feedback():
         flash('Thanks for your feedback.', 'success')
         return redirect(url_for('main.feedback'))
 
-    feedback_items = Feedback.query.order_by(Feedback.created_at.desc()).limit(12).all()
-    return render_template('public/feedback.html', form=form, feedback_items=feedback_items)
+    before = request.args.get('before', type=int)
+    if before:
+        feedback_items, has_older = feedback_service.older_feedback(before)
+    else:
+        feedback_items, has_older = feedback_service.recent_feedback()
+    return render_template(
+        'public/feedback.html',
+        form=form,
+        feedback_items=feedback_items,
+        older_cursor=(feedback_items[-1].id if has_older and feedback_items else None),
+        paging=bool(before),
+        rating_summary=feedback_service.rating_summary(),
+    )
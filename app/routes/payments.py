@@ -1,60 +1,31 @@
 # app/routes/payments.py
 from datetime import datetime
 
-from flask import Blueprint, Response, flash, jsonify, redirect, render_template, request, url_for
+from flask import (
+    Blueprint,
+    Response,
+    flash,
+    jsonify,
+    redirect,
+    render_template,
+    request,
+    stream_with_context,
+    url_for,
+)
+
+from sqlalchemy import case, func
 
 from app import csrf
-from app.models import Delivery, DeliveryStatus, ManualPaymentStatus, Payment, PaymentConfig
+from app.models import Delivery, DeliveryStatus, ManualPaymentStatus, db
 from app.routes.forms import TrackingLookupForm
+from app.services import catalog, page_cache, payment_tokens, receipt_cache, single_flight
+from app.services.http_cache import page_cacheable
+from app.services.pdf import render_lines
+from app.services.statements import iter_statement, statement_filename
 
 payments_bp = Blueprint("payments", __name__)
 
-
-def _resolve_payment_by_token(token):
-    raw = (token or "").strip()
-    if not raw:
-        return None
-    return Payment.query.filter(
-        (Payment.tracking_code == raw)
-        | (Payment.reference_id == raw.upper())
-        | (Payment.checkout_request_id == raw)
-    ).first()
-
-
-def _escape_pdf(text):
-    return (text or "").replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
-
-
-def _simple_pdf(lines):
-    text_ops = ["BT", "/F1 12 Tf", "50 790 Td", "14 TL"]
-    for line in lines:
-        text_ops.append(f"({_escape_pdf(line)}) Tj")
-        text_ops.append("T*")
-    text_ops.append("ET")
-    stream = "\n".join(text_ops).encode("latin-1", "replace")
-
-    objs = []
-    objs.append(b"1 0 obj << /Type /Catalog /Pages 2 0 R >> endobj\n")
-    objs.append(b"2 0 obj << /Type /Pages /Kids [3 0 R] /Count 1 >> endobj\n")
-    objs.append(
-        b"3 0 obj << /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
-        b"/Resources << /Font << /F1 5 0 R >> >> /Contents 4 0 R >> endobj\n"
-    )
-    objs.append(f"4 0 obj << /Length {len(stream)} >> stream\n".encode("ascii") + stream + b"\nendstream endobj\n")
-    objs.append(b"5 0 obj << /Type /Font /Subtype /Type1 /BaseFont /Helvetica >> endobj\n")
-
-    out = b"%PDF-1.4\n"
-    offsets = [0]
-    for obj in objs:
-        offsets.append(len(out))
-        out += obj
-    xref_pos = len(out)
-    out += f"xref\n0 {len(offsets)}\n".encode("ascii")
-    out += b"0000000000 65535 f \n"
-    for off in offsets[1:]:
-        out += f"{off:010d} 00000 n \n".encode("ascii")
-    out += f"trailer << /Size {len(offsets)} /Root 1 0 R >>\nstartxref\n{xref_pos}\n%%EOF".encode("ascii")
-    return out
+_track_renders = single_flight.group("track_page")
 
 
 @payments_bp.route("/track", methods=["GET", "POST"])
@@ -62,52 +33,128 @@ def track_lookup():
     form = TrackingLookupForm()
     if form.validate_on_submit():
         token = form.tracking_id.data.strip()
-        payment = _resolve_payment_by_token(token)
+        payment = payment_tokens.resolve_payment(token)
         if payment:
             return redirect(url_for("payments.track_payment", tracking_code=token))
         flash("No payment found for that tracking ID/reference.", "warning")
     return render_template("public/track_lookup.html", form=form)
 
 
+TRACK_DELIVERIES_PAGE_SIZE = 10
+
+
+def _parse_delivery_cursor(raw):
+    """``<scheduled_date as %Y%m%d%H%M%S%f>-<id>`` of the last delivery shown, or None."""
+    stamp, _, delivery_id = (raw or "").partition("-")
+    try:
+        return datetime.strptime(stamp, "%Y%m%d%H%M%S%f"), int(delivery_id)
+    except ValueError:
+        return None
+
+
+def _delivery_cursor(scheduled_date, delivery_id):
+    return f"{scheduled_date:%Y%m%d%H%M%S%f}-{delivery_id}"
+
+
+def _delivery_summary(subscription_id):
+    """``(total, delivered)`` for a subscription in one aggregate query."""
+    total, delivered = db.session.query(
+        func.count(Delivery.id),
+        func.coalesce(func.sum(case((Delivery.status == DeliveryStatus.DELIVERED.value, 1), else_=0)), 0),
+    ).filter(Delivery.subscription_id == subscription_id).one()
+    return total, delivered
+
+
+def _delivery_page(subscription_id, before=None, limit=TRACK_DELIVERIES_PAGE_SIZE):
+    """Newest-first deliveries after the ``before`` cursor, plus the cursor of the next page (or None)."""
+    query = Delivery.query.filter(Delivery.subscription_id == subscription_id)
+    if before:
+        before_date, before_id = before
+        query = query.filter(
+            (Delivery.scheduled_date < before_date)
+            | ((Delivery.scheduled_date == before_date) & (Delivery.id < before_id))
+        )
+    rows = query.order_by(Delivery.scheduled_date.desc(), Delivery.id.desc()).limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        next_cursor = _delivery_cursor(rows[limit - 1].scheduled_date, rows[limit - 1].id)
+    return rows[:limit], next_cursor
+
+
 @payments_bp.route("/track/<tracking_code>")
 def track_payment(tracking_code):
-    payment = _resolve_payment_by_token(tracking_code)
-    if not payment:
+    before = _parse_delivery_cursor(request.args.get("before"))
+    cache_key = f"track:{payment_tokens.canonical_token(tracking_code)}"
+    if before:
+        cache_key += f":{_delivery_cursor(*before)}"
+    if page_cacheable():
+        store = page_cache.get_store()
+        cached = store.get(cache_key)
+        if cached is not None:
+            return Response(cached, mimetype="text/html")
+        # Anonymous visitors all see the same page, so a burst of them shares one render.
+        html = _track_renders.do(cache_key, lambda: _render_track_page(tracking_code, before, store, cache_key))
+    else:
+        html = _render_track_page(tracking_code, before)
+
+    if html is None:
         flash("Payment tracking record not found.", "warning")
         return redirect(url_for("payments.track_lookup"))
+    return html
+
+
+def _render_track_page(tracking_code, before=None, store=None, cache_key=None):
+    payment = payment_tokens.resolve_payment(tracking_code)
+    if not payment:
+        return None
 
     subscription = payment.subscription
     deliveries = []
+    deliveries_total = 0
     delivered_count = 0
+    next_cursor = None
     if subscription:
-        deliveries = (
-            Delivery.query.filter_by(subscription_id=subscription.id)
-            .order_by(Delivery.scheduled_date.desc())
-            .all()
-        )
-        delivered_count = sum(1 for d in deliveries if d.status == DeliveryStatus.DELIVERED.value)
+        deliveries_total, delivered_count = _delivery_summary(subscription.id)
+        if deliveries_total:
+            deliveries, next_cursor = _delivery_page(subscription.id, before)
 
-    return render_template(
+    html = render_template(
         "public/track_payment.html",
         payment=payment,
         subscription=subscription,
         deliveries=deliveries,
+        deliveries_total=deliveries_total,
         delivered_count=delivered_count,
+        older_deliveries_cursor=next_cursor,
+        paging_deliveries=bool(before),
         trays_total=(subscription.trays_allocated_total if subscription else 0),
         can_download_receipt=(payment.payment_status == ManualPaymentStatus.CONFIRMED.value),
     )
+    if store is not None:
+        store.set(cache_key, payment.id, payment.subscription_id, html.encode("utf-8"))
+    return html
+
+
+def _plan_name(sub):
+    plan = catalog.get_plan(sub.plan_id) if sub else None
+    return plan.name if plan else "-"
 
 
 @payments_bp.route("/track/<tracking_code>/receipt")
 def track_receipt_download(tracking_code):
-    payment = _resolve_payment_by_token(tracking_code)
+    cache = receipt_cache.get_cache()
+    cached = cache.lookup(receipt_cache.KIND_TRACK, tracking_code)
+    if cached:
+        return receipt_cache.send_cached(cached)
+
+    payment = payment_tokens.resolve_payment(tracking_code)
     if not payment:
         return Response("Receipt record not found.", status=404, mimetype="text/plain")
 
     sub = payment.subscription
     ref = payment.admin_transaction_reference or payment.reference_id or payment.checkout_request_id or "-"
     paid_at = payment.payment_date.strftime("%Y-%m-%d %H:%M:%S") if payment.payment_date else "-"
-    payment_config = PaymentConfig.query.order_by(PaymentConfig.id.desc()).first()
+    payment_config = catalog.payment_config()
     paybill = payment_config.mpesa_paybill if payment_config else "174379"
     mpesa_acc_name = payment_config.mpesa_account_name if payment_config else "NestGold Provisions"
     mpesa_acc_no = payment_config.mpesa_account_number if payment_config else ref
@@ -117,7 +164,6 @@ def track_receipt_download(tracking_code):
         lines = [
             "NESTGOLD PROVISIONS - RECEIPT",
             "----------------------------------------",
-            f"Receipt Date: {datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')}",
             f"Payment ID: {payment.id}",
             f"Reference: {ref}",
             f"Tracking ID: {tracking_token}",
@@ -126,15 +172,15 @@ def track_receipt_download(tracking_code):
             f"Amount (KES): {payment.amount:.2f}",
             f"Payment Status: {payment.payment_status}",
             f"Confirmed At: {paid_at}",
-            f"Plan: {(sub.plan.name if sub and sub.plan else '-')}",
+            f"Plan: {_plan_name(sub)}",
             f"Trays Remaining: {(sub.trays_remaining if sub else 0)}",
         ]
+        stamp_label = "Receipt Date"
         filename = f"receipt_{payment.id}.pdf"
     else:
         lines = [
             "NESTGOLD PROVISIONS - PAYMENT SLIP",
             "----------------------------------------",
-            f"Generated: {datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')}",
             f"Payment ID: {payment.id}",
             f"Reference: {ref}",
             f"Tracking ID: {tracking_token}",
@@ -151,10 +197,28 @@ def track_receipt_download(tracking_code):
             "",
             "Keep this slip to recover your tracking details any time.",
         ]
+        stamp_label = "Generated"
         filename = f"payment_slip_{payment.id}.pdf"
 
-    body = _simple_pdf(lines)
-    response = Response(body, mimetype="application/pdf")
+    # The timestamp is left out of the cache key so an unchanged receipt keeps its ETag.
+    def render():
+        stamp = f"{stamp_label}: {datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')}"
+        return render_lines(lines[:2] + [stamp] + lines[2:])
+
+    tokens = [tracking_code, payment.tracking_code, payment.reference_id, payment.checkout_request_id]
+    entry = cache.store(receipt_cache.KIND_TRACK, tokens, filename, "application/pdf", lines, render)
+    return receipt_cache.send_cached(entry)
+
+
+@payments_bp.route("/track/<tracking_code>/statement")
+def track_statement_download(tracking_code):
+    payment = payment_tokens.resolve_payment(tracking_code)
+    chunks = iter_statement(payment.subscription_id) if payment and payment.subscription_id else None
+    if chunks is None:
+        return Response("Statement record not found.", status=404, mimetype="text/plain")
+
+    response = Response(stream_with_context(chunks), mimetype="application/pdf")
+    filename = statement_filename(payment.subscription_id, datetime.utcnow())
     response.headers["Content-Disposition"] = f'attachment; filename="{filename}"'
     return response
 
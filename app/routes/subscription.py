@@ -1,14 +1,29 @@
+import json
+import time
 from datetime import datetime, timedelta
-import secrets
 
-from flask import Blueprint, Response, flash, jsonify, redirect, render_template, request, url_for
+from flask import (
+    Blueprint,
+    abort,
+    Response,
+    current_app,
+    flash,
+    jsonify,
+    redirect,
+    render_template,
+    request,
+    stream_with_context,
+    url_for,
+)
+from sqlalchemy.exc import IntegrityError
 
-from app.services.mpesa import get_manual_payment_instructions
+from app import csrf
+from app.services import catalog, idempotency, payment_tokens, receipt_cache, single_flight, status_hub
 from app.services.sms import send_admin_payment_request_sms
+from app.services.tracking import new_tracking_code
 from app.models import (
     ManualPaymentStatus,
     Payment,
-    PaymentConfig,
     PaymentStatus,
     Subscription,
     SubscriptionPlan,
@@ -41,13 +56,136 @@ def _next_delivery_datetime(preferred_day, now=None):
     return now + timedelta(days=days_ahead)
 
 
-def _new_tracking_code():
-    return secrets.token_urlsafe(8).replace("-", "").replace("_", "").upper()
+SIGNUP_ATTEMPTS = 3
+
+
+def _record_signup(plan, name, phone, location, delivery_day, form_token=None):
+    """Write the subscription and its pending payment in one transaction.
+
+    Returns ``(subscription, payment, created)``; ``created`` is False when the
+    submission's idempotency key was already used and the earlier payment is
+    returned untouched.
+
+    The only flushes are the one that assigns a new subscription's id for the
+    payment reference and the one that writes the payment ahead of its key.
+    Tracking codes are random and checked by the unique constraint rather than
+    probed first; the rare collision (or a concurrent signup for the same plan
+    and phone, or a racing resubmit) rolls back and is retried.  The commit
+    leaves both objects loaded, so the response needs no reloads.
+
+    ``plan`` may come from a worker's catalog snapshot, which can be a minute
+    out of date; the price and name invoiced are read from the plan row in
+    this transaction.
+
+    The admin's SMS is queued in the same transaction and sent by the outbox
+    worker, so it goes out exactly when the signup commits and the response
+    never waits on the provider.
+    """
+    phone_normalized = Subscription.normalize_phone(phone)
+    key = idempotency.signup_key(plan.id, phone_normalized, form_token)
+    session = db.session()
+
+    for attempt in range(SIGNUP_ATTEMPTS):
+        now = datetime.utcnow()
+        try:
+            payment_id = idempotency.find_signup(key, now=now)
+            if payment_id is not None:
+                payment = db.session.get(Payment, payment_id)
+                return payment.subscription, payment, False
+
+            # Primary-key read of the current price; the snapshot is for display only.
+            current_plan = db.session.get(SubscriptionPlan, plan.id, populate_existing=True)
+            if current_plan is None:
+                abort(404)
+
+            # Reuse same row forever for a (plan, phone) pair to avoid duplicates.
+            sub = Subscription.query.filter_by(
+                plan_id=plan.id,
+                phone_normalized=phone_normalized
+            ).first()
+
+            if sub:
+                sub.phone = phone
+                sub.phone_normalized = phone_normalized
+                sub.name = name
+                sub.location = location
+                sub.preferred_delivery_day = delivery_day
+                sub.next_delivery_date = _next_delivery_datetime(delivery_day, now=now)
+                sub.mark_pending()
+                sub.delivery_status = "Pending"
+            else:
+                sub = Subscription(
+                    plan_id=plan.id,
+                    phone=phone,
+                    phone_normalized=phone_normalized,
+                    name=name,
+                    location=location,
+                    preferred_delivery_day=delivery_day,
+                    status=SubscriptionStatus.PENDING.value,
+                    start_date=now,
+                    current_period_end=now,
+                    next_delivery_date=_next_delivery_datetime(delivery_day, now=now),
+                    delivery_status="Pending",
+                )
+                db.session.add(sub)
+                db.session.flush()
+
+            reference_id = f"NESTGOLD-{sub.id}-{int(now.timestamp())}"
+            payment = Payment(
+                subscription_id=sub.id,
+                amount=current_plan.price_per_month,
+                checkout_request_id=reference_id,
+                reference_id=reference_id,
+                customer_name=name,
+                customer_phone=phone_normalized,
+                description=f"{current_plan.name} subscription - {name}",
+                status=PaymentStatus.PENDING.value,
+                payment_status=ManualPaymentStatus.PENDING.value,
+                manual_payment_status=ManualPaymentStatus.PENDING.value,
+                payment_method="Manual",
+                tracking_code=new_tracking_code(),
+                payment_date=now,
+            )
+            db.session.add(payment)
+            sub.checkout_request_id = reference_id
+            db.session.flush()
+            idempotency.remember_signup(session.connection(), key, payment.id, now=now)
+            send_admin_payment_request_sms(sub, payment, plan_name=current_plan.name)
+
+            session.expire_on_commit = False
+            try:
+                session.commit()
+            finally:
+                session.expire_on_commit = True
+            return sub, payment, True
+        except IntegrityError:
+            session.rollback()
+            if attempt + 1 == SIGNUP_ATTEMPTS:
+                raise
+
+
+def _render_instructions(sub, payment):
+    instructions = catalog.manual_instructions(
+        reference_id=payment.reference_id,
+        amount_kes=payment.amount,
+        customer_name=payment.customer_name,
+    )
+    flash("Payment request submitted. Follow the manual instructions below.", "info")
+    return render_template(
+        "public/payment_instructions.html",
+        payment=payment,
+        subscription=sub,
+        instructions=instructions,
+        tracking_url=url_for("payments.track_payment", tracking_code=payment.tracking_code),
+        slip_download_url=url_for("payments.track_receipt_download", tracking_code=payment.tracking_code),
+    )
 
 
 @sub_bp.route('/<int:plan_id>', methods=['GET', 'POST'])
 def new(plan_id):
-    plan = SubscriptionPlan.query.get_or_404(plan_id)
+    plan = catalog.get_plan(plan_id)
+    if plan is None:
+        abort(404)
     form = SubscriptionForm()
 
     if form.validate_on_submit():
@@ -56,112 +194,157 @@ def new(plan_id):
         location = form.location.data.strip()
         delivery_day = form.delivery_day.data.strip()
 
-        now = datetime.utcnow()
-        phone_normalized = Subscription.normalize_phone(phone)
-        phone_mpesa = phone_normalized
-
-        # Reuse same row forever for a (plan, phone) pair to avoid duplicates.
-        sub = Subscription.query.filter_by(
-            plan_id=plan.id,
-            phone_normalized=phone_normalized
-        ).first()
-
-        if sub:
-            sub.phone = phone
-            sub.phone_normalized = phone_normalized
-            sub.name = name
-            sub.location = location
-            sub.preferred_delivery_day = delivery_day
-            sub.next_delivery_date = _next_delivery_datetime(delivery_day, now=now)
-            sub.mark_pending()
-            sub.delivery_status = "Pending"
-        else:
-            sub = Subscription(
-                plan_id=plan.id,
-                phone=phone,
-                phone_normalized=phone_normalized,
-                name=name,
-                location=location,
-                preferred_delivery_day=delivery_day,
-                status=SubscriptionStatus.PENDING.value,
-                start_date=now,
-                current_period_end=now,
-                next_delivery_date=_next_delivery_datetime(delivery_day, now=now),
-                delivery_status="Pending",
+        try:
+            sub, payment, _ = _record_signup(
+                plan, name, phone, location, delivery_day, form_token=form.idempotency_key.data
             )
-            db.session.add(sub)
-
-        db.session.commit()
-
-        reference_id = f"NESTGOLD-{sub.id}-{int(datetime.utcnow().timestamp())}"
-        tracking_code = _new_tracking_code()
-        while Payment.query.filter_by(tracking_code=tracking_code).first():
-            tracking_code = _new_tracking_code()
-
-        payment = Payment(
-            subscription_id=sub.id,
-            amount=plan.price_per_month,
-            checkout_request_id=reference_id,
-            reference_id=reference_id,
-            customer_name=name,
-            customer_phone=phone_mpesa,
-            description=f"{plan.name} subscription - {name}",
-            status=PaymentStatus.PENDING.value,
-            payment_status=ManualPaymentStatus.PENDING.value,
-            manual_payment_status=ManualPaymentStatus.PENDING.value,
-            payment_method="Manual",
-            tracking_code=tracking_code,
-            payment_date=now,
-        )
-        db.session.add(payment)
-        sub.checkout_request_id = reference_id
-        db.session.commit()
-        send_admin_payment_request_sms(sub, payment)
-
-        payment_config = PaymentConfig.query.order_by(PaymentConfig.id.desc()).first()
-        instructions = get_manual_payment_instructions(
-            reference_id=reference_id,
-            amount_kes=plan.price_per_month,
-            customer_name=name,
-            payment_config=payment_config,
-        )
-        flash("Payment request submitted. Follow the manual instructions below.", "info")
-        return render_template(
-            "public/payment_instructions.html",
-            payment=payment,
-            subscription=sub,
-            instructions=instructions,
-            tracking_url=url_for("payments.track_payment", tracking_code=tracking_code),
-            slip_download_url=url_for("payments.track_receipt_download", tracking_code=tracking_code),
-        )
+        except IntegrityError:
+            flash("We could not record your request just now. Please submit it again.", "warning")
+            return render_template('public/subscribe.html', plan=plan, form=form)
+        return _render_instructions(sub, payment)
 
+    if not form.is_submitted():
+        form.idempotency_key.data = idempotency.new_form_token()
     return render_template('public/subscribe.html', plan=plan, form=form)
 
 
 
 @sub_bp.route('/pending/<checkout_id>')
 def pending(checkout_id):
-    return render_template('public/pending.html', checkout_id=checkout_id)
+    return render_template(
+        'public/pending.html', checkout_id=checkout_id, status_events=current_app.config.get('STATUS_EVENTS')
+    )
 
 
-@sub_bp.route('/check/<checkout_id>')
-def check(checkout_id):
-    sub = Subscription.query.filter_by(checkout_request_id=checkout_id).first()
-    payment = Payment.query.filter_by(checkout_request_id=checkout_id).first()
+BATCH_STATUS_MAX_IDS = 100
+# Each open stream occupies a worker (a greenlet or thread with STATUS_EVENTS
+# on), so streams are long-polls: the page reconnects after every window.
+STATUS_STREAM_SECONDS = 25
+STATUS_HEARTBEAT_SECONDS = 20
+TERMINAL_STATUSES = {'completed', 'failed', 'not_found'}
+
+_status_checks = single_flight.group('checkout_status')
 
+
+def _status_from_records(payment, sub):
     if payment and payment.payment_status == ManualPaymentStatus.CONFIRMED.value and sub and sub.is_access_active:
-        return jsonify({'status': 'completed'})
+        return 'completed'
 
-    if payment and payment.status in {PaymentStatus.FAILED.value, PaymentStatus.CANCELLED.value}:
-        return jsonify({'status': 'failed'})
+    if payment and payment.status in {
+        PaymentStatus.FAILED.value,
+        PaymentStatus.CANCELLED.value,
+        PaymentStatus.EXPIRED.value,
+    }:
+        return 'failed'
 
     if sub and sub.status in {SubscriptionStatus.FAILED.value, SubscriptionStatus.CANCELLED.value}:
-        return jsonify({'status': 'failed'})
+        return 'failed'
 
     if not sub and not payment:
-        return jsonify({'status': 'not_found'})
+        return 'not_found'
+
+    return 'pending'
+
+
+def _checkout_status(checkout_id):
+    # Every pending page polling (or woken for) the same checkout shares one lookup.
+    return _status_checks.do(
+        payment_tokens.canonical_token(checkout_id),
+        lambda: _status_from_records(*_resolve_success_records(checkout_id)),
+    )
 
-    return jsonify({'status': 'pending'})
+
+def _checkout_statuses(checkout_ids):
+    """Batch form of ``_checkout_status``: one query for payments, one for subscriptions."""
+    payments = payment_tokens.resolve_payments(checkout_ids)
+    sub_ids = {payment.subscription_id for payment in payments.values() if payment.subscription_id}
+    orphan_ids = [raw for raw, payment in payments.items() if not payment.subscription_id]
+    subs_by_id, subs_by_checkout = {}, {}
+    if sub_ids or orphan_ids:
+        for sub in Subscription.query.filter(
+            Subscription.id.in_(sub_ids) | Subscription.checkout_request_id.in_(orphan_ids)
+        ):
+            subs_by_id[sub.id] = sub
+            subs_by_checkout.setdefault(sub.checkout_request_id, sub)
+
+    statuses = {}
+    for checkout_id in checkout_ids:
+        payment = payments.get(checkout_id)
+        sub = None
+        if payment:
+            sub = subs_by_id.get(payment.subscription_id) or subs_by_checkout.get(checkout_id)
+        statuses[checkout_id] = _status_from_records(payment, sub)
+    return statuses
+
+
+@sub_bp.route('/check/<checkout_id>')
+def check(checkout_id):
+    return jsonify({'status': _checkout_status(checkout_id)})
+
+
+@csrf.exempt
+@sub_bp.route('/check', methods=['POST'])
+def check_many():
+    """Statuses for up to ``BATCH_STATUS_MAX_IDS`` checkout ids: ``{"checkout_ids": [...]}``."""
+    data = request.get_json(silent=True)
+    checkout_ids = data.get('checkout_ids') if isinstance(data, dict) else request.form.getlist('checkout_ids')
+    if not isinstance(checkout_ids, list) or not all(isinstance(c, str) for c in checkout_ids):
+        return jsonify({'error': 'checkout_ids must be a list of strings.'}), 400
+    checkout_ids = list(dict.fromkeys(c.strip() for c in checkout_ids if c and c.strip()))
+    if not checkout_ids:
+        return jsonify({'error': 'No checkout_ids given.'}), 400
+    if len(checkout_ids) > BATCH_STATUS_MAX_IDS:
+        return jsonify({'error': f'At most {BATCH_STATUS_MAX_IDS} checkout_ids per request.'}), 400
+
+    return jsonify({'statuses': _checkout_statuses(checkout_ids)})
+
+
+@sub_bp.route('/events/<checkout_id>')
+def status_events(checkout_id):
+    """Server-Sent Events long-poll: one ``status`` event now and one per change.
+
+    The stream ends at a final status, or with a ``timeout`` event after
+    ``STATUS_STREAM_SECONDS``; the pending page then opens a new one.
+    Only served with ``STATUS_EVENTS`` on: under sync workers a few waiting
+    customers would tie up every worker, so the page polls ``check`` instead.
+    """
+    if not current_app.config.get('STATUS_EVENTS'):
+        abort(404)
+    token = payment_tokens.canonical_token(checkout_id)
+
+    def stream():
+        # Subscribe before the first read so a change in between is not missed.
+        waiter = status_hub.hub.subscribe(token)
+        try:
+            started = time.monotonic()
+            last_status = None
+            next_check = started
+            while True:
+                now = time.monotonic()
+                if waiter.is_set() or now >= next_check:
+                    waiter.clear()
+                    status = _checkout_status(checkout_id)
+                    # Give the pooled connection back while we sit idle.
+                    db.session.remove()
+                    next_check = now + status_hub.STATUS_FALLBACK_SECONDS
+                    if status != last_status:
+                        last_status = status
+                        yield f"event: status\ndata: {json.dumps({'status': status})}\n\n"
+                    if status in TERMINAL_STATUSES:
+                        return
+                if now - started >= STATUS_STREAM_SECONDS:
+                    yield "event: timeout\ndata: {}\n\n"
+                    return
+                wait = max(0.0, min(STATUS_HEARTBEAT_SECONDS, next_check - now, started + STATUS_STREAM_SECONDS - now))
+                if not waiter.wait(timeout=wait):
+                    yield ": keepalive\n\n"
+        finally:
+            status_hub.hub.unsubscribe(token, waiter)
+
+    response = Response(stream_with_context(stream()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
 
 
 @sub_bp.route('/success')
@@ -193,10 +376,14 @@ def _resolve_success_records(checkout_id):
     sub = None
 
     if checkout_id:
-        payment = Payment.query.filter_by(checkout_request_id=checkout_id).first()
-        if payment and payment.subscription_id:
-            sub = Subscription.query.get(payment.subscription_id)
-        if not sub:
+        token = payment_tokens.resolve(checkout_id)
+        if token:
+            payment = db.session.get(Payment, token.payment_id)
+            if token.subscription_id:
+                sub = db.session.get(Subscription, token.subscription_id)
+        # Every signup checkout id is a payment token, so an unknown token (already
+        # ruled out without SQL by the token filter) needs no subscription probe.
+        if token and not sub:
             sub = Subscription.query.filter_by(checkout_request_id=checkout_id).first()
 
     return payment, sub
@@ -205,6 +392,11 @@ def _resolve_success_records(checkout_id):
 @sub_bp.route('/success/receipt')
 def download_receipt():
     checkout_id = (request.args.get('checkout_id') or '').strip()
+    cache = receipt_cache.get_cache()
+    cached = cache.lookup(receipt_cache.KIND_SUCCESS, checkout_id) if checkout_id else None
+    if cached:
+        return receipt_cache.send_cached(cached)
+
     payment, sub = _resolve_success_records(checkout_id)
 
     if not checkout_id or not payment or not sub:
@@ -241,11 +433,11 @@ def download_receipt():
         "",
         "Thank you for your subscription.",
     ]
-    body = "\n".join(receipt_lines)
-
-    response = Response(body, mimetype='text/plain; charset=utf-8')
-    response.headers['Content-Disposition'] = f'attachment; filename="receipt_{checkout_id}.txt"'
-    return response
+    entry = cache.store(
+        receipt_cache.KIND_SUCCESS, [checkout_id], f"receipt_{checkout_id}.txt", 'text/plain',
+        receipt_lines, lambda: "\n".join(receipt_lines).encode('utf-8'),
+    )
+    return receipt_cache.send_cached(entry)
 
 
 @sub_bp.route('/failed')
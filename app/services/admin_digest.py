@@ -0,0 +1,168 @@
+# app/services/admin_digest.py
+"""Admin notification digests.
+
+Routine admin notifications (a new payment request) are not texted one by
+one.  ``record`` buffers each one as an ``admin_events`` row in the caller's
+transaction.  The outbox worker calls ``flush_due`` on every pass.  That
+sends one digest SMS, with a count and total per plan, once the oldest
+buffered event is ``ADMIN_DIGEST_WINDOW_SECONDS`` old or
+``ADMIN_DIGEST_MAX_EVENTS`` have piled up.  The events are deleted in the
+same transaction that queues the digest, so each one is reported exactly
+once even when several workers flush.
+
+Events are usually recorded by web processes and flushed by another one
+(the worker thread of a different process, or ``flask sms-worker``), so
+``flush_due`` reads ``admin_events`` at least once per window whatever this
+process has seen.  Each process also keeps a small in-memory buffer of
+what it has recorded or last read (count and oldest timestamp).  It only
+makes flushing sooner: a commit that fills it wakes the worker at once, and
+between reads it tells ``flush_due`` when the oldest known event comes due.
+
+Urgent events (``ADMIN_URGENT_AMOUNT``) bypass the digest and are queued
+right away.
+"""
+
+import os
+import threading
+from datetime import datetime, timedelta
+
+from flask import current_app, has_app_context
+from sqlalchemy import delete, event, func, select
+from sqlalchemy.orm import Session
+
+from app.models import AdminEvent, db
+from app.services import sms_outbox
+
+ADMIN_PHONE = os.getenv('ADMIN_PHONE_NUMBER')
+ADMIN_DIGEST_WINDOW_SECONDS = int(os.getenv('ADMIN_DIGEST_WINDOW_SECONDS', '900'))
+ADMIN_DIGEST_MAX_EVENTS = int(os.getenv('ADMIN_DIGEST_MAX_EVENTS', '50'))
+# Payment requests at or above this amount (KES) are texted immediately; 0 disables.
+ADMIN_URGENT_AMOUNT = float(os.getenv('ADMIN_URGENT_AMOUNT', '0'))
+ADMIN_DIGEST_LATEST = 3
+
+EVENT_LABELS = {
+    'payment_request': 'payment requests',
+}
+
+
+def is_urgent(amount):
+    return bool(ADMIN_URGENT_AMOUNT and amount is not None and amount >= ADMIN_URGENT_AMOUNT)
+
+
+def record(kind, plan_name=None, amount=None, reference=None, connection=None, now=None):
+    """Buffer one event for the next digest, in the current transaction."""
+    (connection or db.session.connection()).execute(AdminEvent.__table__.insert(), {
+        'kind': kind,
+        'plan_name': plan_name,
+        'amount': amount,
+        'reference': reference,
+        'created_at': now or datetime.utcnow(),
+    })
+    info = db.session().info
+    info['admin_events'] = info.get('admin_events', 0) + 1
+
+
+class DigestBuffer:
+    """This process's view of unflushed events; ``checked_at is None`` means never read."""
+
+    def __init__(self, window=ADMIN_DIGEST_WINDOW_SECONDS, max_events=ADMIN_DIGEST_MAX_EVENTS):
+        self.window = timedelta(seconds=window)
+        self.max_events = max_events
+        self._lock = threading.Lock()
+        self.pending = 0
+        self.oldest = None
+        self.checked_at = None
+
+    def add(self, count, now):
+        with self._lock:
+            self.pending += count
+            if self.oldest is None:
+                self.oldest = now
+
+    def reset(self, pending=0, oldest=None, checked_at=None):
+        with self._lock:
+            self.pending = pending
+            self.oldest = oldest
+            self.checked_at = checked_at
+
+    def due(self, now):
+        """True when the table should be read: once per window, or sooner for what this process knows."""
+        with self._lock:
+            if self.checked_at is None or self.checked_at <= now - self.window:
+                return True
+            if not self.pending:
+                return False
+            return self.pending >= self.max_events or self.oldest <= now - self.window
+
+
+def get_buffer():
+    buffer = current_app.extensions.get('admin_digest')
+    if buffer is None:
+        buffer = current_app.extensions.setdefault('admin_digest', DigestBuffer())
+    return buffer
+
+
+def render_digest(rows, now):
+    """One SMS summarising ``rows``: count and amount per kind and plan, and the latest references."""
+    since = min(row.created_at for row in rows)
+    totals = {}
+    for row in rows:
+        key = (row.kind, row.plan_name or '-')
+        count, amount = totals.get(key, (0, 0.0))
+        totals[key] = (count + 1, amount + (row.amount or 0.0))
+
+    lines = [f"NestGold digest {since:%H:%M}-{now:%H:%M} UTC"]
+    for kind in sorted({kind for kind, _ in totals}):
+        plans = sorted((plan, totals[(k, plan)]) for k, plan in totals if k == kind)
+        lines.append(f"{sum(count for _, (count, _) in plans)} {EVENT_LABELS.get(kind, kind)}:")
+        lines.extend(f"{plan}: {count} / KES {amount:,.0f}" for plan, (count, amount) in plans)
+        lines.append(f"Total: KES {sum(amount for _, (_, amount) in plans):,.0f}")
+    latest = [row.reference for row in sorted(rows, key=lambda row: row.created_at)[-ADMIN_DIGEST_LATEST:]]
+    if any(latest):
+        lines.append("Latest: " + ", ".join(reference for reference in latest if reference))
+    return "\n".join(lines)
+
+
+def flush(now=None):
+    """Send everything buffered as one digest; returns the number of events reported."""
+    now = now or datetime.utcnow()
+    rows = db.session.execute(
+        delete(AdminEvent).returning(
+            AdminEvent.kind, AdminEvent.plan_name, AdminEvent.amount, AdminEvent.reference, AdminEvent.created_at
+        )
+    ).all()
+    if rows and ADMIN_PHONE:
+        sms_outbox.enqueue([ADMIN_PHONE], render_digest(rows, now), 'admin_digest')
+    db.session.commit()
+    get_buffer().reset(checked_at=now)
+    return len(rows)
+
+
+def flush_due(now=None):
+    """Flush if the oldest event is a window old or enough are waiting; one query per window otherwise."""
+    now = now or datetime.utcnow()
+    buffer = get_buffer()
+    if not buffer.due(now):
+        return 0
+    pending, oldest = db.session.execute(select(func.count(), func.min(AdminEvent.created_at))).one()
+    if pending and (pending >= buffer.max_events or oldest <= now - buffer.window):
+        return flush(now)
+    buffer.reset(pending, oldest, checked_at=now)
+    db.session.commit()
+    return 0
+
+
+@event.listens_for(Session, 'after_commit')
+def _note_admin_events(session):
+    count = session.info.pop('admin_events', 0)
+    if count and has_app_context():
+        buffer = get_buffer()
+        buffer.add(count, datetime.utcnow())
+        worker = current_app.extensions.get('sms_outbox_worker')
+        if worker is not None and buffer.due(datetime.utcnow()):
+            worker.notify()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_admin_events(session):
+    session.info.pop('admin_events', None)
@@ -0,0 +1,196 @@
+# app/services/bulk_actions.py
+"""Set-based bulk cancel/delete/extend for admin subscription clean-ups.
+
+Each action works on batches of ids with a handful of ``IN (...)`` statements
+instead of one request (and several queries) per subscription, applies the
+same eligibility rules as the single-row admin routes, and returns a per-id
+outcome map.  Every batch leaves one compact audit row.
+
+``bulk_extend`` only touches subscriptions that have paid (a confirmed
+payment) or still have access; the rest are reported as skipped.  The new
+period end is computed by the UPDATE itself, from whatever
+``current_period_end`` is committed when the row is written, so a payment
+confirmed meanwhile is extended rather than overwritten.
+"""
+
+from datetime import datetime, timedelta
+
+from sqlalchemy import case, exists, func, literal, or_, update
+from sqlalchemy.exc import IntegrityError
+
+from app.models import (
+    Delivery,
+    ManualPaymentStatus,
+    Payment,
+    Subscription,
+    SubscriptionStatus,
+    db,
+    record_batch_audit,
+)
+from app.services import page_cache, payment_tokens, receipt_cache
+from app.services import search as search_index
+
+BULK_BATCH_SIZE = 500
+
+OUTCOME_CANCELLED = 'cancelled'
+OUTCOME_DELETED = 'deleted'
+OUTCOME_EXTENDED = 'extended'
+OUTCOME_SKIPPED = 'skipped'
+OUTCOME_NOT_FOUND = 'not_found'
+OUTCOME_ERROR = 'error'
+
+
+def _batches(ids, size=BULK_BATCH_SIZE):
+    ids = sorted({int(i) for i in ids})
+    for start in range(0, len(ids), size):
+        yield ids[start:start + size]
+
+
+def _existing_ids(batch):
+    return {row.id for row in db.session.query(Subscription.id).filter(Subscription.id.in_(batch))}
+
+
+def _cancel(ids, now, delivery_status=None):
+    changes = {
+        Subscription.status: SubscriptionStatus.CANCELLED.value,
+        Subscription.current_period_end: now,
+    }
+    if delivery_status:
+        changes[Subscription.delivery_status] = delivery_status
+    receipt_cache.invalidate_subscription_ids(ids)
+    page_cache.invalidate_subscription_ids(ids)
+    Subscription.query.filter(Subscription.id.in_(ids)).update(changes, synchronize_session=False)
+
+
+def bulk_cancel(sub_ids, now=None):
+    """Mirror of ``admin.cancel_subscription`` for many rows."""
+    now = now or datetime.utcnow()
+    outcomes = {}
+    for batch in _batches(sub_ids):
+        found = _existing_ids(batch)
+        if found:
+            _cancel(found, now)
+            record_batch_audit(db.session, Subscription.__tablename__, 'bulk_cancel', sorted(found), {
+                'status': SubscriptionStatus.CANCELLED.value,
+                'current_period_end': now,
+            })
+            db.session.commit()
+        for sub_id in batch:
+            outcomes[sub_id] = OUTCOME_CANCELLED if sub_id in found else OUTCOME_NOT_FOUND
+    return outcomes
+
+
+def bulk_delete(sub_ids, now=None):
+    """Mirror of ``admin.delete_subscription``: hard-delete when a confirmed payment
+    exists and delivery is complete, otherwise cancel and mark delivery cancelled."""
+    now = now or datetime.utcnow()
+    has_confirmed_payment = exists().where(
+        Payment.subscription_id == Subscription.id,
+        Payment.payment_status == ManualPaymentStatus.CONFIRMED.value,
+    )
+    delivery_completed = or_(
+        Subscription.delivery_status == "Completed",
+        Subscription.trays_remaining == 0,
+    )
+    eligible_expr = case((has_confirmed_payment & delivery_completed, True), else_=False)
+
+    outcomes = {}
+    for batch in _batches(sub_ids):
+        rows = db.session.query(Subscription.id, eligible_expr.label('eligible')).filter(
+            Subscription.id.in_(batch)
+        ).all()
+        deletable = sorted(row.id for row in rows if row.eligible)
+        cancellable = sorted(row.id for row in rows if not row.eligible)
+
+        failed = False
+        try:
+            if deletable:
+                connection = db.session.connection()
+                receipt_cache.invalidate_subscription_ids(deletable)
+                page_cache.invalidate_subscription_ids(deletable)
+                Delivery.query.filter(Delivery.subscription_id.in_(deletable)).delete(synchronize_session=False)
+                search_index.purge_subscription_payments(connection, deletable)
+                payment_tokens.purge_subscription_payments(connection, deletable)
+                Payment.query.filter(Payment.subscription_id.in_(deletable)).delete(synchronize_session=False)
+                search_index.purge_entities(connection, search_index.ENTITY_SUBSCRIPTION, deletable)
+                Subscription.query.filter(Subscription.id.in_(deletable)).delete(synchronize_session=False)
+                record_batch_audit(db.session, Subscription.__tablename__, 'bulk_delete', deletable)
+            if cancellable:
+                _cancel(cancellable, now, delivery_status="Cancelled")
+                record_batch_audit(db.session, Subscription.__tablename__, 'bulk_cancel', cancellable, {
+                    'status': SubscriptionStatus.CANCELLED.value,
+                    'current_period_end': now,
+                    'delivery_status': "Cancelled",
+                })
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            failed = True
+
+        for sub_id in batch:
+            if failed and (sub_id in deletable or sub_id in cancellable):
+                outcomes[sub_id] = OUTCOME_ERROR
+            elif sub_id in deletable:
+                outcomes[sub_id] = OUTCOME_DELETED
+            elif sub_id in cancellable:
+                outcomes[sub_id] = OUTCOME_CANCELLED
+            else:
+                outcomes[sub_id] = OUTCOME_NOT_FOUND
+    return outcomes
+
+
+def _plus_days(expr, days):
+    """``expr + days`` as SQL; SQLite has no interval type, so use its date functions."""
+    if db.session.get_bind().dialect.name == 'sqlite':
+        # '%f' is seconds with milliseconds; pad to the microsecond layout SQLAlchemy stores.
+        return func.strftime('%Y-%m-%d %H:%M:%f000', expr, f'+{int(days)} days')
+    return expr + timedelta(days=days)
+
+
+def bulk_extend(sub_ids, days, now=None):
+    """Mirror of ``Subscription.extend_period`` for many rows in one UPDATE per batch.
+
+    Only subscriptions with a confirmed payment or current access are extended;
+    the others come back as ``OUTCOME_SKIPPED``.
+    """
+    now = now or datetime.utcnow()
+    now_expr = literal(now, db.DateTime)
+    has_confirmed_payment = exists().where(
+        Payment.subscription_id == Subscription.id,
+        Payment.payment_status == ManualPaymentStatus.CONFIRMED.value,
+    )
+    eligible = or_(has_confirmed_payment, Subscription.current_period_end > now_expr)
+    base = case((Subscription.current_period_end > now_expr, Subscription.current_period_end), else_=now_expr)
+
+    outcomes = {}
+    for batch in _batches(sub_ids):
+        found = _existing_ids(batch)
+        extended = set()
+        if found:
+            extended = set(db.session.execute(
+                update(Subscription)
+                .where(Subscription.id.in_(found), eligible)
+                .values({
+                    Subscription.current_period_end: _plus_days(base, days),
+                    Subscription.status: SubscriptionStatus.ACTIVE.value,
+                })
+                .returning(Subscription.id)
+                .execution_options(synchronize_session=False)
+            ).scalars())
+        if extended:
+            receipt_cache.invalidate_subscription_ids(extended)
+            page_cache.invalidate_subscription_ids(extended)
+            record_batch_audit(db.session, Subscription.__tablename__, 'bulk_extend', sorted(extended), {
+                'days': days,
+                'status': SubscriptionStatus.ACTIVE.value,
+            })
+        db.session.commit()
+
+        for sub_id in batch:
+            if sub_id in extended:
+                outcomes[sub_id] = OUTCOME_EXTENDED
+            elif sub_id in found:
+                outcomes[sub_id] = OUTCOME_SKIPPED
+            else:
+                outcomes[sub_id] = OUTCOME_NOT_FOUND
+    return outcomes
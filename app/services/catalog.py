@@ -0,0 +1,148 @@
+# app/services/catalog.py
+"""In-process snapshot of reference data: plans, the payment config and the
+instruction template built from it.
+
+These rows change a few times a month but are read on every home page,
+signup and receipt, so each worker keeps one immutable snapshot and serves
+those pages without touching the database.  A session hook bumps the
+catalog's generation once a transaction that wrote a plan or the payment
+config commits, so the admin's next page in this worker sees the change.  Other
+workers reload when ``CATALOG_TTL_SECONDS`` runs out, like the in-process
+page cache.  Reloads are coalesced, so an expiry under load costs two
+queries, not two per request.
+
+``version()`` is a digest of the data a snapshot was built from, the same
+in every worker, so it is a cheap input for ETags.
+"""
+
+import hashlib
+import os
+import threading
+import time
+from collections import namedtuple
+
+from flask import current_app, has_app_context
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+
+from app.models import PaymentConfig, SubscriptionPlan, db
+from app.services import single_flight
+from app.services.mpesa import manual_instructions_template, render_manual_instructions
+
+CATALOG_TTL_SECONDS = int(os.getenv('CATALOG_TTL_SECONDS', '60'))
+
+PLAN_COLUMNS = (
+    SubscriptionPlan.id,
+    SubscriptionPlan.name,
+    SubscriptionPlan.trays_per_week,
+    SubscriptionPlan.price_per_month,
+    SubscriptionPlan.description,
+    SubscriptionPlan.is_active,
+    SubscriptionPlan.is_recommended,
+    SubscriptionPlan.button_color,
+)
+CONFIG_COLUMNS = (
+    PaymentConfig.id,
+    PaymentConfig.mpesa_paybill,
+    PaymentConfig.mpesa_account_name,
+    PaymentConfig.mpesa_account_number,
+    PaymentConfig.bank_name,
+    PaymentConfig.bank_account_name,
+    PaymentConfig.bank_account_number,
+    PaymentConfig.instructions_footer,
+)
+
+Snapshot = namedtuple(
+    'Snapshot', 'generation expires_at digest plans plans_by_id payment_config instructions_template'
+)
+
+_loads = single_flight.group('catalog')
+
+
+class Catalog:
+    def __init__(self, ttl=CATALOG_TTL_SECONDS):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._snapshot = None
+
+    def get(self):
+        snapshot = self._snapshot
+        if snapshot is None or snapshot.generation != self._generation or snapshot.expires_at < time.monotonic():
+            snapshot = _loads.do(id(self), self._load)
+        return snapshot
+
+    def _load(self):
+        generation = self._generation
+        plans = tuple(db.session.execute(select(*PLAN_COLUMNS).order_by(SubscriptionPlan.id)).all())
+        payment_config = db.session.execute(
+            select(*CONFIG_COLUMNS).order_by(PaymentConfig.id.desc()).limit(1)
+        ).first()
+        digest = hashlib.sha1(
+            repr(([tuple(plan) for plan in plans], tuple(payment_config or ()))).encode('utf-8')
+        ).hexdigest()[:16]
+        snapshot = Snapshot(
+            generation=generation,
+            expires_at=time.monotonic() + self.ttl,
+            digest=digest,
+            plans=plans,
+            plans_by_id={plan.id: plan for plan in plans},
+            payment_config=payment_config,
+            instructions_template=manual_instructions_template(payment_config),
+        )
+        with self._lock:
+            # A bump during the load means the rows read may already be stale.
+            if generation == self._generation:
+                self._snapshot = snapshot
+        return snapshot
+
+    def bump(self):
+        with self._lock:
+            self._generation += 1
+
+
+def get_catalog():
+    catalog = current_app.extensions.get('catalog')
+    if catalog is None:
+        catalog = current_app.extensions.setdefault('catalog', Catalog())
+    return catalog
+
+
+def plans():
+    return get_catalog().get().plans
+
+
+def get_plan(plan_id):
+    return get_catalog().get().plans_by_id.get(plan_id)
+
+
+def payment_config():
+    return get_catalog().get().payment_config
+
+
+def manual_instructions(reference_id, amount_kes, customer_name=None):
+    template = get_catalog().get().instructions_template
+    return render_manual_instructions(template, reference_id, amount_kes, customer_name)
+
+
+def version():
+    return get_catalog().get().digest
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_catalog_changes(session, flush_context):
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, (SubscriptionPlan, PaymentConfig)):
+            session.info['catalog_stale'] = True
+            return
+
+
+@event.listens_for(Session, 'after_commit')
+def _bump_catalog(session):
+    if session.info.pop('catalog_stale', None) and has_app_context():
+        get_catalog().bump()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_catalog_changes(session):
+    session.info.pop('catalog_stale', None)
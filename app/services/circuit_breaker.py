@@ -0,0 +1,116 @@
+# app/services/circuit_breaker.py
+"""Per-process circuit breakers for calls to outside services.
+
+A breaker is ``closed`` while calls succeed.  After ``failure_threshold``
+consecutive failures it ``open``s, and ``allow()`` refuses every call for
+``reset_seconds``.  A refused call costs a lock and a clock read, not a
+connect timeout.  After that, one call is let through as a probe
+(``half_open``).  If the probe succeeds the breaker closes; if it fails the
+breaker opens for another ``reset_seconds``.
+
+State is per process, like the single-flight counters;
+``/admin/metrics/sms`` reports this worker's breakers.
+"""
+
+import os
+import threading
+import time
+
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv('CIRCUIT_FAILURE_THRESHOLD', '5'))
+CIRCUIT_RESET_SECONDS = float(os.getenv('CIRCUIT_RESET_SECONDS', '30'))
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a service whose breaker is open."""
+
+    def __init__(self, name, retry_after):
+        super().__init__(f'{name} circuit open; retry in {retry_after:.1f}s')
+        self.name = name
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    def __init__(self, name, failure_threshold=CIRCUIT_FAILURE_THRESHOLD, reset_seconds=CIRCUIT_RESET_SECONDS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._stats = {'successes': 0, 'failures': 0, 'rejected': 0, 'opened': 0}
+
+    @property
+    def state(self):
+        return self._state
+
+    def retry_after(self):
+        if self._state == CLOSED:
+            return 0.0
+        return max(0.0, self._opened_at + self.reset_seconds - time.monotonic())
+
+    def allow(self):
+        """Return True if a call may go out now; only one probe is let through while half-open."""
+        with self._lock:
+            if self._state == CLOSED:
+                return True
+            now = time.monotonic()
+            # A probe that never reports back is replaced after another reset period.
+            if now - self._opened_at >= self.reset_seconds:
+                self._state = HALF_OPEN
+                self._opened_at = now
+                return True
+            self._stats['rejected'] += 1
+            return False
+
+    def check(self):
+        """``allow()`` or raise ``CircuitOpenError``."""
+        if not self.allow():
+            raise CircuitOpenError(self.name, self.retry_after() or self.reset_seconds)
+
+    def record_success(self):
+        with self._lock:
+            self._stats['successes'] += 1
+            self._failures = 0
+            self._state = CLOSED
+
+    def record_failure(self):
+        with self._lock:
+            self._stats['failures'] += 1
+            self._failures += 1
+            if self._state == HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != OPEN:
+                    self._stats['opened'] += 1
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['state'] = self._state
+            stats['consecutive_failures'] = self._failures
+        stats['retry_after'] = round(self.retry_after(), 3)
+        return stats
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def breaker(name):
+    """Return the process-wide ``CircuitBreaker`` registered under ``name``."""
+    with _breakers_lock:
+        circuit = _breakers.get(name)
+        if circuit is None:
+            circuit = _breakers[name] = CircuitBreaker(name)
+        return circuit
+
+
+def stats():
+    with _breakers_lock:
+        circuits = list(_breakers.values())
+    return {circuit.name: circuit.stats() for circuit in circuits}
@@ -0,0 +1,148 @@
+# app/services/feedback.py
+"""Rating aggregates and the in-memory recent-feedback list.
+
+``feedback_rating_counts`` holds one row per star value.  A session hook
+adjusts it in the same flush that inserts (or deletes) a ``Feedback`` row,
+so count, sum and average never need a scan of ``feedback``.
+
+Each worker keeps a snapshot of the latest entries and the rating counts.
+The feedback page's first screen is served from that snapshot.  A commit
+that touched feedback bumps the generation here.  Entries posted through
+another worker show up once ``FEEDBACK_CACHE_TTL_SECONDS`` runs out.  Older
+entries are browsed with a keyset cursor on ``id``, one indexed range read
+per page.
+"""
+
+import os
+import threading
+import time
+from collections import namedtuple
+
+from flask import current_app, has_app_context
+from sqlalchemy import event, inspect, select
+from sqlalchemy.orm import Session
+
+from app.models import Feedback, FeedbackRatingCount, db
+from app.services import single_flight
+
+FEEDBACK_CACHE_TTL_SECONDS = int(os.getenv('FEEDBACK_CACHE_TTL_SECONDS', '60'))
+FEEDBACK_PAGE_SIZE = 12
+RATING_VALUES = (5, 4, 3, 2, 1)
+
+FEEDBACK_COLUMNS = (Feedback.id, Feedback.name, Feedback.rating, Feedback.comment, Feedback.created_at)
+
+RatingSummary = namedtuple('RatingSummary', 'count total average histogram')
+Snapshot = namedtuple('Snapshot', 'generation expires_at recent has_older summary')
+
+_loads = single_flight.group('feedback')
+
+
+def _summary(counts):
+    histogram = {rating: counts.get(rating, 0) for rating in RATING_VALUES}
+    count = sum(histogram.values())
+    total = sum(rating * n for rating, n in histogram.items())
+    return RatingSummary(count, total, round(total / count, 1) if count else None, histogram)
+
+
+class FeedbackCache:
+    def __init__(self, ttl=FEEDBACK_CACHE_TTL_SECONDS):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._snapshot = None
+
+    def get(self):
+        snapshot = self._snapshot
+        if snapshot is None or snapshot.generation != self._generation or snapshot.expires_at < time.monotonic():
+            snapshot = _loads.do(id(self), self._load)
+        return snapshot
+
+    def _load(self):
+        generation = self._generation
+        recent, has_older = older_feedback(None)
+        counts = dict(db.session.execute(select(FeedbackRatingCount.rating, FeedbackRatingCount.count)).all())
+        snapshot = Snapshot(generation, time.monotonic() + self.ttl, recent, has_older, _summary(counts))
+        with self._lock:
+            if generation == self._generation:
+                self._snapshot = snapshot
+        return snapshot
+
+    def bump(self):
+        with self._lock:
+            self._generation += 1
+
+
+def get_cache():
+    cache = current_app.extensions.get('feedback_cache')
+    if cache is None:
+        cache = current_app.extensions.setdefault('feedback_cache', FeedbackCache())
+    return cache
+
+
+def recent_feedback():
+    """``(entries, has_older)`` for the first page, from memory."""
+    snapshot = get_cache().get()
+    return snapshot.recent, snapshot.has_older
+
+
+def rating_summary():
+    return get_cache().get().summary
+
+
+def older_feedback(before_id, limit=FEEDBACK_PAGE_SIZE):
+    """Up to ``limit`` entries with ``id < before_id`` (newest first) and whether more remain."""
+    query = select(*FEEDBACK_COLUMNS).order_by(Feedback.id.desc()).limit(limit + 1)
+    if before_id is not None:
+        query = query.where(Feedback.id < before_id)
+    rows = tuple(db.session.execute(query).all())
+    return rows[:limit], len(rows) > limit
+
+
+def _adjust_counts(connection, deltas):
+    table = FeedbackRatingCount.__table__
+    for rating, delta in deltas.items():
+        if not delta:
+            continue
+        updated = connection.execute(
+            table.update().where(table.c.rating == rating).values(count=table.c.count + delta)
+        ).rowcount
+        if not updated:
+            connection.execute(table.insert(), {'rating': rating, 'count': max(delta, 0)})
+
+
+@event.listens_for(Session, 'after_flush')
+def _maintain_rating_counts(session, flush_context):
+    deltas = {}
+    touched = False
+    for obj in session.new:
+        if isinstance(obj, Feedback):
+            touched = True
+            deltas[obj.rating] = deltas.get(obj.rating, 0) + 1
+    for obj in session.deleted:
+        if isinstance(obj, Feedback):
+            touched = True
+            deltas[obj.rating] = deltas.get(obj.rating, 0) - 1
+    for obj in session.dirty:
+        if isinstance(obj, Feedback):
+            touched = True
+            history = inspect(obj).attrs.rating.history
+            if history.has_changes():
+                for old in history.deleted:
+                    deltas[old] = deltas.get(old, 0) - 1
+                for new in history.added:
+                    deltas[new] = deltas.get(new, 0) + 1
+    if not touched:
+        return
+    _adjust_counts(session.connection(), deltas)
+    session.info['feedback_changed'] = True
+
+
+@event.listens_for(Session, 'after_commit')
+def _refresh_feedback_cache(session):
+    if session.info.pop('feedback_changed', None) and has_app_context():
+        get_cache().bump()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_feedback_changes(session):
+    session.info.pop('feedback_changed', None)
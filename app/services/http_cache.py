@@ -0,0 +1,102 @@
+# app/services/http_cache.py
+"""HTTP caching for public pages: ETags, conditional GETs and Cache-Control.
+
+``@cache_public(version=...)`` wraps a view whose output is the same for
+every anonymous visitor.  Its ETag is derived from the request path, the
+template sources and the view's data version (for example
+``catalog.version``), so an ``If-None-Match`` revalidation is answered with
+a 304 before the view runs.  Fresh renders are kept in an in-process LRU
+keyed by that ETag (``PUBLIC_PAGE_CACHE``, on by default), so a new version
+simply misses and ages out.
+
+Signed-in visitors and responses carrying flashed messages or a session
+change are sent ``private, no-cache`` and never stored.  ``Vary: Cookie``
+keeps shared caches from mixing them with the public copy.
+"""
+
+import hashlib
+import os
+from functools import wraps
+
+from flask import current_app, make_response, request, session
+from flask_login import current_user
+
+from app.services.page_cache import MemoryPageStore
+
+PUBLIC_PAGE_MAX_AGE = int(os.getenv('PUBLIC_PAGE_MAX_AGE', '60'))
+PUBLIC_PAGE_CACHE_MAX_BYTES = 4 * 1024 * 1024
+
+
+def page_cacheable():
+    # The shared layout shows admin links and flashed messages; only cache what every visitor sees.
+    return not current_user.is_authenticated and not session.get('_flashes')
+
+
+def _release_digest():
+    """Digest of the template sources, so a deploy that changes a page changes its ETags."""
+    digest = current_app.extensions.get('template_digest')
+    if digest is None:
+        hasher = hashlib.sha1()
+        root = current_app.jinja_loader.searchpath[0]
+        for dirpath, dirnames, filenames in sorted(os.walk(root)):
+            dirnames.sort()
+            for filename in sorted(filenames):
+                path = os.path.join(dirpath, filename)
+                hasher.update(os.path.relpath(path, root).encode('utf-8'))
+                with open(path, 'rb') as fh:
+                    hasher.update(fh.read())
+        digest = current_app.extensions.setdefault('template_digest', hasher.hexdigest()[:16])
+    return digest
+
+
+def _get_store():
+    store = current_app.extensions.get('public_pages')
+    if store is None:
+        store = current_app.extensions.setdefault(
+            'public_pages', MemoryPageStore(max_bytes=PUBLIC_PAGE_CACHE_MAX_BYTES, ttl=PUBLIC_PAGE_MAX_AGE)
+        )
+    return store
+
+
+def _private(response):
+    response.headers['Cache-Control'] = 'private, no-cache'
+    response.vary.add('Cookie')
+    return response
+
+
+def _public(response, etag, max_age):
+    response.set_etag(etag, weak=True)
+    response.headers['Cache-Control'] = f'public, max-age={max_age}'
+    response.vary.add('Cookie')
+    return response
+
+
+def cache_public(version=None, max_age=PUBLIC_PAGE_MAX_AGE):
+    """Serve an anonymous GET view with a version-derived ETag and an in-process page cache."""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method not in ('GET', 'HEAD') or not page_cacheable():
+                return _private(make_response(view(*args, **kwargs)))
+
+            etag = hashlib.sha1('\0'.join((
+                _release_digest(),
+                request.full_path,
+                version() if version else '',
+            )).encode('utf-8')).hexdigest()[:20]
+            if request.if_none_match.contains_weak(etag):
+                return _public(make_response('', 304), etag, max_age)
+
+            use_store = current_app.config.get('PUBLIC_PAGE_CACHE', True)
+            body = _get_store().get(etag) if use_store else None
+            if body is not None:
+                return _public(make_response(body), etag, max_age)
+
+            response = make_response(view(*args, **kwargs))
+            if response.status_code != 200 or session.modified:
+                return _private(response)
+            if use_store:
+                _get_store().set(etag, None, None, response.get_data())
+            return _public(response, etag, max_age)
+        return wrapper
+    return decorator
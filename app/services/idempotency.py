@@ -0,0 +1,76 @@
+# app/services/idempotency.py
+"""Idempotency keys for public signup submissions.
+
+The subscribe form carries a random token.  It is hashed together with the
+plan and normalized phone, and the result is stored in ``signup_requests``
+in the same transaction as the payment it created.  A resubmit of the same
+form inside ``SIGNUP_IDEMPOTENCY_TTL_SECONDS`` therefore finds the earlier
+payment and replays its instructions with no writes and no admin SMS.  When two
+submits race, the loser fails on the key's primary key and retries into the
+replay path.
+
+A submission without a token (an old cached form, a scripted client) is
+keyed on plan, phone and the TTL window instead.  ``flask
+purge-signup-keys`` drops expired keys; an expired key met during a signup
+is removed on the spot.
+"""
+
+import hashlib
+import os
+import secrets
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, select
+
+from app.models import Payment, SignupRequest, db
+
+SIGNUP_IDEMPOTENCY_TTL_SECONDS = int(os.getenv('SIGNUP_IDEMPOTENCY_TTL_SECONDS', '900'))
+
+
+def new_form_token():
+    return secrets.token_urlsafe(16)
+
+
+def signup_key(plan_id, phone_normalized, form_token=None, now=None):
+    scope = (form_token or '').strip()
+    if not scope:
+        now = now or datetime.utcnow()
+        scope = f"window:{int(now.timestamp()) // SIGNUP_IDEMPOTENCY_TTL_SECONDS}"
+    return hashlib.sha256(f"{plan_id}:{phone_normalized}:{scope}".encode('utf-8')).hexdigest()
+
+
+def _cutoff(now=None):
+    return (now or datetime.utcnow()) - timedelta(seconds=SIGNUP_IDEMPOTENCY_TTL_SECONDS)
+
+
+def find_signup(key, now=None):
+    """Payment id recorded under ``key``, or None.
+
+    A key that has expired, or whose payment has since been deleted, is
+    removed so the submission can be recorded afresh.
+    """
+    row = db.session.execute(
+        select(SignupRequest.payment_id, SignupRequest.created_at, Payment.id.label('live_payment_id'))
+        .outerjoin(Payment, Payment.id == SignupRequest.payment_id)
+        .where(SignupRequest.key == key)
+    ).first()
+    if row is None:
+        return None
+    if row.live_payment_id is None or row.created_at < _cutoff(now):
+        db.session.execute(delete(SignupRequest).where(SignupRequest.key == key))
+        return None
+    return row.payment_id
+
+
+def remember_signup(connection, key, payment_id, now=None):
+    connection.execute(SignupRequest.__table__.insert(), {
+        'key': key,
+        'payment_id': payment_id,
+        'created_at': now or datetime.utcnow(),
+    })
+
+
+def purge_expired(now=None):
+    result = db.session.execute(delete(SignupRequest).where(SignupRequest.created_at < _cutoff(now)))
+    db.session.commit()
+    return result.rowcount or 0
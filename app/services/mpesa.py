@@ -14,26 +14,41 @@ MANUAL_BANK_ACCOUNT = os.getenv("MANUAL_BANK_ACCOUNT", "1234567890")
 MANUAL_BANK_ACCOUNT_NAME = os.getenv("MANUAL_BANK_ACCOUNT_NAME", "NestGold Provisions")
 
 
-def get_manual_payment_instructions(reference_id, amount_kes, customer_name=None, payment_config=None):
-    name_part = f" for {customer_name}" if customer_name else ""
+def _literal(value):
+    return str(value).replace("{", "{{").replace("}", "}}")
+
+
+def manual_instructions_template(payment_config=None):
+    """Instruction text with the config filled in and per-payment fields left as ``str.format`` slots."""
     paybill = getattr(payment_config, "mpesa_paybill", None) or MPESA_PAYBILL
     account_name = getattr(payment_config, "mpesa_account_name", None) or MPESA_ACCOUNT_NAME
-    account_number = getattr(payment_config, "mpesa_account_number", None) or reference_id
+    account_number = getattr(payment_config, "mpesa_account_number", None)
     bank_name = (getattr(payment_config, "bank_name", None) or "").strip() or "-"
     footer = getattr(payment_config, "instructions_footer", None) or (
         "After payment, keep your receipt and share it with admin via WhatsApp/SMS/email."
     )
     return (
-        f"Please complete your payment{name_part}.\n"
-        f"Amount: KES {float(amount_kes):.2f}\n"
-        f"Reference ID: {reference_id}\n\n"
+        "Please complete your payment{name_part}.\n"
+        "Amount: KES {amount:.2f}\n"
+        "Reference ID: {reference_id}\n\n"
         "M-Pesa Paybill Details\n"
-        f"Business Number: {paybill}\n"
-        f"Account Name: {account_name}\n"
-        f"Account Number: {account_number}\n"
-        f"Bank: {bank_name}\n"
-        f"Use Reference ID in your payment note: {reference_id}\n\n"
-        f"{footer}"
+        f"Business Number: {_literal(paybill)}\n"
+        f"Account Name: {_literal(account_name)}\n"
+        f"Account Number: {_literal(account_number) if account_number else '{reference_id}'}\n"
+        f"Bank: {_literal(bank_name)}\n"
+        "Use Reference ID in your payment note: {reference_id}\n\n"
+        f"{_literal(footer)}"
+    )
+
+
+def render_manual_instructions(template, reference_id, amount_kes, customer_name=None):
+    name_part = f" for {customer_name}" if customer_name else ""
+    return template.format(name_part=name_part, amount=float(amount_kes), reference_id=reference_id)
+
+
+def get_manual_payment_instructions(reference_id, amount_kes, customer_name=None, payment_config=None):
+    return render_manual_instructions(
+        manual_instructions_template(payment_config), reference_id, amount_kes, customer_name
     )
 
 
@@ -0,0 +1,212 @@
+# app/services/page_cache.py
+"""Rendered-page cache for the public tracking page.
+
+Entries are keyed by the canonical token in the URL and tagged with the
+payment and subscription they were rendered from, so a repeat view is served
+without touching the database and any write to that payment, its subscription
+or its deliveries drops every page that showed it.
+
+Two stores are available:
+
+* in-process LRU bounded by ``PAGE_CACHE_MAX_BYTES`` (default), and
+* a SQLite file at ``PAGE_CACHE_PATH`` shared by all gunicorn workers on the
+  host, so an invalidation in one worker is seen by every other one.
+
+With the in-process store an admin action handled by another worker is only
+seen here once the entry's ``PAGE_CACHE_TTL_SECONDS`` runs out; set
+``PAGE_CACHE_PATH`` when running more than one worker.  The same TTL bounds
+a render that races an invalidation in either store.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.models import Delivery, Payment, Subscription, db
+
+PAGE_CACHE_TTL_SECONDS = int(os.getenv('PAGE_CACHE_TTL_SECONDS', '30'))
+PAGE_CACHE_MAX_BYTES = int(os.getenv('PAGE_CACHE_MAX_BYTES', str(16 * 1024 * 1024)))
+PAGE_CACHE_MAX_ROWS = 50000
+
+
+class MemoryPageStore:
+    def __init__(self, max_bytes=PAGE_CACHE_MAX_BYTES, ttl=PAGE_CACHE_TTL_SECONDS):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._bytes = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[3] < time.time():
+                self._drop(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry[2]
+
+    def set(self, key, payment_id, subscription_id, body):
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (payment_id, subscription_id, body, time.time() + self.ttl)
+            self._bytes += len(body)
+            while self._bytes > self.max_bytes and self._entries:
+                self._drop(next(iter(self._entries)))
+
+    def _drop(self, key):
+        entry = self._entries.pop(key)
+        self._bytes -= len(entry[2])
+
+    def invalidate(self, payment_ids=(), subscription_ids=()):
+        payment_ids, subscription_ids = set(payment_ids), set(subscription_ids)
+        with self._lock:
+            stale = [
+                key for key, (payment_id, subscription_id, _, _) in self._entries.items()
+                if payment_id in payment_ids or (subscription_id is not None and subscription_id in subscription_ids)
+            ]
+            for key in stale:
+                self._drop(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+
+class SqlitePageStore:
+    """Host-local store shared by worker processes; one short transaction per call."""
+
+    def __init__(self, path, ttl=PAGE_CACHE_TTL_SECONDS, max_rows=PAGE_CACHE_MAX_ROWS):
+        self.path = path
+        self.ttl = ttl
+        self.max_rows = max_rows
+        self._local = threading.local()
+        self._writes = 0
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS pages ('
+                ' key TEXT PRIMARY KEY, payment_id INTEGER, subscription_id INTEGER,'
+                ' body BLOB NOT NULL, expires_at REAL NOT NULL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS ix_pages_payment ON pages (payment_id)')
+            conn.execute('CREATE INDEX IF NOT EXISTS ix_pages_subscription ON pages (subscription_id)')
+            conn.execute('CREATE INDEX IF NOT EXISTS ix_pages_expires ON pages (expires_at)')
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=1.0, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=OFF')
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        row = self._connect().execute(
+            'SELECT body FROM pages WHERE key = ? AND expires_at > ?', (key, time.time())
+        ).fetchone()
+        return row[0] if row else None
+
+    def set(self, key, payment_id, subscription_id, body):
+        conn = self._connect()
+        try:
+            conn.execute(
+                'INSERT OR REPLACE INTO pages (key, payment_id, subscription_id, body, expires_at)'
+                ' VALUES (?, ?, ?, ?, ?)',
+                (key, payment_id, subscription_id, body, time.time() + self.ttl),
+            )
+            self._writes += 1
+            if self._writes % 1000 == 0:
+                self._evict(conn)
+        except sqlite3.OperationalError:
+            # Locked by another worker: skipping one store is cheaper than waiting.
+            pass
+
+    def _evict(self, conn):
+        conn.execute('DELETE FROM pages WHERE expires_at <= ?', (time.time(),))
+        conn.execute(
+            'DELETE FROM pages WHERE key IN ('
+            ' SELECT key FROM pages ORDER BY expires_at ASC'
+            ' LIMIT max(0, (SELECT count(*) FROM pages) - ?))',
+            (self.max_rows,),
+        )
+
+    def invalidate(self, payment_ids=(), subscription_ids=()):
+        conn = self._connect()
+        payment_ids, subscription_ids = list(payment_ids), list(subscription_ids)
+        if payment_ids:
+            conn.execute(
+                f"DELETE FROM pages WHERE payment_id IN ({','.join('?' * len(payment_ids))})", payment_ids
+            )
+        if subscription_ids:
+            conn.execute(
+                f"DELETE FROM pages WHERE subscription_id IN ({','.join('?' * len(subscription_ids))})",
+                subscription_ids,
+            )
+
+    def clear(self):
+        self._connect().execute('DELETE FROM pages')
+
+
+def get_store():
+    store = current_app.extensions.get('page_cache')
+    if store is None:
+        path = current_app.config.get('PAGE_CACHE_PATH')
+        store = SqlitePageStore(path) if path else MemoryPageStore()
+        store = current_app.extensions.setdefault('page_cache', store)
+    return store
+
+
+def _defer(session, payment_ids=(), subscription_ids=()):
+    stale = session.info.setdefault('stale_pages', (set(), set()))
+    stale[0].update(payment_ids)
+    stale[1].update(subscription_ids)
+
+
+def invalidate_payment_ids(payment_ids):
+    """Drop pages of payments changed by a set-based write, once it commits."""
+    _defer(db.session(), payment_ids=payment_ids)
+
+
+def invalidate_subscription_ids(subscription_ids):
+    """Drop pages of subscriptions changed by a set-based write, once it commits."""
+    _defer(db.session(), subscription_ids=subscription_ids)
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_stale_pages(session, flush_context):
+    payment_ids = set()
+    subscription_ids = set()
+    for obj in list(session.dirty) + list(session.deleted):
+        if isinstance(obj, Payment) and obj.id is not None:
+            payment_ids.add(obj.id)
+        elif isinstance(obj, Subscription) and obj.id is not None:
+            subscription_ids.add(obj.id)
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, Delivery) and obj.subscription_id is not None:
+            subscription_ids.add(obj.subscription_id)
+    if payment_ids or subscription_ids:
+        _defer(session, payment_ids, subscription_ids)
+
+
+@event.listens_for(Session, 'after_commit')
+def _drop_stale_pages(session):
+    stale = session.info.pop('stale_pages', None)
+    if stale and has_app_context():
+        get_store().invalidate(payment_ids=stale[0], subscription_ids=stale[1])
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_stale_pages(session):
+    session.info.pop('stale_pages', None)
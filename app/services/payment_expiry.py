@@ -0,0 +1,116 @@
+# app/services/payment_expiry.py
+"""Expire manual payment requests that were never paid.
+
+Every abandoned signup leaves a pending ``Payment`` behind.  This job moves
+pending rows older than ``PENDING_PAYMENT_MAX_AGE_HOURS`` to ``Expired`` in
+chunked ``UPDATE ... WHERE id IN (...) RETURNING id`` statements so the
+pending queue only holds live requests.  Only the ids the UPDATE actually
+changed are audited, so a payment confirmed mid-run is not logged as expired.
+
+Scheduling: with ``PAYMENT_EXPIRY_SCHEDULE=thread`` (default) each web
+process runs the job every ``PAYMENT_EXPIRY_INTERVAL_SECONDS`` on a daemon
+thread.  The job is idempotent, so overlapping runs from several processes
+only cost an indexed probe.  Set it to ``off`` and use cron instead, e.g.::
+
+    15 * * * *  cd /app && flask --app run expire-pending-payments
+"""
+
+import os
+import threading
+from datetime import datetime, timedelta
+
+from sqlalchemy import update
+
+from app.models import ManualPaymentStatus, Payment, PaymentStatus, db, record_batch_audit
+from app.services import page_cache, receipt_cache
+
+PENDING_PAYMENT_MAX_AGE_HOURS = int(os.getenv('PENDING_PAYMENT_MAX_AGE_HOURS', '72'))
+PAYMENT_EXPIRY_INTERVAL_SECONDS = int(os.getenv('PAYMENT_EXPIRY_INTERVAL_SECONDS', '3600'))
+EXPIRY_CHUNK_SIZE = 500
+
+
+def expire_stale_payments(max_age_hours=None, chunk_size=EXPIRY_CHUNK_SIZE, now=None):
+    """Expire pending payments older than ``max_age_hours``; returns the number expired."""
+    now = now or datetime.utcnow()
+    max_age_hours = PENDING_PAYMENT_MAX_AGE_HOURS if max_age_hours is None else max_age_hours
+    cutoff = now - timedelta(hours=max_age_hours)
+    total = 0
+
+    while True:
+        ids = [
+            row.id for row in db.session.query(Payment.id).filter(
+                Payment.payment_status == ManualPaymentStatus.PENDING.value,
+                Payment.payment_date < cutoff,
+            ).order_by(Payment.id.asc()).limit(chunk_size)
+        ]
+        if not ids:
+            break
+
+        changes = {
+            'status': PaymentStatus.EXPIRED.value,
+            'payment_status': ManualPaymentStatus.EXPIRED.value,
+            'manual_payment_status': ManualPaymentStatus.EXPIRED.value,
+        }
+        # Re-check the status so a payment confirmed mid-run is left alone.
+        expired = db.session.execute(
+            update(Payment).where(
+                Payment.id.in_(ids),
+                Payment.payment_status == ManualPaymentStatus.PENDING.value,
+            ).values(changes).returning(Payment.id).execution_options(synchronize_session=False)
+        ).scalars().all()
+        if expired:
+            receipt_cache.invalidate_payment_ids(expired)
+            page_cache.invalidate_payment_ids(expired)
+            record_batch_audit(db.session, Payment.__tablename__, 'bulk_expire', expired, changes)
+        db.session.commit()
+        total += len(expired)
+
+        if len(ids) < chunk_size:
+            break
+
+    return total
+
+
+class ExpiryScheduler:
+    """Daemon thread running ``expire_stale_payments`` every ``interval`` seconds."""
+
+    def __init__(self, app, interval=PAYMENT_EXPIRY_INTERVAL_SECONDS):
+        self.app = app
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        with self._lock:
+            if not self.running:
+                self._thread = threading.Thread(target=self.run, name='payment-expiry', daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def run(self):
+        while not self._stop.wait(self.interval):
+            with self.app.app_context():
+                try:
+                    expire_stale_payments()
+                except Exception as exc:  # noqa: BLE001 - keep the schedule alive across DB hiccups
+                    print(f"Payment expiry job error: {exc}")
+                finally:
+                    db.session.remove()
+
+
+def init_app(app):
+    if app.config.get('PAYMENT_EXPIRY_SCHEDULE', 'thread') != 'thread':
+        return
+    scheduler = app.extensions.setdefault('payment_expiry', ExpiryScheduler(app))
+
+    @app.before_request
+    def _start_expiry_scheduler():
+        if not scheduler.running:
+            scheduler.start()
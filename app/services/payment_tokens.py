@@ -0,0 +1,170 @@
+# app/services/payment_tokens.py
+"""Single-probe resolution of customer-facing payment tokens.
+
+Tracking codes, payment references and checkout ids are all stored,
+canonicalized (stripped and upper-cased), as primary keys of
+``payment_tokens`` together with the owning payment and subscription.  Public
+tracking, receipt and status endpoints resolve whatever token the customer has
+with one index probe instead of an ``OR`` across three payment columns.
+
+Like the search index, rows are kept current by a session ``after_flush``
+hook; bulk payment inserts/deletes must call ``index_payments`` /
+``purge_subscription_payments`` themselves.  ``flask payment-tokens-reindex``
+rebuilds the table from scratch.
+"""
+
+from sqlalchemy import delete, event, inspect, select
+from sqlalchemy.orm import Session
+
+from app.models import Payment, PaymentToken, db
+from app.services import single_flight, token_filter
+
+TOKEN_FIELDS = ('tracking_code', 'reference_id', 'checkout_request_id')
+REINDEX_CHUNK_SIZE = 1000
+
+_probes = single_flight.group('payment_tokens')
+
+
+def canonical_token(raw):
+    return (raw or '').strip().upper()[:100]
+
+
+def resolve(raw):
+    """Return the ``(token, payment_id, subscription_id)`` row for a token, or None.
+
+    Tokens the in-process filter rules out are answered without SQL, and
+    concurrent probes for the same token share one query.
+    """
+    token = canonical_token(raw)
+    if not token:
+        return None
+    guard = token_filter.get_filter()
+    if not guard.may_exist(token):
+        return None
+    return _probes.do(token, lambda: _probe(guard, token))
+
+
+def _probe(guard, token):
+    row = db.session.execute(
+        select(PaymentToken.token, PaymentToken.payment_id, PaymentToken.subscription_id).where(
+            PaymentToken.token == token
+        )
+    ).first()
+    if row is None:
+        guard.remember_missing(token)
+    return row
+
+
+def resolve_payments(raws):
+    """Resolve many tokens with one joined ``IN`` query; returns ``{raw: Payment}`` for those found."""
+    guard = token_filter.get_filter()
+    wanted = {}
+    for raw in raws:
+        token = canonical_token(raw)
+        if token and guard.may_exist(token):
+            wanted.setdefault(token, []).append(raw)
+    if not wanted:
+        return {}
+
+    found = {}
+    rows = db.session.execute(
+        select(PaymentToken.token, Payment).join(Payment, Payment.id == PaymentToken.payment_id).where(
+            PaymentToken.token.in_(list(wanted))
+        )
+    )
+    for token, payment in rows:
+        for raw in wanted.pop(token):
+            found[raw] = payment
+    for token in wanted:
+        guard.remember_missing(token)
+    return found
+
+
+def resolve_payment(raw):
+    row = resolve(raw)
+    return db.session.get(Payment, row.payment_id) if row else None
+
+
+def purge_payments(connection, payment_ids):
+    payment_ids = list(payment_ids)
+    if payment_ids:
+        connection.execute(delete(PaymentToken).where(PaymentToken.payment_id.in_(payment_ids)))
+
+
+def purge_subscription_payments(connection, subscription_ids):
+    """Drop tokens ahead of a bulk ``Payment`` delete keyed by subscription."""
+    subscription_ids = list(subscription_ids)
+    if subscription_ids:
+        payment_ids = select(Payment.id).where(Payment.subscription_id.in_(subscription_ids))
+        connection.execute(delete(PaymentToken).where(PaymentToken.payment_id.in_(payment_ids)))
+
+
+def index_payments(connection, payments):
+    """Replace the token rows of ``payments``; a token already owned by another payment is kept.
+
+    Returns the set of tokens written, for the in-process token filter.
+    """
+    wanted = {}
+    for payment in payments:
+        if payment.id is None:
+            continue
+        for field in TOKEN_FIELDS:
+            token = canonical_token(getattr(payment, field))
+            if token:
+                wanted.setdefault(token, (payment.id, payment.subscription_id))
+    if not wanted:
+        return set()
+
+    payment_ids = {payment_id for payment_id, _ in wanted.values()}
+    purge_payments(connection, payment_ids)
+    taken = set(connection.execute(
+        select(PaymentToken.token).where(PaymentToken.token.in_(list(wanted)))
+    ).scalars())
+    rows = [
+        {'token': token, 'payment_id': payment_id, 'subscription_id': subscription_id}
+        for token, (payment_id, subscription_id) in wanted.items()
+        if token not in taken
+    ]
+    if rows:
+        connection.execute(PaymentToken.__table__.insert(), rows)
+    return {row['token'] for row in rows}
+
+
+def _token_fields_changed(payment):
+    state = inspect(payment)
+    return any(state.attrs[attr].history.has_changes() for attr in TOKEN_FIELDS + ('subscription_id',))
+
+
+@event.listens_for(Session, 'after_flush')
+def _sync_payment_tokens(session, flush_context):
+    changed = [obj for obj in session.new if isinstance(obj, Payment)]
+    changed.extend(obj for obj in session.dirty if isinstance(obj, Payment) and _token_fields_changed(obj))
+    removed = {obj.id for obj in session.deleted if isinstance(obj, Payment) and obj.id is not None}
+    if not changed and not removed:
+        return
+
+    connection = session.connection()
+    purge_payments(connection, removed)
+    issued = index_payments(connection, changed)
+    if issued:
+        # Published to the token filter on commit (see token_filter).
+        session.info.setdefault('issued_tokens', set()).update(issued)
+
+
+def rebuild_tokens(chunk_size=REINDEX_CHUNK_SIZE):
+    """Rebuild ``payment_tokens`` from scratch, streaming payments in chunks."""
+    db.session.execute(delete(PaymentToken))
+    total = 0
+    last_id = 0
+    while True:
+        batch = db.session.query(
+            Payment.id, Payment.subscription_id, *(getattr(Payment, f) for f in TOKEN_FIELDS)
+        ).filter(Payment.id > last_id).order_by(Payment.id.asc()).limit(chunk_size).all()
+        if not batch:
+            break
+        index_payments(db.session.connection(), batch)
+        total += len(batch)
+        last_id = batch[-1].id
+        db.session.commit()
+    db.session.commit()
+    return total
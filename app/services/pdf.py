@@ -0,0 +1,178 @@
+# app/services/pdf.py
+"""Minimal dependency-free PDF writer for receipts, slips and statements.
+
+Documents are a sequence of rows (plain lines or table rows) laid out on A4
+pages with Helvetica.  Rows are paginated automatically and can come from a
+generator, so ``PdfDocument.iter_bytes()`` streams arbitrarily long documents
+while only holding the current page and the xref offsets in memory.
+``render_lines`` is the drop-in for the old single-page ``_simple_pdf``.
+
+Object layout: 1 = catalog, 2 = page tree (written last, once all kids are
+known), 3/4 = regular/bold fonts, then a (page, content stream) pair per page.
+"""
+
+import textwrap
+import time
+
+PAGE_WIDTH = 595
+PAGE_HEIGHT = 842
+MARGIN_LEFT = 50
+MARGIN_TOP = 52
+MARGIN_BOTTOM = 50
+FONT_SIZE = 12
+LEADING = 14
+# Helvetica averages roughly half an em per glyph; wrap conservatively.
+WRAP_CHARS = int((PAGE_WIDTH - 2 * MARGIN_LEFT) / (FONT_SIZE * 0.5))
+ROWS_PER_PAGE = (PAGE_HEIGHT - MARGIN_TOP - MARGIN_BOTTOM - LEADING) // LEADING
+
+_HEADER = b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n"
+_CATALOG = b"1 0 obj << /Type /Catalog /Pages 2 0 R >> endobj\n"
+_FONTS = (
+    b"3 0 obj << /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >> endobj\n",
+    b"4 0 obj << /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold /Encoding /WinAnsiEncoding >> endobj\n",
+)
+_FIRST_PAGE_OBJ = 5
+_ESCAPES = str.maketrans({"\\": "\\\\", "(": "\\(", ")": "\\)", "\r": " ", "\n": " "})
+
+
+def escape_pdf(text):
+    return str(text or "").translate(_ESCAPES)
+
+
+def _cell_op(x, y, text, bold):
+    font = "/F2" if bold else "/F1"
+    return f"{font} {FONT_SIZE} Tf 1 0 0 1 {x} {y} Tm ({escape_pdf(text)}) Tj"
+
+
+class PdfDocument:
+    """Collects rows lazily and renders them as a paginated PDF."""
+
+    def __init__(self, footer=None):
+        self._parts = []
+        self.footer = footer
+
+    def line(self, text="", bold=False):
+        self._parts.append([(bold, [(0, text)])])
+        return self
+
+    def lines(self, texts, bold=False):
+        self._parts.append((bold, [(0, text)]) for text in texts)
+        return self
+
+    def table(self, headers, rows, widths):
+        """Lay out ``rows`` (any iterable, may be a generator) in columns of ``widths`` points."""
+        offsets = []
+        x = 0
+        for width in widths:
+            offsets.append(x)
+            x += width
+        max_chars = [max(1, int(width / (FONT_SIZE * 0.5)) - 1) for width in widths]
+
+        def cells(values):
+            return [(offset, str(value)[:limit]) for offset, limit, value in zip(offsets, max_chars, values)]
+
+        if headers:
+            self._parts.append([(True, cells(headers))])
+        self._parts.append((False, cells(values)) for values in rows)
+        return self
+
+    def _rows(self):
+        for part in self._parts:
+            for bold, cells in part:
+                if len(cells) == 1 and len(cells[0][1] or "") > WRAP_CHARS:
+                    offset, text = cells[0]
+                    for wrapped in textwrap.wrap(text, WRAP_CHARS) or [""]:
+                        yield bold, [(offset, wrapped)]
+                else:
+                    yield bold, cells
+
+    def _pages(self):
+        page = []
+        emitted = False
+        for row in self._rows():
+            page.append(row)
+            if len(page) >= ROWS_PER_PAGE:
+                yield page
+                emitted = True
+                page = []
+        if page or not emitted:
+            yield page
+
+    def _content_stream(self, page_rows, page_number):
+        ops = ["BT"]
+        y = PAGE_HEIGHT - MARGIN_TOP
+        for bold, cells in page_rows:
+            for offset, text in cells:
+                ops.append(_cell_op(MARGIN_LEFT + offset, y, text, bold))
+            y -= LEADING
+        footer = f"{self.footer} - Page {page_number}" if self.footer else f"Page {page_number}"
+        ops.append(f"/F1 9 Tf 1 0 0 1 {MARGIN_LEFT} {MARGIN_BOTTOM - 20} Tm ({escape_pdf(footer)}) Tj")
+        ops.append("ET")
+        return "\n".join(ops).encode("cp1252", "replace")
+
+    def iter_bytes(self):
+        """Yield the PDF in chunks: header and static objects, then one chunk per page."""
+        position = 0
+        offsets = {}
+
+        def emit(obj_number, data):
+            nonlocal position
+            offsets[obj_number] = position
+            position += len(data)
+            return data
+
+        head = bytearray(_HEADER)
+        position = len(head)
+        head += emit(1, _CATALOG)
+        for number, font in enumerate(_FONTS, start=3):
+            head += emit(number, font)
+        yield bytes(head)
+
+        kids = []
+        obj_number = _FIRST_PAGE_OBJ
+        for page_number, page_rows in enumerate(self._pages(), start=1):
+            page_obj, content_obj = obj_number, obj_number + 1
+            obj_number += 2
+            kids.append(page_obj)
+            stream = self._content_stream(page_rows, page_number)
+            chunk = bytearray()
+            chunk += emit(page_obj, (
+                f"{page_obj} 0 obj << /Type /Page /Parent 2 0 R /MediaBox [0 0 {PAGE_WIDTH} {PAGE_HEIGHT}] "
+                f"/Resources << /Font << /F1 3 0 R /F2 4 0 R >> >> /Contents {content_obj} 0 R >> endobj\n"
+            ).encode("ascii"))
+            chunk += emit(content_obj, b"".join((
+                f"{content_obj} 0 obj << /Length {len(stream)} >> stream\n".encode("ascii"),
+                stream,
+                b"\nendstream endobj\n",
+            )))
+            yield bytes(chunk)
+
+        tail = bytearray()
+        tail += emit(2, (
+            f"2 0 obj << /Type /Pages /Kids [{' '.join(f'{k} 0 R' for k in kids)}] /Count {len(kids)} >> endobj\n"
+        ).encode("ascii"))
+        xref_pos = position
+        size = obj_number
+        xref = [f"xref\n0 {size}\n", "0000000000 65535 f \n"]
+        xref.extend(f"{offsets[number]:010d} 00000 n \n" for number in range(1, size))
+        xref.append(f"trailer << /Size {size} /Root 1 0 R >>\nstartxref\n{xref_pos}\n%%EOF")
+        tail += "".join(xref).encode("ascii")
+        yield bytes(tail)
+
+    def render(self):
+        return b"".join(self.iter_bytes())
+
+
+def render_lines(lines, footer=None):
+    """Render plain text lines as a (multi-page if needed) PDF document."""
+    return PdfDocument(footer=footer).lines(lines).render()
+
+
+def benchmark(count=1000, lines_per_receipt=13):
+    """Render ``count`` receipt-sized documents; returns receipts per second."""
+    sample = [f"Receipt line {i}: NESTGOLD-12345-1700000000 KES 1,000.00" for i in range(lines_per_receipt)]
+    started = time.perf_counter()
+    for _ in range(count):
+        render_lines(sample)
+    elapsed = time.perf_counter() - started
+    return count / elapsed if elapsed else float("inf")
@@ -0,0 +1,276 @@
+# app/services/receipt_cache.py
+"""Content-addressed on-disk cache for generated receipts and payment slips.
+
+Layout under ``RECEIPT_CACHE_DIR`` (default ``<instance>/receipt_cache``)::
+
+    objects/ab/<sha256>    rendered body, named by a hash of its input fields
+    pointers/<kind>/<sha1> "etag, filename, mimetype" for a customer-facing token
+
+A download first reads the pointer for ``(kind, token)``; when it and its
+object exist the body is served with ``send_file`` (stat + sendfile) and a
+strong ETag, so ``If-None-Match`` revalidations end in a 304 without touching
+the database.  Pointers are dropped on commit when a payment, its
+subscription, a plan or the payment config changed in that transaction;
+set-based writes register their rows through ``invalidate_payment_ids`` /
+``invalidate_subscription_ids`` before updating them.  A render that races
+such a commit can still write its pointer afterwards, so pointers also
+expire after ``RECEIPT_POINTER_TTL_SECONDS``; the next download re-reads the
+database and re-points at the (usually unchanged) object.
+Objects are evicted least-recently-used once the directory outgrows
+``RECEIPT_CACHE_MAX_BYTES``.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from flask import current_app, has_app_context, send_file
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+
+from app.models import Payment, PaymentConfig, Subscription, SubscriptionPlan, db
+
+KIND_TRACK = 'track'
+KIND_SUCCESS = 'success'
+KIND_ADMIN = 'admin'
+TOKEN_KINDS = (KIND_TRACK, KIND_SUCCESS)
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+# Hits refresh the object's mtime (its LRU clock) at most this often.
+TOUCH_INTERVAL_SECONDS = 60
+RECEIPT_POINTER_TTL_SECONDS = int(os.getenv('RECEIPT_POINTER_TTL_SECONDS', '600'))
+
+
+def _token_key(token):
+    return hashlib.sha1(str(token).strip().upper().encode('utf-8')).hexdigest()
+
+
+def content_key(kind, filename, fields):
+    payload = json.dumps([kind, filename, list(fields)], default=str, separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class ReceiptCache:
+    def __init__(self, root, max_bytes=DEFAULT_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._approx_bytes = None
+
+    def _object_path(self, key):
+        return os.path.join(self.root, 'objects', key[:2], key)
+
+    def _pointer_path(self, kind, token):
+        return os.path.join(self.root, 'pointers', kind, _token_key(token))
+
+    def lookup(self, kind, token):
+        """Return ``(etag, path, filename, mimetype)`` for a cached token, else None."""
+        try:
+            with open(self._pointer_path(kind, token), encoding='utf-8') as handle:
+                if time.time() - os.fstat(handle.fileno()).st_mtime > RECEIPT_POINTER_TTL_SECONDS:
+                    return None
+                etag, filename, mimetype = handle.read().split('\n', 2)
+            path = self._object_path(etag)
+            mtime = os.stat(path).st_mtime
+        except (OSError, ValueError):
+            return None
+        if time.time() - mtime > TOUCH_INTERVAL_SECONDS:
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+        return etag, path, filename, mimetype
+
+    def store(self, kind, tokens, filename, mimetype, fields, render):
+        """Persist ``render()`` under the hash of ``fields`` and point ``tokens`` at it.
+
+        The first writer of a key wins, so every response for one ETag carries
+        identical bytes even if two workers render concurrently.
+        """
+        etag = content_key(kind, filename, fields)
+        path = self._object_path(etag)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            body = render()
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+            try:
+                with os.fdopen(fd, 'wb') as handle:
+                    handle.write(body)
+                os.link(tmp, path)
+                self._account(len(body))
+            except FileExistsError:
+                pass
+            finally:
+                os.unlink(tmp)
+
+        pointer_dir = os.path.join(self.root, 'pointers', kind)
+        os.makedirs(pointer_dir, exist_ok=True)
+        for token in {t for t in tokens if t}:
+            fd, tmp = tempfile.mkstemp(dir=pointer_dir)
+            with os.fdopen(fd, 'w', encoding='utf-8') as handle:
+                handle.write(f'{etag}\n{filename}\n{mimetype}')
+            os.replace(tmp, self._pointer_path(kind, token))
+        return etag, path, filename, mimetype
+
+    def invalidate(self, kind_tokens):
+        for kind, token in kind_tokens:
+            if not token:
+                continue
+            try:
+                os.unlink(self._pointer_path(kind, token))
+            except FileNotFoundError:
+                pass
+
+    def clear_pointers(self):
+        shutil.rmtree(os.path.join(self.root, 'pointers'), ignore_errors=True)
+
+    def _account(self, size):
+        with self._lock:
+            if self._approx_bytes is None:
+                self._approx_bytes = sum(os.path.getsize(p) for p, _ in self._objects())
+            else:
+                self._approx_bytes += size
+            over = self._approx_bytes > self.max_bytes
+        if over:
+            self.evict()
+
+    def _objects(self):
+        base = os.path.join(self.root, 'objects')
+        for dirpath, _, filenames in os.walk(base):
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                try:
+                    yield path, os.stat(path).st_mtime
+                except FileNotFoundError:
+                    continue
+
+    def evict(self, target_ratio=0.8):
+        """Delete least-recently-used objects until under ``target_ratio`` of the budget."""
+        with self._lock:
+            entries = sorted(self._objects(), key=lambda item: item[1])
+            total = sum(os.path.getsize(path) for path, _ in entries if os.path.exists(path))
+            target = self.max_bytes * target_ratio
+            for path, _ in entries:
+                if total <= target:
+                    break
+                try:
+                    size = os.path.getsize(path)
+                    os.unlink(path)
+                    total -= size
+                except FileNotFoundError:
+                    continue
+            self._approx_bytes = total
+
+
+def get_cache():
+    cache = current_app.extensions.get('receipt_cache')
+    if cache is None:
+        root = current_app.config.get('RECEIPT_CACHE_DIR') or os.path.join(current_app.instance_path, 'receipt_cache')
+        cache = ReceiptCache(root, current_app.config.get('RECEIPT_CACHE_MAX_BYTES', DEFAULT_MAX_BYTES))
+        current_app.extensions['receipt_cache'] = cache
+    return cache
+
+
+def send_cached(entry):
+    etag, path, filename, mimetype = entry
+    response = send_file(
+        path,
+        mimetype=mimetype,
+        as_attachment=True,
+        download_name=filename,
+        etag=etag,
+        conditional=True,
+    )
+    response.cache_control.private = True
+    return response
+
+
+def payment_kind_tokens(payment_id, tracking_code=None, reference_id=None, checkout_request_id=None):
+    pairs = [(KIND_ADMIN, str(payment_id))]
+    for kind in TOKEN_KINDS:
+        pairs.extend((kind, token) for token in (tracking_code, reference_id, checkout_request_id) if token)
+    return pairs
+
+
+def _subscription_payment_tokens(connection, subscription_ids):
+    rows = connection.execute(select(
+        Payment.id, Payment.tracking_code, Payment.reference_id, Payment.checkout_request_id
+    ).where(Payment.subscription_id.in_(list(subscription_ids))))
+    pairs = []
+    for row in rows:
+        pairs.extend(payment_kind_tokens(row.id, row.tracking_code, row.reference_id, row.checkout_request_id))
+    return pairs
+
+
+def _defer(session, pairs):
+    """Queue pointer removals until commit, so a concurrent download cannot re-cache old rows."""
+    session.info.setdefault('receipt_cache_stale', set()).update(pairs)
+
+
+def invalidate_payment_ids(payment_ids):
+    payment_ids = list(payment_ids)
+    if not payment_ids:
+        return
+    rows = db.session.execute(select(
+        Payment.id, Payment.tracking_code, Payment.reference_id, Payment.checkout_request_id
+    ).where(Payment.id.in_(payment_ids)))
+    pairs = []
+    for row in rows:
+        pairs.extend(payment_kind_tokens(row.id, row.tracking_code, row.reference_id, row.checkout_request_id))
+    _defer(db.session(), pairs)
+
+
+def invalidate_subscription_ids(subscription_ids):
+    subscription_ids = list(subscription_ids)
+    if subscription_ids:
+        _defer(db.session(), _subscription_payment_tokens(db.session.connection(), subscription_ids))
+
+
+def _payment_tokens_with_history(payment):
+    state = db.inspect(payment)
+    pairs = payment_kind_tokens(payment.id, payment.tracking_code, payment.reference_id, payment.checkout_request_id)
+    for attr in ('tracking_code', 'reference_id', 'checkout_request_id'):
+        for old in state.attrs[attr].history.deleted or ():
+            pairs.extend((kind, old) for kind in TOKEN_KINDS)
+    return pairs
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_stale_receipts(session, flush_context):
+    pairs = []
+    subscription_ids = set()
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, Payment) and obj.id is not None and obj not in session.new:
+            pairs.extend(_payment_tokens_with_history(obj))
+        elif isinstance(obj, Subscription) and obj.id is not None and obj not in session.new:
+            subscription_ids.add(obj.id)
+        elif isinstance(obj, (PaymentConfig, SubscriptionPlan)) and obj not in session.new:
+            session.info['receipt_cache_clear'] = True
+
+    if subscription_ids:
+        pairs.extend(_subscription_payment_tokens(session.connection(), subscription_ids))
+    if pairs:
+        _defer(session, pairs)
+
+
+@event.listens_for(Session, 'after_commit')
+def _drop_stale_receipts(session):
+    stale = session.info.pop('receipt_cache_stale', None)
+    clear_all = session.info.pop('receipt_cache_clear', False)
+    if not (stale or clear_all) or not has_app_context():
+        return
+    cache = get_cache()
+    if clear_all:
+        cache.clear_pointers()
+    else:
+        cache.invalidate(stale)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_stale_receipts(session):
+    session.info.pop('receipt_cache_stale', None)
+    session.info.pop('receipt_cache_clear', None)
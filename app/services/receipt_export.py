@@ -0,0 +1,187 @@
+# app/services/receipt_export.py
+"""Month-end ZIP archives of receipts for every confirmed payment in a date range.
+
+Payments are read in keyset chunks as plain column rows (nothing lands in the
+session identity map), receipt lines are built in the parent, and PDF
+rendering is fanned out to a ``ProcessPoolExecutor`` in batches.  At most
+two batches per worker are outstanding at once and finished batches are
+written to the ZIP in payment id order, so memory stays flat no matter how
+many receipts match.
+
+The ZIP is produced piece by piece into an unseekable sink, so the same
+generator backs both the streamed admin download and the CLI file export.
+The admin download renders in the request's own process (``workers=1``);
+forking a web worker that holds DB connections and threads is not safe.
+The pool is for the CLI, and starts its workers with ``spawn`` in any case.
+"""
+
+import multiprocessing
+import os
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from app.models import ManualPaymentStatus, Payment, Subscription, SubscriptionPlan, db
+from app.services.pdf import render_lines
+
+RECEIPT_EXPORT_WORKERS = int(os.getenv('RECEIPT_EXPORT_WORKERS', '0')) or os.cpu_count() or 1
+RECEIPT_EXPORT_BATCH_SIZE = 200
+RECEIPT_EXPORT_CHUNK_SIZE = 2000
+# Exports smaller than this are rendered in-process; a pool costs more than it saves.
+RECEIPT_EXPORT_POOL_THRESHOLD = 500
+
+
+def admin_receipt_lines(payment, customer_name, customer_phone, plan_name, trays_remaining):
+    """Receipt body shared by the single admin download and the bulk export."""
+    ref = payment.admin_transaction_reference or payment.reference_id or payment.checkout_request_id or "-"
+    paid_at = payment.payment_date.strftime("%Y-%m-%d %H:%M:%S") if payment.payment_date else "-"
+    return [
+        "NESTGOLD PROVISIONS - RECEIPT",
+        "----------------------------------------",
+        f"Payment ID: {payment.id}",
+        f"Reference: {ref}",
+        f"Customer: {customer_name or '-'}",
+        f"Phone: {customer_phone or '-'}",
+        f"Amount (KES): {payment.amount:.2f}",
+        f"Payment Status: {payment.payment_status}",
+        f"Confirmed At: {paid_at}",
+        f"Plan: {plan_name or '-'}",
+        f"Trays Remaining: {trays_remaining or 0}",
+    ]
+
+
+def _iter_confirmed(start, end, chunk_size):
+    last_id = 0
+    while True:
+        rows = db.session.query(
+            Payment.id,
+            Payment.admin_transaction_reference,
+            Payment.reference_id,
+            Payment.checkout_request_id,
+            Payment.payment_date,
+            Payment.amount,
+            Payment.payment_status,
+            Payment.customer_name,
+            Payment.customer_phone,
+            Subscription.name.label('sub_name'),
+            Subscription.phone.label('sub_phone'),
+            Subscription.trays_remaining,
+            SubscriptionPlan.name.label('plan_name'),
+        ).outerjoin(
+            Subscription, Payment.subscription_id == Subscription.id
+        ).outerjoin(
+            SubscriptionPlan, Subscription.plan_id == SubscriptionPlan.id
+        ).filter(
+            Payment.payment_status == ManualPaymentStatus.CONFIRMED.value,
+            Payment.payment_date >= start,
+            Payment.payment_date < end,
+            Payment.id > last_id,
+        ).order_by(Payment.id.asc()).limit(chunk_size).all()
+        if not rows:
+            return
+        yield from rows
+        last_id = rows[-1].id
+        if len(rows) < chunk_size:
+            return
+
+
+def _iter_jobs(start, end, chunk_size):
+    for row in _iter_confirmed(start, end, chunk_size):
+        lines = admin_receipt_lines(
+            row,
+            row.customer_name or row.sub_name,
+            row.customer_phone or row.sub_phone,
+            row.plan_name,
+            row.trays_remaining,
+        )
+        yield f"receipt_{row.id}.pdf", lines
+
+
+def _batched(jobs, size):
+    batch = []
+    for job in jobs:
+        batch.append(job)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _render_batch(batch):
+    return [(name, render_lines(lines)) for name, lines in batch]
+
+
+def _rendered_batches(batches, workers):
+    """Render batches in a process pool with a bounded window, in submission order."""
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+        window = deque()
+        for batch in batches:
+            window.append(pool.submit(_render_batch, batch))
+            if len(window) >= workers * 2:
+                yield window.popleft().result()
+        while window:
+            yield window.popleft().result()
+
+
+def count_confirmed(start, end):
+    return Payment.query.filter(
+        Payment.payment_status == ManualPaymentStatus.CONFIRMED.value,
+        Payment.payment_date >= start,
+        Payment.payment_date < end,
+    ).count()
+
+
+class _ChunkSink:
+    """Write-only, unseekable file object whose bytes are drained by the caller."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        chunks, self._chunks = self._chunks, []
+        return b"".join(chunks)
+
+
+def iter_receipt_archive(start, end, workers=None, batch_size=RECEIPT_EXPORT_BATCH_SIZE,
+                         chunk_size=RECEIPT_EXPORT_CHUNK_SIZE, stats=None):
+    """Yield a ZIP of receipts for payments confirmed in ``[start, end)``, one piece per batch.
+
+    Entries are stored uncompressed: the PDFs are small and the parent process
+    would otherwise become the bottleneck the pool is there to remove.  Pass a
+    dict as ``stats`` to receive the number of receipts written.
+    """
+    workers = workers or RECEIPT_EXPORT_WORKERS
+    stats = stats if stats is not None else {}
+    stats['receipts'] = 0
+    batches = _batched(_iter_jobs(start, end, chunk_size), batch_size)
+    if workers > 1 and count_confirmed(start, end) >= RECEIPT_EXPORT_POOL_THRESHOLD:
+        rendered = _rendered_batches(batches, workers)
+    else:
+        rendered = (_render_batch(batch) for batch in batches)
+
+    sink = _ChunkSink()
+    stamp = datetime.utcnow().timetuple()[:6]
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_STORED) as archive:
+        for results in rendered:
+            for name, body in results:
+                archive.writestr(zipfile.ZipInfo(name, date_time=stamp), body)
+            stats['receipts'] += len(results)
+            yield sink.drain()
+    yield sink.drain()
+
+
+def write_receipt_archive(fileobj, start, end, workers=None):
+    """Write the receipt ZIP to ``fileobj``; returns the number of receipts."""
+    stats = {}
+    for piece in iter_receipt_archive(start, end, workers=workers, stats=stats):
+        fileobj.write(piece)
+    return stats['receipts']
@@ -0,0 +1,304 @@
+# app/services/reconciliation.py
+"""Match downloaded M-Pesa/bank statements against pending manual payments.
+
+The statement CSV is read line by line; pending payments are loaded once into
+in-memory hash indexes (reference, tracking code, compact reference, and
+phone+amount), so each line is matched with dictionary probes rather than
+queries.  Confident matches are confirmed in batches through
+``Payment.confirm``; everything else that looks like a customer payment lands
+in the ``reconciliation_items`` review queue.  A phone+amount match alone is
+not confident (customers pay the same plan price again, or for someone
+else); it is confirmed only when the line also carries a reference or
+tracking token that is close to the same payment's.
+
+Memory is bounded by the pending-payment working set (kept small by the
+expiry job) plus one batch of statement lines.
+"""
+
+import csv
+import difflib
+import re
+import uuid
+from collections import defaultdict
+from datetime import datetime
+
+from sqlalchemy.orm import joinedload
+
+from app.models import ManualPaymentStatus, Payment, ReconciliationItem, Subscription, db
+
+RECONCILE_BATCH_SIZE = 1000
+FUZZY_CUTOFF = 0.85
+FUZZY_MAX_CANDIDATES = 2000
+
+REASON_REFERENCE = 'reference'
+REASON_TRACKING = 'tracking_code'
+REASON_PHONE_AMOUNT = 'phone_amount'
+REASON_FUZZY_REFERENCE = 'fuzzy_reference'
+REASON_AMOUNT_MISMATCH = 'amount_mismatch'
+REASON_AMBIGUOUS = 'ambiguous'
+REASON_UNMATCHED = 'unmatched'
+REASON_ALREADY_CONFIRMED = 'already_confirmed'
+
+# Lower-cased header aliases seen in M-Pesa org portal and common bank exports.
+COLUMN_ALIASES = {
+    'receipt': ('receipt no.', 'receipt no', 'receipt', 'transaction id', 'transaction reference', 'reference no'),
+    'time': ('completion time', 'transaction date', 'date', 'value date'),
+    'details': ('details', 'narration', 'description', 'particulars'),
+    'status': ('transaction status', 'status'),
+    'amount': ('paid in', 'credit', 'amount', 'deposit'),
+    'account': ('a/c no.', 'a/c no', 'account', 'account no', 'account number', 'bill ref number', 'reference'),
+    'phone': ('other party info', 'msisdn', 'phone', 'sender'),
+}
+
+_REFERENCE_RE = re.compile(r'NESTGOLD[\s_-]*\d+[\s_-]*\d+(?:[\s_-]*R)?', re.IGNORECASE)
+_PHONE_RE = re.compile(r'(?:\+?254|0)7\d{8}|(?:\+?254|0)1\d{8}')
+_TOKEN_RE = re.compile(r'[A-Z0-9]{8,}')
+_COMPACT_RE = re.compile(r'[^A-Z0-9]+')
+
+
+def _compact(value):
+    return _COMPACT_RE.sub('', (value or '').upper())
+
+
+def _parse_amount(value):
+    cleaned = (value or '').replace(',', '').replace('KES', '').replace('Ksh', '').strip()
+    try:
+        return round(float(cleaned), 2)
+    except ValueError:
+        return None
+
+
+def _resolve_columns(fieldnames):
+    by_lower = {(name or '').strip().lower(): name for name in fieldnames or []}
+    columns = {}
+    for key, aliases in COLUMN_ALIASES.items():
+        for alias in aliases:
+            if alias in by_lower:
+                columns[key] = by_lower[alias]
+                break
+    return columns
+
+
+def iter_statement_lines(text_stream):
+    """Yield normalized dicts for credit lines of a statement CSV, one at a time."""
+    reader = csv.DictReader(text_stream)
+    columns = _resolve_columns(reader.fieldnames)
+    if 'amount' not in columns:
+        raise ValueError('Statement has no recognizable amount / "Paid In" column.')
+
+    for raw in reader:
+        def col(key):
+            name = columns.get(key)
+            return (raw.get(name) or '').strip() if name else ''
+
+        status = col('status').lower()
+        if status and status != 'completed':
+            continue
+        amount = _parse_amount(col('amount'))
+        if not amount or amount <= 0:
+            continue
+
+        phone_match = _PHONE_RE.search(col('phone')) or _PHONE_RE.search(col('details'))
+        yield {
+            'receipt_no': col('receipt')[:50] or None,
+            'transaction_time': col('time')[:40] or None,
+            'amount': amount,
+            'phone': Subscription.normalize_phone(phone_match.group(0)) if phone_match else None,
+            'account_ref': col('account')[:100] or None,
+            'details': col('details') or None,
+        }
+
+
+class PendingIndex:
+    """In-memory hash indexes over the pending payment working set."""
+
+    def __init__(self):
+        self.amounts = {}
+        self.by_reference = {}
+        self.by_compact = {}
+        self.by_tracking = {}
+        self.by_phone_amount = defaultdict(set)
+        self.by_amount = defaultdict(dict)
+        self.taken = set()
+        self.seen_receipts = set()
+
+    @classmethod
+    def load(cls):
+        index = cls()
+        rows = db.session.query(
+            Payment.id, Payment.reference_id, Payment.tracking_code, Payment.customer_phone, Payment.amount
+        ).filter(
+            Payment.payment_status == ManualPaymentStatus.PENDING.value
+        ).execution_options(yield_per=RECONCILE_BATCH_SIZE)
+        for row in rows:
+            amount = round(float(row.amount or 0), 2)
+            index.amounts[row.id] = amount
+            if row.reference_id:
+                index.by_reference[row.reference_id.upper()] = row.id
+                index.by_compact[_compact(row.reference_id)] = row.id
+            if row.tracking_code:
+                index.by_tracking[row.tracking_code.upper()] = row.id
+            if row.customer_phone:
+                index.by_phone_amount[(Subscription.normalize_phone(row.customer_phone), amount)].add(row.id)
+            # Fuzzy keys are bucketed by amount so a near-miss only scans same-amount payments.
+            for key in (_compact(row.reference_id), (row.tracking_code or '').upper()):
+                if key:
+                    index.by_amount[amount][key] = row.id
+        return index
+
+    def _candidates(self, line):
+        text = ' '.join(filter(None, [line['account_ref'], line['details']])).upper()
+        references = [m.group(0) for m in _REFERENCE_RE.finditer(text)]
+        tokens = _TOKEN_RE.findall(text)
+        if line['account_ref']:
+            tokens.append(_compact(line['account_ref']))
+        return references, tokens
+
+    def match(self, line):
+        """Return ``(payment_id or None, reason, confident)`` for a statement line."""
+        references, tokens = self._candidates(line)
+        hit = None
+        for ref in references:
+            hit = self.by_reference.get(ref) or self.by_compact.get(_compact(ref))
+            if hit:
+                reason = REASON_REFERENCE
+                break
+        if not hit:
+            for token in tokens:
+                hit = self.by_tracking.get(token) or self.by_compact.get(token)
+                if hit:
+                    reason = REASON_TRACKING if token in self.by_tracking else REASON_REFERENCE
+                    break
+
+        if hit and hit not in self.taken:
+            if self.amounts.get(hit) == line['amount']:
+                return hit, reason, True
+            return hit, REASON_AMOUNT_MISMATCH, False
+
+        if line['phone']:
+            ids = self.by_phone_amount.get((line['phone'], line['amount']), set()) - self.taken
+            if len(ids) == 1:
+                payment_id = next(iter(ids))
+                corroborated = self._fuzzy_match(line['amount'], references, tokens) == payment_id
+                return payment_id, REASON_PHONE_AMOUNT, corroborated
+            if len(ids) > 1:
+                return min(ids), REASON_AMBIGUOUS, False
+
+        payment_id = self._fuzzy_match(line['amount'], references, tokens)
+        if payment_id:
+            return payment_id, REASON_FUZZY_REFERENCE, False
+
+        return None, REASON_UNMATCHED, False
+
+    def _fuzzy_match(self, amount, references, tokens):
+        """Closest untaken payment of the same amount to a near-miss reference or token."""
+        # Restricted to pending payments of the same amount to stay cheap.
+        keys = self.by_amount.get(amount)
+        if keys and len(keys) <= FUZZY_MAX_CANDIDATES and (references or tokens):
+            for probe in [_compact(r) for r in references] + tokens:
+                for close in difflib.get_close_matches(probe, keys.keys(), n=3, cutoff=FUZZY_CUTOFF):
+                    if keys[close] not in self.taken:
+                        return keys[close]
+        return None
+
+    def claim(self, payment_id):
+        self.taken.add(payment_id)
+
+
+def _known_receipts(receipts):
+    receipts = [r for r in receipts if r]
+    if not receipts:
+        return set()
+    seen = {row.mpesa_receipt for row in db.session.query(Payment.mpesa_receipt).filter(
+        Payment.mpesa_receipt.in_(receipts)
+    )}
+    seen.update(row.receipt_no for row in db.session.query(ReconciliationItem.receipt_no).filter(
+        ReconciliationItem.receipt_no.in_(receipts)
+    ))
+    return seen
+
+
+def _confirm_batch(matches, now):
+    """Confirm matched payments with one load query and one flush; returns the ids confirmed."""
+    if not matches:
+        return set()
+    payments = Payment.query.options(
+        joinedload(Payment.subscription).joinedload(Subscription.plan)
+    ).filter(
+        Payment.id.in_(matches.keys()),
+        Payment.payment_status == ManualPaymentStatus.PENDING.value,
+    ).all()
+    for payment in payments:
+        line, reason = matches[payment.id]
+        payment.confirm(
+            now=now,
+            method='M-Pesa',
+            transaction_reference=line['receipt_no'],
+            notes=f"Auto-reconciled from statement ({reason}).",
+        )
+        payment.mpesa_receipt = line['receipt_no']
+    return {payment.id for payment in payments}
+
+
+def _flush_batch(batch, index, import_batch, dry_run, now, stats):
+    known = _known_receipts(line['receipt_no'] for line in batch) | index.seen_receipts
+    matches = {}
+    review_rows = []
+
+    def queue_for_review(line, payment_id, reason):
+        review_rows.append(dict(
+            line,
+            import_batch=import_batch,
+            suggested_payment_id=payment_id,
+            match_reason=reason,
+            status=ReconciliationItem.STATUS_REVIEW,
+            created_at=now,
+        ))
+
+    for line in batch:
+        if line['receipt_no']:
+            if line['receipt_no'] in known:
+                stats['duplicates'] += 1
+                continue
+            known.add(line['receipt_no'])
+            index.seen_receipts.add(line['receipt_no'])
+        payment_id, reason, confident = index.match(line)
+        if payment_id and confident:
+            index.claim(payment_id)
+            matches[payment_id] = (line, reason)
+            continue
+        queue_for_review(line, payment_id, reason)
+
+    if dry_run:
+        stats['confirmed'] += len(matches)
+        stats['review'] += len(review_rows)
+        return
+
+    confirmed = _confirm_batch(matches, now)
+    for payment_id in matches.keys() - confirmed:
+        # Confirmed by an admin while the import was running.
+        queue_for_review(matches[payment_id][0], payment_id, REASON_ALREADY_CONFIRMED)
+    stats['confirmed'] += len(confirmed)
+    stats['review'] += len(review_rows)
+    if review_rows:
+        db.session.execute(ReconciliationItem.__table__.insert(), review_rows)
+    db.session.commit()
+
+
+def reconcile_statement(text_stream, dry_run=False, batch_size=RECONCILE_BATCH_SIZE, now=None):
+    """Reconcile a statement CSV stream; returns counters for the import."""
+    now = now or datetime.utcnow()
+    import_batch = uuid.uuid4().hex
+    index = PendingIndex.load()
+    stats = {'import_batch': import_batch, 'lines': 0, 'confirmed': 0, 'review': 0, 'duplicates': 0}
+
+    batch = []
+    for line in iter_statement_lines(text_stream):
+        stats['lines'] += 1
+        batch.append(line)
+        if len(batch) >= batch_size:
+            _flush_batch(batch, index, import_batch, dry_run, now, stats)
+            batch = []
+    if batch:
+        _flush_batch(batch, index, import_batch, dry_run, now, stats)
+    return stats
@@ -0,0 +1,111 @@
+# app/services/renewals.py
+"""Batch renewal invoicing for subscriptions nearing the end of their period.
+
+Subscriptions whose ``current_period_end`` falls inside the renewal window are
+read in keyset chunks off ``ix_subscriptions_current_period_end``; each chunk
+gets its pending renewal ``Payment`` rows in a single multi-row INSERT.
+Subscriptions that already have an open (pending) payment are skipped by a
+``NOT EXISTS`` probe, so re-running the job is safe.  Cancelled subscriptions
+are skipped even while their paid period runs on.
+"""
+
+from datetime import datetime, timedelta
+
+from sqlalchemy import exists, insert
+
+from app.models import (
+    ManualPaymentStatus,
+    Payment,
+    PaymentStatus,
+    Subscription,
+    SubscriptionPlan,
+    SubscriptionStatus,
+    db,
+    record_batch_audit,
+)
+from app.services import payment_tokens
+from app.services import search as search_index
+from app.services.tracking import new_tracking_codes
+
+RENEWAL_WINDOW_DAYS = 7
+RENEWAL_CHUNK_SIZE = 1000
+
+
+def _due_subscriptions(now, horizon, last_id, chunk_size):
+    open_payment = exists().where(
+        Payment.subscription_id == Subscription.id,
+        Payment.payment_status == ManualPaymentStatus.PENDING.value,
+    )
+    return db.session.query(
+        Subscription.id,
+        Subscription.name,
+        Subscription.phone_normalized,
+        SubscriptionPlan.name.label('plan_name'),
+        SubscriptionPlan.price_per_month,
+    ).join(
+        SubscriptionPlan, Subscription.plan_id == SubscriptionPlan.id
+    ).filter(
+        Subscription.current_period_end > now,
+        Subscription.current_period_end <= horizon,
+        # Admin cancellation keeps the paid-up period; those subscribers are not invoiced again.
+        Subscription.status != SubscriptionStatus.CANCELLED.value,
+        Subscription.id > last_id,
+        ~open_payment,
+    ).order_by(Subscription.id.asc()).limit(chunk_size).all()
+
+
+def generate_renewal_payments(within_days=RENEWAL_WINDOW_DAYS, chunk_size=RENEWAL_CHUNK_SIZE, notify=False, now=None):
+    """Create pending renewal payments for subscriptions expiring within ``within_days``.
+
+    Returns the number of payments created.  With ``notify`` each customer's SMS
+    with the reference and tracking code is queued in the chunk's transaction.
+    """
+    now = now or datetime.utcnow()
+    horizon = now + timedelta(days=within_days)
+    stamp = int(now.timestamp())
+    last_id = 0
+    total = 0
+
+    while True:
+        due = _due_subscriptions(now, horizon, last_id, chunk_size)
+        if not due:
+            break
+        last_id = due[-1].id
+
+        codes = new_tracking_codes(len(due))
+        rows = []
+        for row, tracking_code in zip(due, codes):
+            reference_id = f"NESTGOLD-{row.id}-{stamp}-R"
+            rows.append({
+                'subscription_id': row.id,
+                'amount': row.price_per_month,
+                'checkout_request_id': reference_id,
+                'reference_id': reference_id,
+                'customer_name': row.name,
+                'customer_phone': row.phone_normalized,
+                'description': f"{row.plan_name} renewal - {row.name}",
+                'status': PaymentStatus.PENDING.value,
+                'payment_status': ManualPaymentStatus.PENDING.value,
+                'manual_payment_status': ManualPaymentStatus.PENDING.value,
+                'payment_method': 'Manual',
+                'tracking_code': tracking_code,
+                'payment_date': now,
+            })
+
+        payments = db.session.scalars(insert(Payment).returning(Payment), rows).all()
+        payment_tokens.index_payments(db.session.connection(), payments)
+        search_index.reindex_entities(db.session.connection(), payments)
+        record_batch_audit(db.session, Payment.__tablename__, 'bulk_renewal', [p.id for p in payments])
+        if notify:
+            from app.services.sms import send_customer_renewal_sms
+
+            plan_names = {row.id: row.plan_name for row in due}
+            for payment in payments:
+                send_customer_renewal_sms(payment, plan_names.get(payment.subscription_id))
+        db.session.commit()
+        total += len(payments)
+
+        if len(due) < chunk_size:
+            break
+
+    return total
@@ -0,0 +1,312 @@
+# app/services/search.py
+"""Admin search over payments and subscriptions.
+
+Searchable fields are broken into lower-cased word tokens plus their edge
+n-grams (prefixes) and stored in ``search_tokens``.  A query is answered by a
+single grouped probe on the ``(token, entity_type, entity_id, weight)`` index
+instead of ``ilike('%q%')`` scans over the base tables.
+
+Tokens only match from the start of a word (at least ``MIN_TOKEN_LEN``
+characters), so a phone tail ("5678"), a fragment from the middle of a
+reference or a one-character query finds nothing in the index.  Searches
+therefore union the index hits with the old substring scan over the same
+fields: index hits come first, ranked, and substring-only matches follow, so
+anything the admin could find before still turns up.
+
+The index is kept current from the ORM write paths through a session
+``after_flush`` hook.  Bulk ``query.update()``/``query.delete()`` calls bypass
+that hook, so callers doing bulk writes on indexed fields must call
+``reindex_entities``/``purge_entities`` themselves; ``flask search-reindex``
+rebuilds everything from scratch.
+"""
+
+import re
+
+from sqlalchemy import delete, event, func, inspect, or_, select
+from sqlalchemy.orm import Session, joinedload
+
+from app.models import Payment, SearchToken, Subscription, db
+
+ENTITY_PAYMENT = 'payment'
+ENTITY_SUBSCRIPTION = 'subscription'
+
+MIN_TOKEN_LEN = 2
+MAX_TOKEN_LEN = 24
+MAX_QUERY_TERMS = 6
+REINDEX_CHUNK_SIZE = 1000
+
+# Relative importance of each field; an exact word match scores double a prefix match.
+PAYMENT_FIELDS = {
+    'reference_id': 5,
+    'tracking_code': 5,
+    'checkout_request_id': 5,
+    'admin_transaction_reference': 5,
+    'customer_name': 3,
+    'customer_phone': 3,
+}
+SUBSCRIPTION_FIELDS = {
+    'checkout_request_id': 5,
+    'name': 3,
+    'phone': 3,
+    'location': 1,
+}
+PHONE_FIELDS = {'customer_phone', 'phone'}
+
+_SPLIT_RE = re.compile(r'[^0-9a-z]+')
+
+
+def _words(value):
+    return [w for w in _SPLIT_RE.split(str(value or '').lower()) if len(w) >= MIN_TOKEN_LEN]
+
+
+def _phone_forms(value):
+    """Index local (07..), international (2547..) and bare (7..) forms of a phone."""
+    normalized = Subscription.normalize_phone(value)
+    forms = {normalized}
+    if normalized.startswith('254') and len(normalized) == 12:
+        forms.add(normalized[3:])
+        forms.add(f'0{normalized[3:]}')
+    return forms
+
+
+def _add_word(tokens, word, weight):
+    capped = word[:MAX_TOKEN_LEN]
+    exact = weight * 2 if len(word) <= MAX_TOKEN_LEN else weight
+    tokens[capped] = max(tokens.get(capped, 0), exact)
+    for size in range(MIN_TOKEN_LEN, len(capped)):
+        prefix = capped[:size]
+        tokens[prefix] = max(tokens.get(prefix, 0), weight)
+
+
+def tokenize_entity(obj, fields):
+    tokens = {}
+    for attr, weight in fields.items():
+        value = getattr(obj, attr, None)
+        if not value:
+            continue
+        words = _words(value)
+        if attr in PHONE_FIELDS:
+            words.extend(_phone_forms(value))
+        for word in words:
+            _add_word(tokens, word, weight)
+    return tokens
+
+
+def query_terms(query_text):
+    """Normalize free text into index terms; every term must match for a hit."""
+    terms = []
+    for word in _words(query_text):
+        term = word[:MAX_TOKEN_LEN]
+        if term not in terms:
+            terms.append(term)
+    return terms[:MAX_QUERY_TERMS]
+
+
+def _entity_type_of(obj):
+    if isinstance(obj, Payment):
+        return ENTITY_PAYMENT, PAYMENT_FIELDS
+    if isinstance(obj, Subscription):
+        return ENTITY_SUBSCRIPTION, SUBSCRIPTION_FIELDS
+    return None, None
+
+
+def _token_rows(entity_type, entity_id, tokens):
+    return [
+        {'entity_type': entity_type, 'entity_id': entity_id, 'token': token, 'weight': weight}
+        for token, weight in tokens.items()
+    ]
+
+
+def purge_entities(connection, entity_type, entity_ids):
+    entity_ids = list(entity_ids)
+    if not entity_ids:
+        return
+    connection.execute(delete(SearchToken).where(
+        SearchToken.entity_type == entity_type,
+        SearchToken.entity_id.in_(entity_ids),
+    ))
+
+
+def purge_subscription_payments(connection, subscription_ids):
+    """Drop payment tokens ahead of a bulk ``Payment`` delete keyed by subscription."""
+    subscription_ids = list(subscription_ids)
+    if not subscription_ids:
+        return
+    payment_ids = select(Payment.id).where(Payment.subscription_id.in_(subscription_ids))
+    connection.execute(delete(SearchToken).where(
+        SearchToken.entity_type == ENTITY_PAYMENT,
+        SearchToken.entity_id.in_(payment_ids),
+    ))
+
+
+def reindex_entities(connection, objects):
+    """Replace the tokens of the given Payment/Subscription objects in two statements per type."""
+    grouped = {}
+    for obj in objects:
+        entity_type, fields = _entity_type_of(obj)
+        if entity_type is None or obj.id is None:
+            continue
+        grouped.setdefault(entity_type, {})[obj.id] = tokenize_entity(obj, fields)
+
+    for entity_type, by_id in grouped.items():
+        purge_entities(connection, entity_type, by_id.keys())
+        rows = []
+        for entity_id, tokens in by_id.items():
+            rows.extend(_token_rows(entity_type, entity_id, tokens))
+        if rows:
+            connection.execute(SearchToken.__table__.insert(), rows)
+
+
+def _indexed_fields_changed(obj, fields):
+    state = inspect(obj)
+    return any(state.attrs[attr].history.has_changes() for attr in fields)
+
+
+@event.listens_for(Session, 'after_flush')
+def _sync_search_tokens(session, flush_context):
+    changed = []
+    removed = {}
+
+    for obj in session.new:
+        if _entity_type_of(obj)[0]:
+            changed.append(obj)
+
+    for obj in session.dirty:
+        entity_type, fields = _entity_type_of(obj)
+        if entity_type and _indexed_fields_changed(obj, fields):
+            changed.append(obj)
+
+    for obj in session.deleted:
+        entity_type, _ = _entity_type_of(obj)
+        if entity_type and obj.id is not None:
+            removed.setdefault(entity_type, set()).add(obj.id)
+
+    if not changed and not removed:
+        return
+
+    connection = session.connection()
+    for entity_type, ids in removed.items():
+        purge_entities(connection, entity_type, ids)
+    reindex_entities(connection, changed)
+
+
+def matching_ids(query_text, entity_type):
+    """Selectable of entity ids matching every query term, for use in ``IN (...)`` filters."""
+    terms = query_terms(query_text)
+    if not terms:
+        return None
+    return select(SearchToken.entity_id).where(
+        SearchToken.entity_type == entity_type,
+        SearchToken.token.in_(terms),
+    ).group_by(SearchToken.entity_id).having(func.count(SearchToken.id) == len(terms))
+
+
+def substring_criterion(query_text, model, fields):
+    """``field ILIKE '%q%'`` over ``fields``: the pre-index behaviour, unioned with index hits."""
+    escaped = query_text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    like = f'%{escaped}%'
+    return or_(*(getattr(model, attr).ilike(like, escape='\\') for attr in fields))
+
+
+def payment_criterion(query_text):
+    """Filter for the admin payment list: token index hits plus substring matches."""
+    substring = substring_criterion(query_text, Payment, PAYMENT_FIELDS)
+    matching = matching_ids(query_text, ENTITY_PAYMENT)
+    if matching is None:
+        return substring
+    return or_(Payment.id.in_(matching), substring)
+
+
+def _substring_matches(query_text, limit, entity_type, exclude=()):
+    matches = []
+    for kind, model, fields in (
+        (ENTITY_PAYMENT, Payment, PAYMENT_FIELDS),
+        (ENTITY_SUBSCRIPTION, Subscription, SUBSCRIPTION_FIELDS),
+    ):
+        if entity_type and kind != entity_type:
+            continue
+        stmt = select(model.id).where(substring_criterion(query_text, model, fields))
+        skip = [entity_id for other, entity_id in exclude if other == kind]
+        if skip:
+            stmt = stmt.where(model.id.not_in(skip))
+        ids = db.session.execute(stmt.order_by(model.id.desc()).limit(limit)).scalars()
+        matches.extend((kind, entity_id, 0) for entity_id in ids)
+    return matches[:limit]
+
+
+def ranked_matches(query_text, limit=20, entity_type=None):
+    """Return ``[(entity_type, entity_id, score), ...]`` best match first.
+
+    Index hits come first; substring matches the index missed follow, unranked (score 0).
+    """
+    query_text = (query_text or '').strip()
+    if not query_text:
+        return []
+    terms = query_terms(query_text)
+    if not terms:
+        return _substring_matches(query_text, limit, entity_type)
+
+    score = func.sum(SearchToken.weight).label('score')
+    stmt = select(SearchToken.entity_type, SearchToken.entity_id, score).where(
+        SearchToken.token.in_(terms)
+    )
+    if entity_type:
+        stmt = stmt.where(SearchToken.entity_type == entity_type)
+    stmt = stmt.group_by(
+        SearchToken.entity_type, SearchToken.entity_id
+    ).having(
+        func.count(SearchToken.id) == len(terms)
+    ).order_by(
+        score.desc(), SearchToken.entity_id.desc()
+    ).limit(limit)
+    matches = [(row.entity_type, row.entity_id, int(row.score)) for row in db.session.execute(stmt)]
+    if len(matches) < limit:
+        seen = {(kind, entity_id) for kind, entity_id, _ in matches}
+        matches.extend(_substring_matches(query_text, limit - len(matches), entity_type, exclude=seen))
+    return matches
+
+
+def search(query_text, limit=20, entity_type=None):
+    """Ranked hits hydrated with their Payment/Subscription rows (two ``IN`` queries)."""
+    matches = ranked_matches(query_text, limit=limit, entity_type=entity_type)
+    payment_ids = [entity_id for kind, entity_id, _ in matches if kind == ENTITY_PAYMENT]
+    subscription_ids = [entity_id for kind, entity_id, _ in matches if kind == ENTITY_SUBSCRIPTION]
+
+    payments = {}
+    if payment_ids:
+        payments = {p.id: p for p in Payment.query.filter(Payment.id.in_(payment_ids)).all()}
+    subscriptions = {}
+    if subscription_ids:
+        subscriptions = {
+            s.id: s for s in Subscription.query.options(joinedload(Subscription.plan)).filter(
+                Subscription.id.in_(subscription_ids)
+            ).all()
+        }
+
+    results = []
+    for kind, entity_id, score in matches:
+        obj = payments.get(entity_id) if kind == ENTITY_PAYMENT else subscriptions.get(entity_id)
+        if obj is None:
+            # Stale token left behind by a bulk delete; skipped until the next reindex.
+            continue
+        results.append({'type': kind, 'id': entity_id, 'score': score, 'obj': obj})
+    return results
+
+
+def rebuild_index(chunk_size=REINDEX_CHUNK_SIZE):
+    """Rebuild ``search_tokens`` from scratch, streaming base rows in chunks."""
+    db.session.execute(delete(SearchToken))
+    total = 0
+    for model in (Payment, Subscription):
+        last_id = 0
+        while True:
+            batch = model.query.filter(model.id > last_id).order_by(model.id.asc()).limit(chunk_size).all()
+            if not batch:
+                break
+            reindex_entities(db.session.connection(), batch)
+            total += len(batch)
+            last_id = batch[-1].id
+            db.session.commit()
+            db.session.expunge_all()
+    db.session.commit()
+    return total
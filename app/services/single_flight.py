@@ -0,0 +1,116 @@
+# app/services/single_flight.py
+"""Per-process coalescing of identical concurrent lookups.
+
+``group.do(key, fn)`` runs ``fn`` once for every caller that asks for the same
+``key`` while a call is already in flight; the others wait for it and get
+the same result (or exception).  Nothing is kept once the call finishes, so
+this is not a cache: it only stops a burst of identical requests (a shared
+tracking link, many pending pages woken by one callback) from each issuing
+the same query.
+
+Results are handed to other threads, so ``fn`` must return plain values
+(strings, row tuples), never ORM instances bound to the leader's session.
+
+The primitives come from ``threading``, which gevent/eventlet workers
+monkeypatch, so waiting blocks a greenlet rather than the whole worker.
+Counters are per process; ``/admin/metrics/single-flight`` reports this
+worker's.
+"""
+
+import os
+import threading
+
+SINGLE_FLIGHT_WAIT_SECONDS = float(os.getenv('SINGLE_FLIGHT_WAIT_SECONDS', '10'))
+
+
+class _Call:
+    __slots__ = ('done', 'owner', 'result', 'error', 'waiters')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.owner = threading.get_ident()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    def __init__(self, name, wait_seconds=SINGLE_FLIGHT_WAIT_SECONDS):
+        self.name = name
+        self.wait_seconds = wait_seconds
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._stats = {'calls': 0, 'leaders': 0, 'coalesced': 0, 'errors': 0, 'timeouts': 0}
+
+    def do(self, key, fn):
+        with self._lock:
+            self._stats['calls'] += 1
+            call = self._calls.get(key)
+            if call is None:
+                call = self._calls[key] = _Call()
+                self._stats['leaders'] += 1
+                leader = True
+            elif call.owner == threading.get_ident():
+                # Re-entrant lookup from the leader itself: waiting would deadlock.
+                call = None
+                leader = False
+            else:
+                call.waiters += 1
+                leader = False
+
+        if call is None:
+            return fn()
+        if leader:
+            return self._lead(key, call, fn)
+
+        if not call.done.wait(self.wait_seconds):
+            # The leader is stuck; do not let it take every waiter down with it.
+            self._count('timeouts')
+            return fn()
+        self._count('coalesced')
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def _lead(self, key, call, fn):
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as exc:
+            call.error = exc
+            self._count('errors')
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+    def _count(self, counter):
+        with self._lock:
+            self._stats[counter] += 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['in_flight'] = len(self._calls)
+            stats['waiting'] = sum(call.waiters for call in self._calls.values())
+        return stats
+
+
+_groups = {}
+_groups_lock = threading.Lock()
+
+
+def group(name):
+    """Return the process-wide ``SingleFlight`` registered under ``name``."""
+    with _groups_lock:
+        flight = _groups.get(name)
+        if flight is None:
+            flight = _groups[name] = SingleFlight(name)
+        return flight
+
+
+def stats():
+    with _groups_lock:
+        flights = list(_groups.values())
+    return {flight.name: flight.stats() for flight in flights}
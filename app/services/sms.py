@@ -1,20 +1,22 @@
 # app/services/sms.py
 # app/services/sms.py
+"""Message templates.  Each helper queues its SMS in the caller's transaction
+(see ``sms_outbox``); it is sent by the outbox worker after the commit.
+Provider errors are handled by the worker, so a failure here is a database
+error and is left to fail the caller's transaction."""
 import os
-import africastalking
-from app.models import db, User, Subscription  # etc.
+from app.services import admin_digest, sms_outbox
+from app.services.sms_transport import get_transport
 # Load from .env
-AT_USERNAME = os.getenv("AT_USERNAME")
-AT_API_KEY = os.getenv("AT_API_KEY")
 ADMIN_PHONE = os.getenv('ADMIN_PHONE_NUMBER')
 
-# Initialize the SDK (your downgraded version supports global initialize)
-africastalking.initialize(AT_USERNAME, AT_API_KEY)
-sms = africastalking.SMS
+
+def _transport_ready():
+    return get_transport().ready
 
 
 def _sms_enabled():
-    return bool(AT_USERNAME and AT_API_KEY and ADMIN_PHONE)
+    return bool(_transport_ready() and ADMIN_PHONE)
 
 
 def send_admin_sms(subscription):
@@ -29,15 +31,10 @@ def send_admin_sms(subscription):
         f"Location: {subscription.location}\n"
         f"Phone: {subscription.phone}"
     )
-    try:
-        if not _sms_enabled():
-            print("Admin SMS skipped: missing AT_USERNAME/AT_API_KEY/ADMIN_PHONE_NUMBER")
-            return
-        # recipients must be a list
-        response = sms.send(message, [ADMIN_PHONE])
-        print(f"Admin SMS Response: {response}")
-    except Exception as e:
-        print(f"Admin SMS Error: {e}")
+    if not _sms_enabled():
+        print("Admin SMS skipped: missing AT_USERNAME/AT_API_KEY/ADMIN_PHONE_NUMBER")
+        return
+    sms_outbox.enqueue([ADMIN_PHONE], message, 'admin_paid')
 
 
 def send_customer_confirmation(subscription):
@@ -51,37 +48,57 @@ def send_customer_confirmation(subscription):
         f"Weekly on {subscription.preferred_delivery_day}s.\n"
         f"Questions? WhatsApp us!"
     )
-    try:
-        if not (AT_USERNAME and AT_API_KEY):
-            print("Customer SMS skipped: missing AT_USERNAME/AT_API_KEY")
-            return
-        phone = subscription.phone
-        if not phone.startswith('+254'):
-            phone = '+254' + phone.lstrip('0')
-        response = sms.send(message, [phone])
-        print(f"Customer SMS Response: {response}")
-    except Exception as e:
-        print(f"Customer SMS Error: {e}")
+    if not _transport_ready():
+        print("Customer SMS skipped: missing AT_USERNAME/AT_API_KEY")
+        return
+    phone = subscription.phone
+    if not phone.startswith('+254'):
+        phone = '+254' + phone.lstrip('0')
+    sms_outbox.enqueue([phone], message, 'customer_welcome')
 
 
-def send_admin_payment_request_sms(subscription, payment):
+def send_admin_payment_request_sms(subscription, payment, plan_name=None):
     """
     Notify admin when customer reaches generated payment details (manual flow start).
+
+    Routine requests go into the next admin digest (see ``admin_digest``);
+    urgent ones are texted on their own right away.
     """
+    plan_name = plan_name or (subscription.plan.name if subscription.plan else '-')
+    reference = payment.reference_id or payment.checkout_request_id
+    if not _sms_enabled():
+        print("Admin payment-request SMS skipped: missing AT_USERNAME/AT_API_KEY/ADMIN_PHONE_NUMBER")
+        return
+    if not admin_digest.is_urgent(payment.amount):
+        admin_digest.record('payment_request', plan_name=plan_name, amount=payment.amount, reference=reference)
+        return
     message = (
         "NestGold: New payment request started.\n"
         f"Customer: {subscription.name}\n"
         f"Phone: {subscription.phone}\n"
-        f"Plan: {subscription.plan.name if subscription.plan else '-'}\n"
+        f"Plan: {plan_name}\n"
+        f"Amount: KES {payment.amount:.2f}\n"
+        f"Reference: {reference}\n"
+        f"Tracking: {payment.tracking_code or '-'}"
+    )
+    sms_outbox.enqueue([ADMIN_PHONE], message, 'admin_payment_request')
+
+
+def send_customer_renewal_sms(payment, plan_name=None):
+    """
+    Sends the renewal payment reference and tracking code to the customer.
+    """
+    message = (
+        "NestGold: Your subscription is due for renewal.\n"
+        f"Plan: {plan_name or '-'}\n"
         f"Amount: KES {payment.amount:.2f}\n"
-        f"Reference: {payment.reference_id or payment.checkout_request_id}\n"
+        f"Reference: {payment.reference_id}\n"
         f"Tracking: {payment.tracking_code or '-'}"
     )
-    try:
-        if not _sms_enabled():
-            print("Admin payment-request SMS skipped: missing AT_USERNAME/AT_API_KEY/ADMIN_PHONE_NUMBER")
-            return
-        response = sms.send(message, [ADMIN_PHONE])
-        print(f"Admin payment-request SMS Response: {response}")
-    except Exception as e:
-        print(f"Admin payment-request SMS Error: {e}")
+    if not _transport_ready():
+        print("Renewal SMS skipped: missing AT_USERNAME/AT_API_KEY")
+        return
+    phone = payment.customer_phone or ''
+    if not phone.startswith('+'):
+        phone = '+' + phone
+    sms_outbox.enqueue([phone], message, 'customer_renewal')
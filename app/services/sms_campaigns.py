@@ -0,0 +1,188 @@
+# app/services/sms_campaigns.py
+"""Bulk SMS campaigns: delivery-day reminders and renewal reminders.
+
+A campaign streams its recipients off an index in keyset chunks of
+``SMS_CAMPAIGN_CHUNK_SIZE``, renders each message from a template and queues
+the chunk in the outbox with one multi-row INSERT.  Only one chunk of rows
+is in memory at a time.  The chunk's cursor is saved on the ``sms_campaigns``
+row in the same commit, so an interrupted run resumes where it stopped.  A
+second run for the same day finds the finished campaign and queues nothing.
+
+Delivery and per-recipient status belong to the outbox (see ``sms_outbox``).
+The default templates only use fields that many subscribers share (plan,
+day, dates), so the worker can send identical texts in multi-recipient
+calls.  ``{name}`` and ``{first_name}`` are available but make every
+message unique.
+"""
+
+import os
+from collections import namedtuple
+from datetime import datetime, timedelta
+from string import Formatter
+
+from sqlalchemy import and_, func, or_, select
+
+from app.models import (
+    SmsCampaign,
+    SmsCampaignStatus,
+    SmsOutbox,
+    Subscription,
+    SubscriptionPlan,
+    SubscriptionStatus,
+    db,
+)
+from app.services import sms_outbox
+
+SMS_CAMPAIGN_CHUNK_SIZE = int(os.getenv('SMS_CAMPAIGN_CHUNK_SIZE', '1000'))
+RENEWAL_REMINDER_DAYS = 3
+
+DAY_NAMES = ('Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday')
+TEMPLATE_FIELDS = {'name', 'first_name', 'plan', 'day', 'date', 'period_end'}
+
+DELIVERY_REMINDER_TEMPLATE = (
+    "NestGold: your {plan} eggs arrive tomorrow, {day} {date}. "
+    "Please have someone available to receive them. Questions? WhatsApp us!"
+)
+RENEWAL_REMINDER_TEMPLATE = (
+    "NestGold: your {plan} plan ends on {period_end}. "
+    "Renew before then to keep your weekly eggs coming."
+)
+
+RECIPIENT_COLUMNS = (
+    Subscription.id,
+    Subscription.name,
+    Subscription.phone_normalized,
+    Subscription.current_period_end,
+    SubscriptionPlan.name.label('plan_name'),
+)
+
+# query: recipients in cursor order; after(cursor): keyset filter; cursor(row): position of a row.
+CampaignSpec = namedtuple('CampaignSpec', 'key kind template query after cursor context')
+
+
+def check_template(template):
+    """Raise ``ValueError`` for unknown placeholders, before anything is queued."""
+    fields = {field for _, field, _, _ in Formatter().parse(template) if field is not None}
+    unknown = fields - TEMPLATE_FIELDS
+    if unknown:
+        raise ValueError(f"Unknown template fields: {', '.join(sorted(unknown))}")
+
+
+def _recipients():
+    return select(*RECIPIENT_COLUMNS).join(
+        SubscriptionPlan, Subscription.plan_id == SubscriptionPlan.id
+    ).where(
+        Subscription.status != SubscriptionStatus.CANCELLED.value,
+    )
+
+
+def _context(row, **extra):
+    return {
+        'name': row.name,
+        'first_name': (row.name or '').split(' ')[0],
+        'plan': row.plan_name,
+        'period_end': row.current_period_end.strftime('%d %b'),
+        **extra,
+    }
+
+
+def delivery_reminders(now=None, template=None):
+    """Subscribers with access through tomorrow whose delivery day is tomorrow."""
+    now = now or datetime.utcnow()
+    tomorrow = (now + timedelta(days=1)).date()
+    day = DAY_NAMES[tomorrow.weekday()]
+    date = tomorrow.strftime('%d %b')
+    query = _recipients().where(
+        Subscription.preferred_delivery_day == day,
+        Subscription.current_period_end > now,
+    ).order_by(Subscription.id)
+    return CampaignSpec(
+        key=f'delivery_reminder:{tomorrow.isoformat()}',
+        kind='delivery_reminder',
+        template=template or DELIVERY_REMINDER_TEMPLATE,
+        query=query,
+        after=lambda cursor: Subscription.id > int(cursor),
+        cursor=lambda row: str(row.id),
+        context=lambda row: _context(row, day=day, date=date),
+    )
+
+
+def renewal_reminders(within_days=RENEWAL_REMINDER_DAYS, now=None, template=None):
+    """Subscribers whose paid period ends within ``within_days``."""
+    now = now or datetime.utcnow()
+    horizon = now + timedelta(days=within_days)
+    query = _recipients().where(
+        Subscription.current_period_end > now,
+        Subscription.current_period_end <= horizon,
+    ).order_by(Subscription.current_period_end, Subscription.id)
+
+    def after(cursor):
+        period_end, _, last_id = cursor.partition('|')
+        period_end = datetime.fromisoformat(period_end)
+        return or_(
+            Subscription.current_period_end > period_end,
+            and_(Subscription.current_period_end == period_end, Subscription.id > int(last_id)),
+        )
+
+    return CampaignSpec(
+        key=f'renewal_reminder:{now.date().isoformat()}:{within_days}',
+        kind='renewal_reminder',
+        template=template or RENEWAL_REMINDER_TEMPLATE,
+        query=query,
+        after=after,
+        cursor=lambda row: f'{row.current_period_end.isoformat()}|{row.id}',
+        context=lambda row: _context(
+            row, day=DAY_NAMES[row.current_period_end.weekday()], date=row.current_period_end.strftime('%d %b')
+        ),
+    )
+
+
+def _get_or_create(spec):
+    campaign = SmsCampaign.query.filter_by(key=spec.key).first()
+    if campaign is None:
+        campaign = SmsCampaign(key=spec.key, kind=spec.kind, template=spec.template)
+        db.session.add(campaign)
+        db.session.commit()
+    return campaign
+
+
+def queue_campaign(spec, chunk_size=SMS_CAMPAIGN_CHUNK_SIZE):
+    """Queue every recipient of ``spec`` in the outbox; returns the campaign row.
+
+    Each chunk's messages and the campaign's cursor commit together.  A rerun
+    continues from the saved cursor, or does nothing once the campaign is
+    queued.
+    """
+    check_template(spec.template)
+    campaign = _get_or_create(spec)
+    # A resumed campaign keeps the template it started with.
+    template = campaign.template
+
+    while campaign.status != SmsCampaignStatus.QUEUED.value:
+        query = spec.query
+        if campaign.cursor:
+            query = query.where(spec.after(campaign.cursor))
+        rows = db.session.execute(query.limit(chunk_size)).all()
+        if rows:
+            messages = [
+                ('+' + row.phone_normalized, template.format_map(spec.context(row)))
+                for row in rows
+                if row.phone_normalized
+            ]
+            campaign.recipients += sms_outbox.enqueue_many(messages, spec.kind, campaign_id=campaign.id)
+            campaign.cursor = spec.cursor(rows[-1])
+        if len(rows) < chunk_size:
+            campaign.status = SmsCampaignStatus.QUEUED.value
+            campaign.queued_at = datetime.utcnow()
+        db.session.commit()
+
+    return campaign
+
+
+def campaign_stats(campaign_id):
+    """Outbox rows of a campaign by status, e.g. ``{'Sent': 19990, 'Pending': 10}``."""
+    return dict(db.session.execute(
+        select(SmsOutbox.status, func.count())
+        .where(SmsOutbox.campaign_id == campaign_id)
+        .group_by(SmsOutbox.status)
+    ).all())
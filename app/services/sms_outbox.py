@@ -0,0 +1,339 @@
+# app/services/sms_outbox.py
+"""Durable SMS outbox.
+
+``enqueue`` writes one ``sms_outbox`` row per recipient on the caller's
+connection.  A message therefore exists exactly when the transaction that
+asked for it commits, and a request never waits on the provider.
+
+Delivery is done by ``OutboxWorker``:
+
+* rows are claimed in batches by an ``UPDATE`` that stamps a claim token and
+  a lease (``next_attempt_at``), so several workers (threads, processes or
+  ``flask sms-worker``) never send the same row twice while alive, and a
+  crashed worker's rows are picked up again once the lease runs out;
+* claimed rows with the same text are grouped into multi-recipient sends of
+  up to ``SMS_MAX_RECIPIENTS_PER_SEND``, made through the configured
+  transport on a pool of ``SMS_OUTBOX_CONCURRENCY`` threads and held to
+  ``SMS_RATE_PER_SECOND`` messages per process by a token bucket;
+* failures are retried with exponential backoff and jitter, and after
+  ``SMS_MAX_ATTEMPTS`` (or a permanent provider error) the row is left
+  ``Dead`` for inspection;
+* while the provider's circuit breaker is open nothing is claimed, and rows
+  refused by it mid-batch are put back without using up an attempt.
+
+With ``SMS_OUTBOX_WORKER=thread`` (default) each web process starts one
+worker thread on its first request; it polls every
+``SMS_OUTBOX_POLL_SECONDS`` and is woken by every commit that queued
+messages.  CLI commands only queue.  Use ``off`` when a dedicated
+``flask sms-worker`` runs.
+"""
+
+import os
+import random
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from flask import current_app, has_app_context
+from sqlalchemy import bindparam, event, select, update
+from sqlalchemy.orm import Session
+
+from app.models import SmsOutbox, SmsStatus, db
+from app.services.circuit_breaker import OPEN, CircuitOpenError
+from app.services.sms_transport import SendResult, get_transport
+
+SMS_OUTBOX_CONCURRENCY = int(os.getenv('SMS_OUTBOX_CONCURRENCY', '4'))
+SMS_OUTBOX_BATCH_SIZE = int(os.getenv('SMS_OUTBOX_BATCH_SIZE', '500'))
+SMS_MAX_RECIPIENTS_PER_SEND = int(os.getenv('SMS_MAX_RECIPIENTS_PER_SEND', '100'))
+SMS_RATE_PER_SECOND = float(os.getenv('SMS_RATE_PER_SECOND', '50'))
+SMS_OUTBOX_POLL_SECONDS = float(os.getenv('SMS_OUTBOX_POLL_SECONDS', '30'))
+SMS_OUTBOX_LEASE_SECONDS = 300
+SMS_MAX_ATTEMPTS = int(os.getenv('SMS_MAX_ATTEMPTS', '6'))
+SMS_RETRY_BASE_SECONDS = 30
+SMS_RETRY_MAX_SECONDS = 3600
+
+_CLAIMABLE = (SmsStatus.PENDING.value, SmsStatus.SENDING.value)
+
+
+def enqueue(recipients, message, kind, connection=None, now=None):
+    """Queue ``message`` for each recipient in the current transaction."""
+    return enqueue_many(((recipient, message) for recipient in recipients), kind, connection=connection, now=now)
+
+
+def enqueue_many(messages, kind, campaign_id=None, connection=None, now=None):
+    """Queue ``(recipient, message)`` pairs in the current transaction with one multi-row INSERT."""
+    now = now or datetime.utcnow()
+    rows = [
+        {
+            'campaign_id': campaign_id,
+            'kind': kind,
+            'recipient': recipient,
+            'message': message,
+            'status': SmsStatus.PENDING.value,
+            'attempts': 0,
+            'next_attempt_at': now,
+            'created_at': now,
+        }
+        for recipient, message in dict.fromkeys(messages)
+        if recipient
+    ]
+    if not rows:
+        return 0
+    (connection or db.session.connection()).execute(SmsOutbox.__table__.insert(), rows)
+    db.session().info['sms_enqueued'] = True
+    return len(rows)
+
+
+def retry_delay(attempts):
+    delay = min(SMS_RETRY_MAX_SECONDS, SMS_RETRY_BASE_SECONDS * 2 ** max(0, attempts - 1))
+    return timedelta(seconds=delay * random.uniform(0.8, 1.2))
+
+
+def claim_batch(limit=SMS_OUTBOX_BATCH_SIZE, now=None):
+    """Lease up to ``limit`` due rows to this caller and return them (committed)."""
+    now = now or datetime.utcnow()
+    token = uuid.uuid4().hex
+    due = select(SmsOutbox.id).where(
+        SmsOutbox.status.in_(_CLAIMABLE), SmsOutbox.next_attempt_at <= now
+    ).order_by(SmsOutbox.next_attempt_at, SmsOutbox.id).limit(limit)
+    db.session.execute(
+        update(SmsOutbox)
+        .where(SmsOutbox.id.in_(due.scalar_subquery()))
+        .where(SmsOutbox.status.in_(_CLAIMABLE), SmsOutbox.next_attempt_at <= now)
+        .values(
+            status=SmsStatus.SENDING.value,
+            claim_token=token,
+            next_attempt_at=now + timedelta(seconds=SMS_OUTBOX_LEASE_SECONDS),
+        )
+        .execution_options(synchronize_session=False)
+    )
+    rows = db.session.execute(
+        select(SmsOutbox.id, SmsOutbox.recipient, SmsOutbox.message, SmsOutbox.attempts)
+        .where(SmsOutbox.claim_token == token)
+        .order_by(SmsOutbox.id)
+    ).all()
+    db.session.commit()
+    return rows
+
+
+class RateLimiter:
+    """Token bucket shared by the send threads; ``acquire(n)`` blocks until ``n`` messages may go out."""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or max(rate, 1)
+        self._tokens = self.capacity
+        self._stamp = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, n=1):
+        if not self.rate:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._stamp) * self.rate)
+            self._stamp = now
+            # Take the tokens now and sleep off any debt outside the lock, so waiters queue in order.
+            self._tokens -= n
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0
+        if wait:
+            time.sleep(wait)
+
+
+def get_rate_limiter(app=None):
+    app = app or current_app._get_current_object()
+    limiter = app.extensions.get('sms_rate_limiter')
+    if limiter is None:
+        limiter = app.extensions.setdefault('sms_rate_limiter', RateLimiter(SMS_RATE_PER_SECOND))
+    return limiter
+
+
+def group_sends(rows, size=SMS_MAX_RECIPIENTS_PER_SEND):
+    """Split claimed rows into sends: same text, distinct recipients, at most ``size`` each."""
+    open_groups = {}
+    groups = []
+    for row in rows:
+        for group, recipients in open_groups.get(row.message, ()):
+            if len(group) < size and row.recipient not in recipients:
+                break
+        else:
+            group, recipients = [], set()
+            open_groups.setdefault(row.message, []).append((group, recipients))
+            groups.append(group)
+        group.append(row)
+        recipients.add(row.recipient)
+    return groups
+
+
+def _send_group(transport, limiter, group):
+    recipients = [row.recipient for row in group]
+    if limiter is not None:
+        limiter.acquire(len(recipients))
+    try:
+        results = transport.send(group[0].message, recipients)
+    except CircuitOpenError:
+        return [None] * len(recipients)
+    except Exception as exc:  # noqa: BLE001 - any transport error is retried
+        error = f'{type(exc).__name__}: {exc}'
+        return [SendResult(recipient, False, None, error, False) for recipient in recipients]
+    by_recipient = {result.recipient: result for result in results}
+    return [
+        by_recipient.get(recipient) or SendResult(recipient, False, None, 'no status from provider', False)
+        for recipient in recipients
+    ]
+
+
+def record_results(outcomes, now=None, defer_seconds=0.0):
+    """Apply ``[(row, SendResult | None)]`` to the outbox and commit.
+
+    ``None`` means the send was never attempted (breaker open): the row is
+    released for ``defer_seconds`` with its attempt count unchanged.
+    """
+    now = now or datetime.utcnow()
+    sent, retry, dead = [], [], []
+    for row, result in outcomes:
+        attempts = row.attempts + 1
+        if result is None:
+            retry.append({
+                '_id': row.id, 'attempts': row.attempts, 'error': 'circuit open',
+                'at': now + timedelta(seconds=defer_seconds),
+            })
+        elif result.ok:
+            sent.append({'_id': row.id, 'attempts': attempts, 'message_id': result.message_id})
+        elif result.permanent or attempts >= SMS_MAX_ATTEMPTS:
+            dead.append({'_id': row.id, 'attempts': attempts, 'error': result.error})
+        else:
+            retry.append({
+                '_id': row.id, 'attempts': attempts, 'error': result.error, 'at': now + retry_delay(attempts),
+            })
+
+    table = SmsOutbox.__table__
+    connection = db.session.connection()
+    by_id = table.c.id == bindparam('_id')
+    if sent:
+        connection.execute(table.update().where(by_id).values(
+            status=SmsStatus.SENT.value, attempts=bindparam('attempts'), claim_token=None,
+            provider_message_id=bindparam('message_id'), last_error=None, sent_at=now,
+        ), sent)
+    if retry:
+        connection.execute(table.update().where(by_id).values(
+            status=SmsStatus.PENDING.value, attempts=bindparam('attempts'), claim_token=None,
+            last_error=bindparam('error'), next_attempt_at=bindparam('at'),
+        ), retry)
+    if dead:
+        connection.execute(table.update().where(by_id).values(
+            status=SmsStatus.DEAD.value, attempts=bindparam('attempts'), claim_token=None,
+            last_error=bindparam('error'),
+        ), dead)
+    db.session.commit()
+    return len(sent), len(retry), len(dead)
+
+
+def process_due(executor=None, limit=SMS_OUTBOX_BATCH_SIZE, limiter=None):
+    """Claim, send and record one batch; returns ``(sent, retried, dead)``."""
+    transport = get_transport()
+    breaker = getattr(transport, 'breaker', None)
+    if breaker is not None and breaker.state == OPEN and breaker.retry_after():
+        return 0, 0, 0
+    rows = claim_batch(limit)
+    if not rows:
+        return 0, 0, 0
+    groups = group_sends(rows)
+
+    def send(group):
+        return _send_group(transport, limiter, group)
+
+    results = map(send, groups) if executor is None else executor.map(send, groups)
+    return record_results(
+        [(row, result) for group, group_results in zip(groups, results) for row, result in zip(group, group_results)],
+        defer_seconds=breaker.retry_after() if breaker is not None else 0.0,
+    )
+
+
+class OutboxWorker:
+    def __init__(self, app, concurrency=SMS_OUTBOX_CONCURRENCY, poll_seconds=SMS_OUTBOX_POLL_SECONDS):
+        self.app = app
+        self.concurrency = concurrency
+        self.poll_seconds = poll_seconds
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self.run, name='sms-outbox', daemon=True)
+                self._thread.start()
+
+    def notify(self):
+        self._wake.set()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def drain(self, executor):
+        """Send batches until nothing is due; returns totals ``(sent, retried, dead)``."""
+        from app.services import admin_digest
+
+        totals = [0, 0, 0]
+        with self.app.app_context():
+            try:
+                admin_digest.flush_due()
+                while not self._stop.is_set():
+                    counts = process_due(executor, limiter=get_rate_limiter(self.app))
+                    if not any(counts):
+                        break
+                    totals = [a + b for a, b in zip(totals, counts)]
+            finally:
+                db.session.remove()
+        return tuple(totals)
+
+    def run(self):
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='sms-send') as executor:
+            while not self._stop.is_set():
+                self._wake.clear()
+                try:
+                    self.drain(executor)
+                except Exception as exc:  # noqa: BLE001 - keep the worker alive across DB hiccups
+                    print(f"SMS outbox worker error: {exc}")
+                self._wake.wait(self.poll_seconds)
+
+
+def get_worker(app=None):
+    app = app or current_app._get_current_object()
+    worker = app.extensions.get('sms_outbox_worker')
+    if worker is None:
+        worker = app.extensions.setdefault('sms_outbox_worker', OutboxWorker(app))
+    return worker
+
+
+def init_app(app):
+    if app.config.get('SMS_OUTBOX_WORKER', 'thread') != 'thread':
+        return
+
+    @app.before_request
+    def _start_outbox_worker():
+        worker = app.extensions.get('sms_outbox_worker')
+        if worker is None or not worker.running:
+            get_worker(app).start()
+
+
+@event.listens_for(Session, 'after_commit')
+def _wake_outbox_worker(session):
+    if session.info.pop('sms_enqueued', None) and has_app_context():
+        worker = current_app.extensions.get('sms_outbox_worker')
+        if worker is not None:
+            worker.notify()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_enqueued(session):
+    session.info.pop('sms_enqueued', None)
@@ -0,0 +1,226 @@
+# app/services/sms_transport.py
+"""Pluggable SMS transports used by the outbox worker.
+
+A transport takes one message and a list of recipients and returns one
+``SendResult`` per recipient.  A raised exception means nothing is known to
+have been sent, and every recipient is retried.
+
+* ``africastalking`` (default) posts to the Africa's Talking API with
+  explicit timeouts, pooled connections and a circuit breaker.
+* ``fake`` records messages in memory; for tests, local runs and
+  benchmarks.  It can simulate latency and failures.
+
+``SMS_TRANSPORT`` picks one per app.  ``set_transport`` swaps in an
+instance, for example a configured ``FakeTransport`` in a test.
+"""
+
+import os
+import re
+import threading
+import time
+from collections import deque, namedtuple
+
+import requests
+from flask import current_app
+from requests.adapters import HTTPAdapter
+
+from app.services import circuit_breaker
+
+AT_USERNAME = os.getenv("AT_USERNAME")
+AT_API_KEY = os.getenv("AT_API_KEY")
+
+# (connect, read) seconds for each provider call.  The SDK default is (3.05, 9.05) with a new connection per call.
+SMS_CONNECT_TIMEOUT = float(os.getenv('SMS_CONNECT_TIMEOUT', '3.05'))
+SMS_READ_TIMEOUT = float(os.getenv('SMS_READ_TIMEOUT', '10'))
+SMS_POOL_SIZE = int(os.getenv('SMS_POOL_SIZE', '8'))
+
+# Africa's Talking per-recipient status codes: 100-102 accepted; these will never succeed on retry.
+AT_SUCCESS_CODES = {100, 101, 102}
+AT_PERMANENT_FAILURE_CODES = {403, 404, 406}
+AT_PHONE_RE = re.compile(r"^\+\d{1,3}\d{3,}$")
+
+SendResult = namedtuple('SendResult', 'recipient ok message_id error permanent')
+
+
+class ProviderError(Exception):
+    """The provider could not be reached or answered with an error status."""
+
+
+class LatencyStats:
+    """Call counts and latency percentiles over the last ``window`` calls."""
+
+    def __init__(self, window=512):
+        self._lock = threading.Lock()
+        self._recent = deque(maxlen=window)
+        self._stats = {'calls': 0, 'errors': 0, 'timeouts': 0}
+
+    def record(self, seconds, error=None):
+        with self._lock:
+            self._recent.append(seconds)
+            self._stats['calls'] += 1
+            if error is not None:
+                self._stats['errors'] += 1
+                if isinstance(error, requests.Timeout):
+                    self._stats['timeouts'] += 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            recent = sorted(self._recent)
+        if recent:
+            stats['p50_ms'] = round(recent[len(recent) // 2] * 1000, 1)
+            stats['p95_ms'] = round(recent[min(len(recent) - 1, int(len(recent) * 0.95))] * 1000, 1)
+            stats['max_ms'] = round(recent[-1] * 1000, 1)
+        return stats
+
+
+class AfricasTalkingTransport:
+    """Posts to the Africa's Talking messaging API over a pooled keep-alive session.
+
+    Uses the same endpoint and form fields as ``africastalking.SMS.send``, but
+    with explicit timeouts, connection reuse and the ``sms_provider`` circuit
+    breaker.  While the breaker is open, ``send`` raises ``CircuitOpenError``
+    without touching the network.
+    """
+    name = 'africastalking'
+
+    def __init__(self, username=AT_USERNAME, api_key=AT_API_KEY,
+                 timeout=(SMS_CONNECT_TIMEOUT, SMS_READ_TIMEOUT), pool_size=SMS_POOL_SIZE):
+        self.username = username
+        self.api_key = api_key
+        self.timeout = timeout
+        domain = 'sandbox.africastalking.com' if username == 'sandbox' else 'africastalking.com'
+        self.url = f'https://api.{domain}/version1/messaging'
+        self.breaker = circuit_breaker.breaker('sms_provider')
+        self.latency = LatencyStats()
+        self._pool_size = pool_size
+        self._session = None
+        self._session_lock = threading.Lock()
+
+    @property
+    def ready(self):
+        return bool(self.username and self.api_key)
+
+    def _client(self):
+        if self._session is None:
+            with self._session_lock:
+                if self._session is None:
+                    session = requests.Session()
+                    # No adapter retries: the outbox owns retrying, and a retry would hide failures from the breaker.
+                    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self._pool_size, max_retries=0)
+                    session.mount('https://', adapter)
+                    session.mount('http://', adapter)
+                    session.headers.update({
+                        'Accept': 'application/json',
+                        'User-Agent': 'nestgold-sms',
+                        'apiKey': self.api_key or '',
+                    })
+                    self._session = session
+        return self._session
+
+    def send(self, message, recipients):
+        valid = [recipient for recipient in recipients if AT_PHONE_RE.match(recipient or '')]
+        results = {
+            recipient: SendResult(recipient, False, None, 'invalid phone number', True)
+            for recipient in recipients
+            if recipient not in valid
+        }
+        if valid:
+            response = self._post({
+                'username': self.username,
+                'to': ','.join(valid),
+                'message': message,
+                'bulkSMSMode': 1,
+            })
+            results.update((result.recipient, result) for result in parse_response(response, valid))
+        return [results[recipient] for recipient in recipients]
+
+    def _post(self, data):
+        self.breaker.check()
+        started = time.monotonic()
+        error = None
+        try:
+            response = self._client().post(self.url, data=data, timeout=self.timeout)
+            if not 200 <= response.status_code < 300:
+                error = ProviderError(f'HTTP {response.status_code}: {response.text[:200]}')
+                raise error
+            return response.json()
+        except (requests.RequestException, ValueError) as exc:
+            error = exc
+            raise ProviderError(f'{type(exc).__name__}: {exc}') from exc
+        finally:
+            self.latency.record(time.monotonic() - started, error)
+            if error is None:
+                self.breaker.record_success()
+            else:
+                self.breaker.record_failure()
+
+    def stats(self):
+        return {'name': self.name, 'timeout': list(self.timeout), **self.latency.stats()}
+
+
+def parse_response(response, recipients):
+    entries = {}
+    data = response.get('SMSMessageData', {}) if isinstance(response, dict) else {}
+    for entry in data.get('Recipients') or ():
+        entries[entry.get('number')] = entry
+
+    results = []
+    for recipient in recipients:
+        entry = entries.get(recipient)
+        if entry is None:
+            results.append(SendResult(recipient, False, None, str(data.get('Message') or response), False))
+            continue
+        code = int(entry.get('statusCode') or 0)
+        if code in AT_SUCCESS_CODES:
+            results.append(SendResult(recipient, True, entry.get('messageId'), None, False))
+        else:
+            results.append(SendResult(
+                recipient, False, None, entry.get('status') or str(code), code in AT_PERMANENT_FAILURE_CODES
+            ))
+    return results
+
+
+class FakeTransport:
+    """In-memory transport: ``sent`` holds ``(message, recipients)`` per call."""
+    name = 'fake'
+    ready = True
+
+    def __init__(self, latency=0.0, fail_every=0):
+        self.latency_seconds = latency
+        self.fail_every = fail_every
+        self.sent = []
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def send(self, message, recipients):
+        if self.latency_seconds:
+            time.sleep(self.latency_seconds)
+        with self._lock:
+            self.calls += 1
+            if self.fail_every and self.calls % self.fail_every == 0:
+                raise RuntimeError('fake transport failure')
+            self.sent.append((message, list(recipients)))
+            start = len(self.sent)
+        return [SendResult(recipient, True, f'fake-{start}-{i}', None, False) for i, recipient in enumerate(recipients)]
+
+    def stats(self):
+        return {'name': self.name, 'calls': self.calls, 'sent': len(self.sent)}
+
+
+TRANSPORTS = {
+    AfricasTalkingTransport.name: AfricasTalkingTransport,
+    FakeTransport.name: FakeTransport,
+}
+
+
+def get_transport():
+    transport = current_app.extensions.get('sms_transport')
+    if transport is None:
+        factory = TRANSPORTS[current_app.config.get('SMS_TRANSPORT') or AfricasTalkingTransport.name]
+        transport = current_app.extensions.setdefault('sms_transport', factory())
+    return transport
+
+
+def set_transport(app, transport):
+    app.extensions['sms_transport'] = transport
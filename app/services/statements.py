@@ -0,0 +1,217 @@
+# app/services/statements.py
+"""Per-subscription account statements (payments and deliveries, in date order).
+
+Activity comes from one ``UNION ALL`` query over ``payments`` and
+``deliveries`` ordered by date, streamed with ``yield_per`` straight into a
+lazily paginated ``PdfDocument`` table; running totals are accumulated while
+the rows are written, so a long history never sits in memory.
+
+``generate_statements`` writes month-end statements for every active
+subscriber: the parent reads activity for a batch of subscriptions with the
+same merged query, and PDF rendering/writing runs across a process pool.
+The pool starts its workers with ``spawn`` (no forked engine or connection
+pool state), so jobs carry only plain dicts and tuples.
+"""
+
+import multiprocessing
+import os
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from itertools import groupby
+
+from sqlalchemy import literal, null, select, union_all
+
+from app.models import (
+    Delivery,
+    DeliveryStatus,
+    ManualPaymentStatus,
+    Payment,
+    Subscription,
+    SubscriptionPlan,
+    db,
+)
+from app.services.pdf import PdfDocument
+
+STATEMENT_BATCH_SIZE = 100
+STATEMENT_WORKERS = int(os.getenv('STATEMENT_WORKERS', '0')) or os.cpu_count() or 1
+
+KIND_PAYMENT = 'Payment'
+KIND_DELIVERY = 'Delivery'
+
+ActivityRow = namedtuple('ActivityRow', 'at kind row_id reference status amount')
+
+_COLUMNS = ('Date', 'Type', 'Reference / Notes', 'Status', 'Amount (KES)')
+_WIDTHS = (110, 65, 160, 80, 80)
+
+
+def _activity_query(subscription_ids, until):
+    payments = select(
+        Payment.subscription_id.label('subscription_id'),
+        Payment.payment_date.label('at'),
+        literal(KIND_PAYMENT).label('kind'),
+        Payment.id.label('row_id'),
+        Payment.reference_id.label('reference'),
+        Payment.payment_status.label('status'),
+        Payment.amount.label('amount'),
+    ).where(Payment.subscription_id.in_(subscription_ids), Payment.payment_date <= until)
+    deliveries = select(
+        Delivery.subscription_id.label('subscription_id'),
+        Delivery.scheduled_date.label('at'),
+        literal(KIND_DELIVERY).label('kind'),
+        Delivery.id.label('row_id'),
+        Delivery.notes.label('reference'),
+        Delivery.status.label('status'),
+        null().label('amount'),
+    ).where(Delivery.subscription_id.in_(subscription_ids), Delivery.scheduled_date <= until)
+    merged = union_all(payments, deliveries).subquery()
+    return select(merged).order_by(merged.c.subscription_id, merged.c.at, merged.c.kind, merged.c.row_id)
+
+
+def _header(sub, until):
+    return {
+        'id': sub.id,
+        'name': sub.name,
+        'phone': sub.phone,
+        'plan_name': sub.plan_name,
+        'status': sub.status,
+        'period_end': sub.current_period_end,
+        'trays_remaining': sub.trays_remaining,
+        'until': until,
+    }
+
+
+def _subscription_rows(subscription_ids):
+    return db.session.query(
+        Subscription.id,
+        Subscription.name,
+        Subscription.phone,
+        Subscription.status,
+        Subscription.current_period_end,
+        Subscription.trays_remaining,
+        SubscriptionPlan.name.label('plan_name'),
+    ).outerjoin(
+        SubscriptionPlan, Subscription.plan_id == SubscriptionPlan.id
+    ).filter(Subscription.id.in_(subscription_ids)).order_by(Subscription.id.asc()).all()
+
+
+def build_statement(header, activity):
+    """Return a ``PdfDocument`` for one subscription; ``activity`` may be a generator."""
+    totals = {'paid': 0.0, 'delivered': 0, 'payments': 0, 'deliveries': 0}
+
+    def table_rows():
+        for row in activity:
+            at = row.at.strftime('%Y-%m-%d %H:%M') if row.at else '-'
+            if row.kind == KIND_PAYMENT:
+                totals['payments'] += 1
+                if row.status == ManualPaymentStatus.CONFIRMED.value:
+                    totals['paid'] += float(row.amount or 0)
+                yield at, row.kind, row.reference or f"#{row.row_id}", row.status, f"{float(row.amount or 0):,.2f}"
+            else:
+                totals['deliveries'] += 1
+                if row.status == DeliveryStatus.DELIVERED.value:
+                    totals['delivered'] += 1
+                yield at, row.kind, row.reference or '', row.status, ''
+
+    def summary():
+        yield ""
+        yield f"Payments: {totals['payments']}   Confirmed total (KES): {totals['paid']:,.2f}"
+        yield f"Deliveries: {totals['deliveries']}   Delivered: {totals['delivered']}"
+        yield f"Trays Remaining: {header['trays_remaining'] or 0}"
+
+    period_end = header['period_end'].strftime('%Y-%m-%d') if header['period_end'] else '-'
+    doc = PdfDocument(footer=f"NestGold statement - subscription #{header['id']}")
+    doc.line("NESTGOLD PROVISIONS - ACCOUNT STATEMENT", bold=True)
+    doc.lines([
+        "----------------------------------------",
+        f"Statement Date: {header['until'].strftime('%Y-%m-%d %H:%M:%S')}",
+        f"Subscription ID: {header['id']}",
+        f"Customer: {header['name']}",
+        f"Phone: {header['phone']}",
+        f"Plan: {header['plan_name'] or '-'}",
+        f"Status: {header['status']}",
+        f"Current Period Ends: {period_end}",
+        "",
+    ])
+    doc.table(_COLUMNS, table_rows(), _WIDTHS)
+    doc.lines(summary())
+    return doc
+
+
+def iter_statement(subscription_id, until=None):
+    """Yield the PDF statement for one subscription in chunks, or return None if unknown."""
+    until = until or datetime.utcnow()
+    subs = _subscription_rows([subscription_id])
+    if not subs:
+        return None
+    activity = db.session.execute(
+        _activity_query([subscription_id], until).execution_options(yield_per=500)
+    )
+    return build_statement(_header(subs[0], until), activity).iter_bytes()
+
+
+def statement_filename(subscription_id, until):
+    return f"statement_{subscription_id}_{until:%Y%m}.pdf"
+
+
+def _write_statement(output_dir, header, activity):
+    path = os.path.join(output_dir, statement_filename(header['id'], header['until']))
+    with open(path, 'wb') as handle:
+        for chunk in build_statement(header, activity).iter_bytes():
+            handle.write(chunk)
+    return path
+
+
+def _write_batch(output_dir, jobs):
+    return [_write_statement(output_dir, header, activity) for header, activity in jobs]
+
+
+def _statement_jobs(until, batch_size):
+    """Yield lists of ``(header, activity rows)`` for active subscriptions, one batch at a time.
+
+    "Active" is the ``Subscription.is_access_active`` rule as of ``until``: the
+    paid period has not ended.  ``status`` lags behind expiry and extensions.
+    """
+    last_id = 0
+    while True:
+        ids = [row.id for row in db.session.query(Subscription.id).filter(
+            Subscription.current_period_end > until,
+            Subscription.id > last_id,
+        ).order_by(Subscription.id.asc()).limit(batch_size)]
+        if not ids:
+            return
+        last_id = ids[-1]
+
+        headers = {sub.id: _header(sub, until) for sub in _subscription_rows(ids)}
+        activity = {
+            sub_id: list(rows)
+            for sub_id, rows in groupby(db.session.execute(_activity_query(ids, until)), key=lambda r: r.subscription_id)
+        }
+        # Plain tuples keep the payload picklable for the worker processes.
+        yield [(headers[i], [ActivityRow(*row[1:]) for row in activity.get(i, [])]) for i in ids if i in headers]
+        if len(ids) < batch_size:
+            return
+
+
+def generate_statements(output_dir, until=None, workers=None, batch_size=STATEMENT_BATCH_SIZE):
+    """Write a statement PDF for every active subscription into ``output_dir``; returns the count."""
+    until = until or datetime.utcnow()
+    workers = workers or STATEMENT_WORKERS
+    os.makedirs(output_dir, exist_ok=True)
+    batches = _statement_jobs(until, batch_size)
+
+    written = 0
+    if workers <= 1:
+        for jobs in batches:
+            written += len(_write_batch(output_dir, jobs))
+        return written
+
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+        window = deque()
+        for jobs in batches:
+            window.append(pool.submit(_write_batch, output_dir, jobs))
+            if len(window) >= workers * 2:
+                written += len(window.popleft().result())
+        while window:
+            written += len(window.popleft().result())
+    return written
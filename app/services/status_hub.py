@@ -0,0 +1,90 @@
+# app/services/status_hub.py
+"""In-process notification hub for payment status changes.
+
+Waiters (the pending page's Server-Sent Events stream) subscribe to the
+canonical checkout token they are watching.  A session hook publishes the
+tokens of every payment or subscription whose status changed once the
+transaction commits, which wakes the matching waiters in this process.
+
+Writes handled by another worker (or process) cannot reach this hub, so each
+waiter also re-reads its status every ``STATUS_FALLBACK_SECONDS``; that
+recheck is the only database traffic a quiet pending page generates.
+"""
+
+import os
+import threading
+from collections import defaultdict
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from app.models import Payment, Subscription
+from app.services.payment_tokens import TOKEN_FIELDS, canonical_token
+
+STATUS_FALLBACK_SECONDS = int(os.getenv('STATUS_FALLBACK_SECONDS', '15'))
+
+_PAYMENT_STATUS_FIELDS = ('status', 'payment_status', 'manual_payment_status')
+_SUBSCRIPTION_STATUS_FIELDS = ('status', 'current_period_end')
+
+
+class StatusHub:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._waiters = defaultdict(set)
+
+    def subscribe(self, token):
+        waiter = threading.Event()
+        with self._lock:
+            self._waiters[token].add(waiter)
+        return waiter
+
+    def unsubscribe(self, token, waiter):
+        with self._lock:
+            waiters = self._waiters.get(token)
+            if waiters is not None:
+                waiters.discard(waiter)
+                if not waiters:
+                    del self._waiters[token]
+
+    def publish(self, tokens):
+        with self._lock:
+            woken = [waiter for token in tokens for waiter in self._waiters.get(token, ())]
+        for waiter in woken:
+            waiter.set()
+
+    def waiting(self):
+        with self._lock:
+            return sum(len(waiters) for waiters in self._waiters.values())
+
+
+hub = StatusHub()
+
+
+def _changed(obj, fields):
+    state = inspect(obj)
+    return any(state.attrs[attr].history.has_changes() for attr in fields)
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_status_changes(session, flush_context):
+    tokens = set()
+    for obj in session.dirty:
+        if isinstance(obj, Payment) and _changed(obj, _PAYMENT_STATUS_FIELDS):
+            tokens.update(canonical_token(getattr(obj, field)) for field in TOKEN_FIELDS)
+        elif isinstance(obj, Subscription) and _changed(obj, _SUBSCRIPTION_STATUS_FIELDS):
+            tokens.add(canonical_token(obj.checkout_request_id))
+    tokens.discard('')
+    if tokens:
+        session.info.setdefault('status_tokens', set()).update(tokens)
+
+
+@event.listens_for(Session, 'after_commit')
+def _publish_status_changes(session):
+    tokens = session.info.pop('status_tokens', None)
+    if tokens:
+        hub.publish(tokens)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_status_changes(session):
+    session.info.pop('status_tokens', None)
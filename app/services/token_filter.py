@@ -0,0 +1,184 @@
+# app/services/token_filter.py
+"""In-process guard in front of public token lookups.
+
+``may_exist`` answers "definitely not issued" without SQL for:
+
+* tracking-code-shaped tokens with a bad check character (see ``tracking``),
+* tokens absent from a Bloom filter of every row in ``payment_tokens``,
+* tokens recently confirmed missing by the database (a small TTL cache that
+  also absorbs Bloom false positives and deleted payments).
+
+The filter is built when the app starts (``init_app``; lazily on the first
+lookup if the table is not there yet) and extended with the tokens
+``payment_tokens`` writes once their transaction commits.  Tokens issued by
+other workers (or CLI jobs) are picked up by a catch-up query, run on a Bloom
+miss at most once every ``TOKEN_FILTER_SYNC_SECONDS``.  That is shorter than
+the pending page's poll interval, so a customer's fresh checkout id is found
+by any worker.
+
+Payment ids are handed out when a row is inserted, not when it commits, so a
+lower id can become visible after a higher one.  The catch-up therefore
+re-reads the last ``TOKEN_FILTER_ID_OVERLAP`` ids below the high-water mark
+on every pass instead of starting just above it.
+"""
+
+import hashlib
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app, has_app_context
+from sqlalchemy import event, func, select
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from app.models import PaymentToken, db
+from app.services.tracking import is_plausible_token
+
+TOKEN_FILTER_SYNC_SECONDS = float(os.getenv('TOKEN_FILTER_SYNC_SECONDS', '2'))
+# Payments inserted while a lower id's transaction was still open; far more than a request's worth.
+TOKEN_FILTER_ID_OVERLAP = int(os.getenv('TOKEN_FILTER_ID_OVERLAP', '500'))
+TOKEN_FILTER_FALSE_POSITIVE_RATE = 0.01
+TOKEN_FILTER_MIN_CAPACITY = 10000
+NEGATIVE_CACHE_TTL_SECONDS = int(os.getenv('NEGATIVE_CACHE_TTL_SECONDS', '30'))
+NEGATIVE_CACHE_MAX_ENTRIES = 10000
+
+
+class BloomFilter:
+    def __init__(self, capacity, false_positive_rate=TOKEN_FILTER_FALSE_POSITIVE_RATE):
+        self.capacity = capacity
+        self.size = max(8, int(-capacity * math.log(false_positive_rate) / (math.log(2) ** 2)))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, key):
+        for pos in self._positions(key):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, key):
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+
+class TokenFilter:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._bloom = None
+        self._high_water = 0
+        self._synced_at = 0.0
+        self._missing = OrderedDict()
+
+    def _load(self, bloom, rows):
+        """Add ``rows`` to ``bloom``; False if it filled up and needs rebuilding larger."""
+        for token, payment_id in rows:
+            if bloom.count >= bloom.capacity:
+                return False
+            # The catch-up overlap re-reads tokens already in the filter; don't count them twice.
+            if token not in bloom:
+                bloom.add(token)
+            self._missing.pop(token, None)
+            self._high_water = max(self._high_water, payment_id)
+        return True
+
+    def rebuild(self):
+        with self._lock:
+            total = db.session.execute(select(func.count()).select_from(PaymentToken)).scalar() or 0
+            bloom = BloomFilter(max(TOKEN_FILTER_MIN_CAPACITY, total * 2))
+            self._high_water = 0
+            self._load(bloom, db.session.execute(
+                select(PaymentToken.token, PaymentToken.payment_id).execution_options(yield_per=5000)
+            ))
+            # Swap in the finished filter so concurrent readers never see a partial one.
+            self._bloom = bloom
+            self._synced_at = time.monotonic()
+
+    def _catch_up(self):
+        with self._lock:
+            if time.monotonic() - self._synced_at < TOKEN_FILTER_SYNC_SECONDS:
+                return
+            rows = db.session.execute(
+                select(PaymentToken.token, PaymentToken.payment_id).where(
+                    PaymentToken.payment_id > self._high_water - TOKEN_FILTER_ID_OVERLAP
+                )
+            ).all()
+            self._synced_at = time.monotonic()
+            full = not self._load(self._bloom, rows)
+        if full:
+            self.rebuild()
+
+    def add(self, tokens):
+        if self._bloom is None:
+            return
+        with self._lock:
+            for token in tokens:
+                self._bloom.add(token)
+                self._missing.pop(token, None)
+        if self._bloom.count >= self._bloom.capacity:
+            self.rebuild()
+
+    def may_exist(self, token):
+        if not is_plausible_token(token):
+            return False
+        expires = self._missing.get(token)
+        if expires is not None:
+            if expires > time.monotonic():
+                return False
+            self._missing.pop(token, None)
+        if self._bloom is None:
+            self.rebuild()
+        if token in self._bloom:
+            return True
+        self._catch_up()
+        return token in self._bloom
+
+    def remember_missing(self, token):
+        with self._lock:
+            self._missing[token] = time.monotonic() + NEGATIVE_CACHE_TTL_SECONDS
+            self._missing.move_to_end(token)
+            while len(self._missing) > NEGATIVE_CACHE_MAX_ENTRIES:
+                self._missing.popitem(last=False)
+
+
+def init_app(app):
+    """Build this process's filter now rather than on the first public lookup."""
+    if not app.config.get('TOKEN_FILTER_PRELOAD', True):
+        return
+    with app.app_context():
+        try:
+            get_filter().rebuild()
+        except SQLAlchemyError:
+            # No payment_tokens table yet (fresh database, `flask db upgrade`): build lazily.
+            db.session.rollback()
+            app.logger.warning('Token filter not preloaded; it will be built on first lookup.')
+        finally:
+            db.session.remove()
+            # Don't hand pooled connections to forked workers (gunicorn --preload).
+            db.engine.dispose()
+
+
+def get_filter():
+    token_filter = current_app.extensions.get('token_filter')
+    if token_filter is None:
+        token_filter = current_app.extensions.setdefault('token_filter', TokenFilter())
+    return token_filter
+
+
+@event.listens_for(Session, 'after_commit')
+def _publish_issued_tokens(session):
+    issued = session.info.pop('issued_tokens', None)
+    if issued and has_app_context():
+        get_filter().add(issued)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_issued_tokens(session):
+    session.info.pop('issued_tokens', None)
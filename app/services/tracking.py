@@ -0,0 +1,55 @@
+# app/services/tracking.py
+"""Customer-facing tracking code generation.
+
+Codes are ``TRACKING_BODY_LENGTH`` random characters plus a Luhn mod 36 check
+character, so typos and made-up codes can be rejected before any lookup.
+Codes issued before the check character existed are shorter and are still
+accepted as-is.
+"""
+
+import secrets
+import string
+
+from app.models import Payment, db
+
+TRACKING_ALPHABET = string.digits + string.ascii_uppercase
+TRACKING_BODY_LENGTH = 11
+TRACKING_CODE_LENGTH = TRACKING_BODY_LENGTH + 1
+
+
+def tracking_check_char(body):
+    """Luhn mod N check character over ``TRACKING_ALPHABET``."""
+    base = len(TRACKING_ALPHABET)
+    factor = 2
+    total = 0
+    for char in reversed(body):
+        addend = factor * TRACKING_ALPHABET.index(char)
+        total += addend // base + addend % base
+        factor = 1 if factor == 2 else 2
+    return TRACKING_ALPHABET[(base - total % base) % base]
+
+
+def is_plausible_token(token):
+    """False only for tokens shaped like a current tracking code whose check character is wrong."""
+    if len(token) != TRACKING_CODE_LENGTH or not all(c in TRACKING_ALPHABET for c in token):
+        return True
+    return tracking_check_char(token[:-1]) == token[-1]
+
+
+def new_tracking_code():
+    body = ''.join(secrets.choice(TRACKING_ALPHABET) for _ in range(TRACKING_BODY_LENGTH))
+    return body + tracking_check_char(body)
+
+
+def new_tracking_codes(count):
+    """Return ``count`` distinct codes not yet issued, checked with one ``IN`` query per round."""
+    codes = set()
+    while len(codes) < count:
+        candidates = {new_tracking_code() for _ in range(count - len(codes))} - codes
+        taken = {
+            row.tracking_code for row in db.session.query(Payment.tracking_code).filter(
+                Payment.tracking_code.in_(candidates)
+            )
+        }
+        codes.update(candidates - taken)
+    return list(codes)
@@ -0,0 +1,53 @@
+"""add search tokens table
+
+Revision ID: 1d8e5a2f4c90
+Revises: c9f4b1a7e2d3
+Create Date: 2026-10-19 09:00:00.000000
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "1d8e5a2f4c90"
+down_revision = "c9f4b1a7e2d3"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    tables = set(inspector.get_table_names())
+    if "search_tokens" in tables:
+        return
+
+    # Populate afterwards with `flask --app run search-reindex`.
+    op.create_table(
+        "search_tokens",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("entity_type", sa.String(length=20), nullable=False),
+        sa.Column("entity_id", sa.Integer(), nullable=False),
+        sa.Column("token", sa.String(length=24), nullable=False),
+        sa.Column("weight", sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(
+        "ix_search_tokens_token_entity",
+        "search_tokens",
+        ["token", "entity_type", "entity_id", "weight"],
+        unique=False,
+    )
+    op.create_index("ix_search_tokens_entity", "search_tokens", ["entity_type", "entity_id"], unique=False)
+
+
+def downgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    tables = set(inspector.get_table_names())
+    if "search_tokens" not in tables:
+        return
+
+    op.drop_index("ix_search_tokens_entity", table_name="search_tokens")
+    op.drop_index("ix_search_tokens_token_entity", table_name="search_tokens")
+    op.drop_table("search_tokens")
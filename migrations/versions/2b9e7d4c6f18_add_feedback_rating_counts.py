@@ -0,0 +1,46 @@
+"""add feedback rating counts
+
+Revision ID: 2b9e7d4c6f18
+Revises: 8d4f2b6a1c37
+Create Date: 2026-10-19 17:00:00.000000
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "2b9e7d4c6f18"
+down_revision = "8d4f2b6a1c37"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    tables = set(inspector.get_table_names())
+    if "feedback_rating_counts" in tables:
+        return
+
+    op.create_table(
+        "feedback_rating_counts",
+        sa.Column("rating", sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column("count", sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint("rating"),
+    )
+    op.execute(
+        """
+        INSERT INTO feedback_rating_counts (rating, count)
+        SELECT rating, COUNT(*) FROM feedback GROUP BY rating
+        """
+    )
+
+
+def downgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    tables = set(inspector.get_table_names())
+    if "feedback_rating_counts" not in tables:
+        return
+
+    op.drop_table("feedback_rating_counts")
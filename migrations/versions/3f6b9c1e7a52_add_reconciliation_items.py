@@ -0,0 +1,65 @@
+"""add reconciliation items and payment receipt index
+
+Revision ID: 3f6b9c1e7a52
+Revises: 1d8e5a2f4c90
+Create Date: 2026-10-19 12:00:00.000000
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "3f6b9c1e7a52"
+down_revision = "1d8e5a2f4c90"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    tables = set(inspector.get_table_names())
+
+    if "payments" in tables:
+        indexes = {i["name"] for i in inspector.get_indexes("payments")}
+        if "ix_payments_mpesa_receipt" not in indexes:
+            op.create_index("ix_payments_mpesa_receipt", "payments", ["mpesa_receipt"], unique=False)
+
+    if "reconciliation_items" not in tables:
+        op.create_table(
+            "reconciliation_items",
+            sa.Column("id", sa.Integer(), nullable=False),
+            sa.Column("import_batch", sa.String(length=40), nullable=False),
+            sa.Column("receipt_no", sa.String(length=50), nullable=True),
+            sa.Column("transaction_time", sa.String(length=40), nullable=True),
+            sa.Column("amount", sa.Float(), nullable=True),
+            sa.Column("phone", sa.String(length=20), nullable=True),
+            sa.Column("account_ref", sa.String(length=100), nullable=True),
+            sa.Column("details", sa.Text(), nullable=True),
+            sa.Column("suggested_payment_id", sa.Integer(), nullable=True),
+            sa.Column("match_reason", sa.String(length=40), nullable=True),
+            sa.Column("status", sa.String(length=20), nullable=False),
+            sa.Column("created_at", sa.DateTime(), nullable=False),
+            sa.ForeignKeyConstraint(["suggested_payment_id"], ["payments.id"], ondelete="SET NULL"),
+            sa.PrimaryKeyConstraint("id"),
+        )
+        op.create_index("ix_reconciliation_items_import_batch", "reconciliation_items", ["import_batch"], unique=False)
+        op.create_index("ix_reconciliation_items_receipt_no", "reconciliation_items", ["receipt_no"], unique=False)
+        op.create_index("ix_reconciliation_items_status", "reconciliation_items", ["status"], unique=False)
+
+
+def downgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    tables = set(inspector.get_table_names())
+
+    if "reconciliation_items" in tables:
+        op.drop_index("ix_reconciliation_items_status", table_name="reconciliation_items")
+        op.drop_index("ix_reconciliation_items_receipt_no", table_name="reconciliation_items")
+        op.drop_index("ix_reconciliation_items_import_batch", table_name="reconciliation_items")
+        op.drop_table("reconciliation_items")
+
+    if "payments" in tables:
+        indexes = {i["name"] for i in inspector.get_indexes("payments")}
+        if "ix_payments_mpesa_receipt" in indexes:
+            op.drop_index("ix_payments_mpesa_receipt", table_name="payments")
@@ -0,0 +1,76 @@
+"""add sms campaigns
+
+Revision ID: 4f8a2c6e1b73
+Revises: 6c1e8f3a2d95
+Create Date: 2026-10-19 19:00:00.000000
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "4f8a2c6e1b73"
+down_revision = "6c1e8f3a2d95"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    tables = set(inspector.get_table_names())
+
+    if "sms_campaigns" not in tables:
+        op.create_table(
+            "sms_campaigns",
+            sa.Column("id", sa.Integer(), nullable=False),
+            sa.Column("key", sa.String(length=80), nullable=False),
+            sa.Column("kind", sa.String(length=40), nullable=False),
+            sa.Column("template", sa.Text(), nullable=False),
+            sa.Column("status", sa.String(length=20), nullable=False),
+            sa.Column("cursor", sa.String(length=64), nullable=True),
+            sa.Column("recipients", sa.Integer(), nullable=False),
+            sa.Column("created_at", sa.DateTime(), nullable=False),
+            sa.Column("queued_at", sa.DateTime(), nullable=True),
+            sa.PrimaryKeyConstraint("id"),
+            sa.UniqueConstraint("key"),
+        )
+
+    if "sms_outbox" in tables:
+        columns = {c["name"] for c in inspector.get_columns("sms_outbox")}
+        if "campaign_id" not in columns:
+            with op.batch_alter_table("sms_outbox", schema=None) as batch_op:
+                batch_op.add_column(sa.Column("campaign_id", sa.Integer(), nullable=True))
+                batch_op.create_foreign_key(
+                    "fk_sms_outbox_campaign_id", "sms_campaigns", ["campaign_id"], ["id"], ondelete="SET NULL"
+                )
+                batch_op.create_index("ix_sms_outbox_campaign_id", ["campaign_id"], unique=False)
+
+    if "subscriptions" in tables:
+        indexes = {index["name"] for index in inspector.get_indexes("subscriptions")}
+        if "ix_subscriptions_delivery_day_id" not in indexes:
+            op.create_index(
+                "ix_subscriptions_delivery_day_id", "subscriptions", ["preferred_delivery_day", "id"], unique=False
+            )
+
+
+def downgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    tables = set(inspector.get_table_names())
+
+    if "subscriptions" in tables:
+        indexes = {index["name"] for index in inspector.get_indexes("subscriptions")}
+        if "ix_subscriptions_delivery_day_id" in indexes:
+            op.drop_index("ix_subscriptions_delivery_day_id", table_name="subscriptions")
+
+    if "sms_outbox" in tables:
+        columns = {c["name"] for c in inspector.get_columns("sms_outbox")}
+        if "campaign_id" in columns:
+            with op.batch_alter_table("sms_outbox", schema=None) as batch_op:
+                batch_op.drop_index("ix_sms_outbox_campaign_id")
+                batch_op.drop_constraint("fk_sms_outbox_campaign_id", type_="foreignkey")
+                batch_op.drop_column("campaign_id")
+
+    if "sms_campaigns" in tables:
+        op.drop_table("sms_campaigns")
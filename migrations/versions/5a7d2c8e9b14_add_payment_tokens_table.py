@@ -0,0 +1,64 @@
+"""add payment tokens lookup table
+
+Revision ID: 5a7d2c8e9b14
+Revises: 3f6b9c1e7a52
+Create Date: 2026-10-19 12:00:00.000000
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "5a7d2c8e9b14"
+down_revision = "3f6b9c1e7a52"
+branch_labels = None
+depends_on = None
+
+TOKEN_COLUMNS = ("tracking_code", "reference_id", "checkout_request_id")
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    tables = set(inspector.get_table_names())
+    if "payment_tokens" in tables:
+        return
+
+    op.create_table(
+        "payment_tokens",
+        sa.Column("token", sa.String(length=100), nullable=False),
+        sa.Column("payment_id", sa.Integer(), nullable=False),
+        sa.Column("subscription_id", sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(["payment_id"], ["payments.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("token"),
+    )
+    op.create_index("ix_payment_tokens_payment_id", "payment_tokens", ["payment_id"], unique=False)
+
+    # Backfill in column order so a tracking code wins over a reference that
+    # happens to collide with it; `flask --app run payment-tokens-reindex`
+    # rebuilds the same data from the application side.
+    for column in TOKEN_COLUMNS:
+        op.execute(
+            f"""
+            INSERT INTO payment_tokens (token, payment_id, subscription_id)
+            SELECT UPPER(TRIM(p.{column})), MIN(p.id), MIN(p.subscription_id)
+            FROM payments p
+            WHERE p.{column} IS NOT NULL
+              AND TRIM(p.{column}) <> ''
+              AND NOT EXISTS (
+                  SELECT 1 FROM payment_tokens t WHERE t.token = UPPER(TRIM(p.{column}))
+              )
+            GROUP BY UPPER(TRIM(p.{column}))
+            """
+        )
+
+
+def downgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    tables = set(inspector.get_table_names())
+    if "payment_tokens" not in tables:
+        return
+
+    op.drop_index("ix_payment_tokens_payment_id", table_name="payment_tokens")
+    op.drop_table("payment_tokens")
@@ -0,0 +1,54 @@
+"""add sms outbox
+
+Revision ID: 6c1e8f3a2d95
+Revises: 2b9e7d4c6f18
+Create Date: 2026-10-19 18:00:00.000000
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "6c1e8f3a2d95"
+down_revision = "2b9e7d4c6f18"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    tables = set(inspector.get_table_names())
+    if "sms_outbox" in tables:
+        return
+
+    op.create_table(
+        "sms_outbox",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("kind", sa.String(length=40), nullable=False),
+        sa.Column("recipient", sa.String(length=20), nullable=False),
+        sa.Column("message", sa.Text(), nullable=False),
+        sa.Column("status", sa.String(length=20), nullable=False),
+        sa.Column("attempts", sa.Integer(), nullable=False),
+        sa.Column("next_attempt_at", sa.DateTime(), nullable=False),
+        sa.Column("claim_token", sa.String(length=32), nullable=True),
+        sa.Column("provider_message_id", sa.String(length=100), nullable=True),
+        sa.Column("last_error", sa.Text(), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.Column("sent_at", sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_sms_outbox_status_next_attempt", "sms_outbox", ["status", "next_attempt_at"], unique=False)
+    op.create_index("ix_sms_outbox_claim_token", "sms_outbox", ["claim_token"], unique=False)
+
+
+def downgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    tables = set(inspector.get_table_names())
+    if "sms_outbox" not in tables:
+        return
+
+    op.drop_index("ix_sms_outbox_claim_token", table_name="sms_outbox")
+    op.drop_index("ix_sms_outbox_status_next_attempt", table_name="sms_outbox")
+    op.drop_table("sms_outbox")
@@ -0,0 +1,44 @@
+"""add signup idempotency keys table
+
+Revision ID: 7e3c1a9d5b20
+Revises: 5a7d2c8e9b14
+Create Date: 2026-10-19 14:00:00.000000
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "7e3c1a9d5b20"
+down_revision = "5a7d2c8e9b14"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    tables = set(inspector.get_table_names())
+    if "signup_requests" in tables:
+        return
+
+    op.create_table(
+        "signup_requests",
+        sa.Column("key", sa.String(length=64), nullable=False),
+        sa.Column("payment_id", sa.Integer(), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(["payment_id"], ["payments.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("key"),
+    )
+    op.create_index("ix_signup_requests_created_at", "signup_requests", ["created_at"], unique=False)
+
+
+def downgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    tables = set(inspector.get_table_names())
+    if "signup_requests" not in tables:
+        return
+
+    op.drop_index("ix_signup_requests_created_at", table_name="signup_requests")
+    op.drop_table("signup_requests")
@@ -0,0 +1,33 @@
+"""add deliveries (subscription_id, scheduled_date) index
+
+Revision ID: 8d4f2b6a1c37
+Revises: 7e3c1a9d5b20
+Create Date: 2026-10-19 16:00:00.000000
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "8d4f2b6a1c37"
+down_revision = "7e3c1a9d5b20"
+branch_labels = None
+depends_on = None
+
+INDEX_NAME = "ix_deliveries_subscription_scheduled"
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    existing = {index["name"] for index in inspector.get_indexes("deliveries")}
+    if INDEX_NAME not in existing:
+        op.create_index(INDEX_NAME, "deliveries", ["subscription_id", "scheduled_date"], unique=False)
+
+
+def downgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    existing = {index["name"] for index in inspector.get_indexes("deliveries")}
+    if INDEX_NAME in existing:
+        op.drop_index(INDEX_NAME, table_name="deliveries")
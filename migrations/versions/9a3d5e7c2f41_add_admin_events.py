@@ -0,0 +1,46 @@
+"""add admin events
+
+Revision ID: 9a3d5e7c2f41
+Revises: 4f8a2c6e1b73
+Create Date: 2026-10-19 20:00:00.000000
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "9a3d5e7c2f41"
+down_revision = "4f8a2c6e1b73"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    tables = set(inspector.get_table_names())
+    if "admin_events" in tables:
+        return
+
+    op.create_table(
+        "admin_events",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("kind", sa.String(length=40), nullable=False),
+        sa.Column("plan_name", sa.String(length=100), nullable=True),
+        sa.Column("amount", sa.Float(), nullable=True),
+        sa.Column("reference", sa.String(length=100), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_admin_events_created_at", "admin_events", ["created_at"], unique=False)
+
+
+def downgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    tables = set(inspector.get_table_names())
+    if "admin_events" not in tables:
+        return
+
+    op.drop_index("ix_admin_events_created_at", table_name="admin_events")
+    op.drop_table("admin_events")
@@ -0,0 +1,117 @@
+# tests/conftest.py
+import os
+import sys
+from datetime import datetime, timedelta
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    monkeypatch.setenv('DATABASE_URL', f"sqlite:///{tmp_path / 'test.db'}")
+    monkeypatch.setenv('SMS_OUTBOX_WORKER', 'off')
+    monkeypatch.setenv('PAYMENT_EXPIRY_SCHEDULE', 'off')
+    monkeypatch.setenv('TOKEN_FILTER_PRELOAD', '0')
+    monkeypatch.setenv('PUBLIC_PAGE_CACHE', '0')
+    monkeypatch.setenv('RECEIPT_CACHE_DIR', str(tmp_path / 'receipts'))
+
+    from app import create_app, db
+
+    app = create_app()
+    app.config.update(TESTING=True, WTF_CSRF_ENABLED=False)
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.engine.dispose()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def admin_client(app, client):
+    from app.models import User, db
+
+    admin = User(username='admin', role='admin')
+    admin.set_password('pw')
+    db.session.add(admin)
+    db.session.commit()
+    client.post('/auth/login', data={'username': 'admin', 'password': 'pw'})
+    return client
+
+
+@pytest.fixture
+def plan(app):
+    from app.models import SubscriptionPlan, db
+
+    plan = SubscriptionPlan(name='Basic', trays_per_week=1, price_per_month=1000)
+    db.session.add(plan)
+    db.session.commit()
+    return plan
+
+
+@pytest.fixture
+def make_subscription(app, plan):
+    from app.models import Subscription, SubscriptionStatus, db
+
+    counter = iter(range(1, 100000))
+
+    def make(status=SubscriptionStatus.ACTIVE.value, period_days=10, **fields):
+        n = next(counter)
+        now = datetime.utcnow()
+        values = dict(
+            plan_id=plan.id,
+            start_date=now,
+            current_period_end=now + timedelta(days=period_days),
+            next_delivery_date=now + timedelta(days=1),
+            status=status,
+            preferred_delivery_day='Monday',
+            phone=f'0711{n:06d}',
+            phone_normalized=f'254711{n:06d}',
+            name=f'Customer {n}',
+            location='Nairobi',
+        )
+        values.update(fields)
+        sub = Subscription(**values)
+        db.session.add(sub)
+        db.session.commit()
+        return sub
+
+    return make
+
+
+@pytest.fixture
+def make_payment(app):
+    from app.models import Payment, db
+
+    counter = iter(range(1, 100000))
+
+    def make(subscription, payment_status='Pending', age_hours=0, amount=None, **fields):
+        n = next(counter)
+        reference = fields.pop('reference_id', f'NESTGOLD-{subscription.id}-{n}')
+        values = dict(
+            subscription_id=subscription.id,
+            amount=amount if amount is not None else 1000,
+            checkout_request_id=reference,
+            reference_id=reference,
+            customer_name=subscription.name,
+            customer_phone=subscription.phone_normalized,
+            status='Completed' if payment_status == 'Confirmed' else 'Pending',
+            payment_status=payment_status,
+            manual_payment_status=payment_status,
+            payment_method='Manual',
+            tracking_code=f'TK{n:08d}',
+            payment_date=datetime.utcnow() - timedelta(hours=age_hours),
+        )
+        values.update(fields)
+        payment = Payment(**values)
+        db.session.add(payment)
+        db.session.commit()
+        return payment
+
+    return make
@@ -0,0 +1,63 @@
+# tests/test_admin_digest.py
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.models import AdminEvent, SmsOutbox, db
+from app.services import admin_digest
+
+
+@pytest.fixture
+def admin_phone(monkeypatch):
+    monkeypatch.setattr(admin_digest, 'ADMIN_PHONE', '254700000999')
+
+
+def _record(now, plan_name='Basic', amount=1000):
+    admin_digest.record('payment_request', plan_name=plan_name, amount=amount, reference='NESTGOLD-1-1', now=now)
+    db.session.commit()
+
+
+def test_event_recorded_by_web_is_flushed_by_worker(app, admin_phone):
+    start = datetime.utcnow()
+    web_buffer = admin_digest.DigestBuffer()
+    worker_buffer = admin_digest.DigestBuffer()
+
+    # The worker process reads an empty table first.
+    app.extensions['admin_digest'] = worker_buffer
+    assert admin_digest.flush_due(now=start) == 0
+
+    # A web process records an event; only its own buffer hears about it.
+    app.extensions['admin_digest'] = web_buffer
+    _record(start + timedelta(seconds=1))
+    assert (web_buffer.pending, worker_buffer.pending) == (1, 0)
+
+    app.extensions['admin_digest'] = worker_buffer
+    assert admin_digest.flush_due(now=start + timedelta(hours=5)) == 1
+    assert AdminEvent.query.count() == 0
+    assert [row.recipient for row in SmsOutbox.query] == ['254700000999']
+
+
+def test_worker_reads_table_once_per_window(app, admin_phone):
+    start = datetime.utcnow()
+    window = timedelta(seconds=admin_digest.ADMIN_DIGEST_WINDOW_SECONDS)
+    worker_buffer = app.extensions['admin_digest'] = admin_digest.DigestBuffer()
+    assert admin_digest.flush_due(now=start) == 0
+    db.session.execute(AdminEvent.__table__.insert(), {
+        'kind': 'payment_request', 'plan_name': 'Basic', 'amount': 1000, 'created_at': start,
+    })
+    db.session.commit()
+
+    assert not worker_buffer.due(start + window / 2)
+    # The first read after a window finds the event; it is sent once it is a window old.
+    assert admin_digest.flush_due(now=start + window) == 1
+
+
+def test_young_events_wait_for_the_window(app, admin_phone):
+    start = datetime.utcnow()
+    _record(start)
+
+    assert admin_digest.flush_due(now=start + timedelta(seconds=1)) == 0
+    assert admin_digest.get_buffer().due(start + timedelta(seconds=admin_digest.ADMIN_DIGEST_WINDOW_SECONDS))
+    assert admin_digest.flush_due(now=start + timedelta(seconds=admin_digest.ADMIN_DIGEST_WINDOW_SECONDS)) == 1
+    digest = SmsOutbox.query.one().message
+    assert 'Basic: 1 / KES 1,000' in digest
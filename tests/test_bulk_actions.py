@@ -0,0 +1,63 @@
+# tests/test_bulk_actions.py
+import json
+from datetime import datetime, timedelta
+
+from app.models import AuditLog, Subscription, db
+from app.services import bulk_actions
+
+
+def _period_end(sub_id):
+    db.session.expire_all()
+    return db.session.get(Subscription, sub_id).current_period_end
+
+
+def test_bulk_extend_only_paid_or_current(make_subscription, make_payment):
+    now = datetime.utcnow()
+    current = make_subscription(period_days=10)
+    paid_lapsed = make_subscription(status='Expired', period_days=-5)
+    make_payment(paid_lapsed, payment_status='Confirmed')
+    never_paid = make_subscription(status='Pending', period_days=-1)
+    make_payment(never_paid, payment_status='Pending')
+    current_end = current.current_period_end
+    never_paid_end = never_paid.current_period_end
+
+    outcomes = bulk_actions.bulk_extend(
+        [current.id, paid_lapsed.id, never_paid.id, 999999], days=30, now=now
+    )
+
+    assert outcomes == {
+        current.id: bulk_actions.OUTCOME_EXTENDED,
+        paid_lapsed.id: bulk_actions.OUTCOME_EXTENDED,
+        never_paid.id: bulk_actions.OUTCOME_SKIPPED,
+        999999: bulk_actions.OUTCOME_NOT_FOUND,
+    }
+    assert abs(_period_end(current.id) - (current_end + timedelta(days=30))) < timedelta(seconds=1)
+    assert abs(_period_end(paid_lapsed.id) - (now + timedelta(days=30))) < timedelta(seconds=1)
+    assert _period_end(never_paid.id) == never_paid_end
+    assert db.session.get(Subscription, paid_lapsed.id).status == 'Active'
+    assert db.session.get(Subscription, never_paid.id).status == 'Pending'
+
+
+def test_bulk_extend_reads_committed_period_end(make_subscription):
+    sub = make_subscription(period_days=10)
+    stale_view = sub.current_period_end
+    # A payment confirmation lands after the admin loaded the dashboard.
+    Subscription.query.filter_by(id=sub.id).update(
+        {Subscription.current_period_end: stale_view + timedelta(days=30)}, synchronize_session=False
+    )
+    db.session.commit()
+
+    bulk_actions.bulk_extend([sub.id], days=7)
+
+    assert abs(_period_end(sub.id) - (stale_view + timedelta(days=37))) < timedelta(seconds=1)
+
+
+def test_bulk_extend_audits_only_extended(make_subscription):
+    extended = make_subscription(period_days=3)
+    skipped = make_subscription(status='Cancelled', period_days=-3)
+
+    bulk_actions.bulk_extend([extended.id, skipped.id], days=5)
+
+    audits = AuditLog.query.filter_by(action='bulk_extend').all()
+    assert len(audits) == 1
+    assert json.loads(audits[0].after_json)['ids'] == [extended.id]
@@ -0,0 +1,47 @@
+# tests/test_feedback.py
+from app.models import Feedback, db
+from app.services import feedback
+
+
+def _post(rating, name='Jane'):
+    entry = Feedback(name=name, rating=rating, comment='Fresh eggs')
+    db.session.add(entry)
+    db.session.commit()
+    return entry
+
+
+def test_counts_follow_insert_edit_and_delete(app):
+    first = _post(5)
+    _post(4)
+    _post(5)
+    assert feedback.rating_summary()[:3] == (3, 14, 4.7)
+
+    first.rating = 1
+    db.session.commit()
+    assert feedback.rating_summary().histogram == {5: 1, 4: 1, 3: 0, 2: 0, 1: 1}
+
+    db.session.delete(first)
+    db.session.commit()
+    assert feedback.rating_summary()[:3] == (2, 9, 4.5)
+
+
+def test_rolled_back_feedback_leaves_counts_alone(app):
+    _post(3)
+    db.session.add(Feedback(name='Bob', rating=1, comment='-'))
+    db.session.flush()
+    db.session.rollback()
+
+    assert feedback.rating_summary().histogram[1] == 0
+    assert feedback.rating_summary().count == 1
+
+
+def test_recent_then_older_pages(app, monkeypatch):
+    monkeypatch.setattr(feedback, 'FEEDBACK_PAGE_SIZE', 2)
+    entries = [_post(5, name=f'Customer {i}') for i in range(5)]
+
+    recent, has_older = feedback.older_feedback(None, limit=2)
+    assert [row.id for row in recent] == [entries[4].id, entries[3].id] and has_older
+    older, has_older = feedback.older_feedback(recent[-1].id, limit=2)
+    assert [row.id for row in older] == [entries[2].id, entries[1].id] and has_older
+    last, has_older = feedback.older_feedback(older[-1].id, limit=2)
+    assert [row.id for row in last] == [entries[0].id] and not has_older
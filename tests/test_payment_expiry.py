@@ -0,0 +1,43 @@
+# tests/test_payment_expiry.py
+import json
+
+from sqlalchemy import event
+
+from app.models import AuditLog, ManualPaymentStatus, Payment, db
+from app.services.payment_expiry import expire_stale_payments
+
+
+def test_expires_only_stale_pending(make_subscription, make_payment):
+    sub = make_subscription()
+    stale = make_payment(sub, age_hours=100)
+    fresh = make_payment(sub, age_hours=1)
+    paid = make_payment(sub, payment_status='Confirmed', age_hours=100)
+
+    assert expire_stale_payments(max_age_hours=72) == 1
+    db.session.expire_all()
+    assert db.session.get(Payment, stale.id).payment_status == ManualPaymentStatus.EXPIRED.value
+    assert db.session.get(Payment, fresh.id).payment_status == ManualPaymentStatus.PENDING.value
+    assert db.session.get(Payment, paid.id).payment_status == ManualPaymentStatus.CONFIRMED.value
+
+
+def test_audits_only_rows_the_update_changed(make_subscription, make_payment):
+    sub = make_subscription()
+    raced = make_payment(sub, age_hours=100)
+    stale = make_payment(sub, age_hours=100)
+
+    # Confirm one payment between the job's SELECT and its UPDATE.
+    raced_once = []
+
+    def confirm_first(conn, cursor, statement, parameters, context, executemany):
+        if not raced_once and statement.lstrip().upper().startswith('UPDATE PAYMENTS'):
+            raced_once.append(True)
+            cursor.execute("UPDATE payments SET payment_status = 'Confirmed' WHERE id = ?", (raced.id,))
+
+    event.listen(db.engine, 'before_cursor_execute', confirm_first)
+    try:
+        assert expire_stale_payments(max_age_hours=72) == 1
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', confirm_first)
+
+    audit = AuditLog.query.filter_by(action='bulk_expire').one()
+    assert json.loads(audit.after_json)['ids'] == [stale.id]
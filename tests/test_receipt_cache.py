@@ -0,0 +1,32 @@
+# tests/test_receipt_cache.py
+import os
+import time
+
+from app.services import receipt_cache
+
+
+def test_deleting_subscription_drops_cached_receipts(admin_client, make_subscription, make_payment):
+    sub = make_subscription(delivery_status='Completed')
+    payment = make_payment(sub, payment_status='Confirmed')
+    sub_id, payment_id, code = sub.id, payment.id, payment.tracking_code
+    url = f'/track/{code}/receipt'
+    assert admin_client.get(url).status_code == 200
+    assert admin_client.get(f'/admin/payments/{payment_id}/receipt').status_code == 200
+    assert receipt_cache.get_cache().lookup(receipt_cache.KIND_TRACK, code)
+
+    admin_client.post(f'/admin/subscriptions/delete/{sub_id}')
+
+    assert receipt_cache.get_cache().lookup(receipt_cache.KIND_TRACK, code) is None
+    assert admin_client.get(url).status_code == 404
+    assert admin_client.get(f'/admin/payments/{payment_id}/receipt').status_code == 404
+
+
+def test_pointers_expire(app, monkeypatch):
+    cache = receipt_cache.get_cache()
+    cache.store(receipt_cache.KIND_TRACK, ['TOKEN1'], 'r.pdf', 'application/pdf', ['x'], lambda: b'%PDF')
+    assert cache.lookup(receipt_cache.KIND_TRACK, 'TOKEN1')
+
+    stale = time.time() - receipt_cache.RECEIPT_POINTER_TTL_SECONDS - 1
+    os.utime(cache._pointer_path(receipt_cache.KIND_TRACK, 'TOKEN1'), (stale, stale))
+
+    assert cache.lookup(receipt_cache.KIND_TRACK, 'TOKEN1') is None
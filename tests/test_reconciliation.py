@@ -0,0 +1,54 @@
+# tests/test_reconciliation.py
+import io
+
+from app.models import Payment, ReconciliationItem, db
+from app.services import reconciliation
+
+HEADER = 'Receipt No.,Completion Time,Details,Transaction Status,Paid In,Other Party Info,A/C No.\n'
+
+
+def _statement(*lines):
+    return io.StringIO(HEADER + ''.join(f'{line}\n' for line in lines))
+
+
+def _status(payment_id):
+    db.session.expire_all()
+    return db.session.get(Payment, payment_id).payment_status
+
+
+def test_phone_amount_alone_goes_to_review(make_subscription, make_payment):
+    sub = make_subscription(status='Pending')
+    payment = make_payment(sub)
+
+    stats = reconciliation.reconcile_statement(_statement(
+        f'RCP0000001,2026-10-01 10:00,Payment,Completed,1000.00,{sub.phone_normalized} - Jane,',
+    ))
+
+    assert (stats['confirmed'], stats['review']) == (0, 1)
+    assert _status(payment.id) == 'Pending'
+    item = ReconciliationItem.query.one()
+    assert (item.suggested_payment_id, item.match_reason) == (payment.id, reconciliation.REASON_PHONE_AMOUNT)
+
+
+def test_phone_amount_with_near_reference_is_confirmed(make_subscription, make_payment):
+    sub = make_subscription(status='Pending')
+    payment = make_payment(sub, reference_id='NESTGOLD-42-1700000000')
+
+    stats = reconciliation.reconcile_statement(_statement(
+        f'RCP0000002,2026-10-01 10:00,Payment,Completed,1000.00,{sub.phone_normalized} - Jane,NESTGOLD4217000000',
+    ))
+
+    assert stats['confirmed'] == 1
+    assert _status(payment.id) == 'Confirmed'
+
+
+def test_reference_match_is_confirmed(make_subscription, make_payment):
+    sub = make_subscription(status='Pending')
+    payment = make_payment(sub)
+
+    stats = reconciliation.reconcile_statement(_statement(
+        f'RCP0000003,2026-10-01 10:00,Payment,Completed,1000.00,0700000000 - Other,{payment.reference_id}',
+    ))
+
+    assert stats['confirmed'] == 1
+    assert _status(payment.id) == 'Confirmed'
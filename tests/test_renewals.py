@@ -0,0 +1,30 @@
+# tests/test_renewals.py
+from app.models import Payment, SmsOutbox, SubscriptionStatus
+from app.services.renewals import generate_renewal_payments
+from app.services.sms_transport import FakeTransport, set_transport
+
+
+def test_selects_only_live_subscriptions_in_window(make_subscription, make_payment):
+    due = make_subscription(period_days=3)
+    cancelled = make_subscription(period_days=3, status=SubscriptionStatus.CANCELLED.value)
+    later = make_subscription(period_days=30)
+    lapsed = make_subscription(period_days=-1)
+    open_request = make_subscription(period_days=3)
+    make_payment(open_request)
+
+    assert generate_renewal_payments(within_days=7) == 1
+    invoiced = {p.subscription_id for p in Payment.query.filter(Payment.reference_id.like('%-R'))}
+    assert invoiced == {due.id}
+    assert not invoiced & {cancelled.id, later.id, lapsed.id, open_request.id}
+
+    # Re-running finds the open renewal payment and creates nothing.
+    assert generate_renewal_payments(within_days=7) == 0
+
+
+def test_notify_queues_sms_for_invoiced_only(app, make_subscription):
+    set_transport(app, FakeTransport())
+    due = make_subscription(period_days=2)
+    make_subscription(period_days=2, status=SubscriptionStatus.CANCELLED.value)
+
+    generate_renewal_payments(within_days=7, notify=True)
+    assert [row.recipient for row in SmsOutbox.query] == ['+' + due.phone_normalized]
@@ -0,0 +1,61 @@
+# tests/test_search.py
+from app.models import Payment, db
+from app.services import search
+
+
+def _payment(subscription, reference, phone='254712345678', name='Jane Doe'):
+    payment = Payment(
+        subscription_id=subscription.id,
+        amount=1000,
+        checkout_request_id=reference,
+        reference_id=reference,
+        customer_name=name,
+        customer_phone=phone,
+        status='Pending',
+        payment_status='Pending',
+        manual_payment_status='Pending',
+        payment_method='Manual',
+        tracking_code=f'TRK{reference[-4:]}',
+    )
+    db.session.add(payment)
+    db.session.commit()
+    return payment
+
+
+def test_word_prefix_uses_index(make_subscription):
+    payment = _payment(make_subscription(), 'NESTGOLD-7-1700000000')
+    assert [(kind, entity_id) for kind, entity_id, _ in search.ranked_matches('jan')][:1] == [
+        (search.ENTITY_PAYMENT, payment.id)
+    ]
+
+
+def test_phone_tail_and_fragment_fall_back_to_substring(make_subscription):
+    payment = _payment(make_subscription(), 'NESTGOLD-7-1700000000')
+    for query in ('5678', '70000', 'J'):
+        ids = [entity_id for kind, entity_id, _ in search.ranked_matches(query) if kind == search.ENTITY_PAYMENT]
+        assert payment.id in ids, query
+
+
+def test_payment_criterion_matches_old_substring_semantics(make_subscription):
+    payment = _payment(make_subscription(), 'NESTGOLD-7-1700000000')
+    other = _payment(make_subscription(), 'NESTGOLD-8-1700009999', phone='254799999999', name='Bob')
+
+    def ids(query):
+        return {p.id for p in Payment.query.filter(search.payment_criterion(query))}
+
+    assert ids('jane') == {payment.id}
+    assert ids('5678') == {payment.id}
+    assert ids('9999') == {other.id}
+    assert ids('%') == set()
+
+
+def test_index_hit_does_not_hide_substring_only_matches(make_subscription):
+    indexed = _payment(make_subscription(), 'NESTGOLD-7-1700000000', name='Jane Doe')
+    fragment = _payment(make_subscription(), 'NESTGOLD-8-1700000001', phone='254799999999', name='Marjane Bo')
+
+    ranked = [entity_id for kind, entity_id, _ in search.ranked_matches('jan') if kind == search.ENTITY_PAYMENT]
+    assert ranked[0] == indexed.id
+    assert fragment.id in ranked
+    assert len(ranked) == len(set(ranked))
+
+    assert {p.id for p in Payment.query.filter(search.payment_criterion('jan'))} == {indexed.id, fragment.id}
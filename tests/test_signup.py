@@ -0,0 +1,24 @@
+# tests/test_signup.py
+from sqlalchemy import update
+
+from app.models import Payment, SubscriptionPlan, db
+from app.services import catalog
+
+
+def test_signup_invoices_current_price_not_snapshot(client, plan):
+    assert catalog.get_plan(plan.id).price_per_month == 1000
+    # Another worker changes the price; this worker's snapshot has not expired yet.
+    db.session.execute(update(SubscriptionPlan).where(SubscriptionPlan.id == plan.id).values(price_per_month=1200))
+    db.session.commit()
+    assert catalog.get_plan(plan.id).price_per_month == 1000
+
+    response = client.post(f'/subscribe/{plan.id}', data={
+        'name': 'Jane Doe',
+        'phone': '0712345678',
+        'location': 'Nairobi',
+        'delivery_day': 'Monday',
+        'idempotency_key': 'k1',
+    })
+
+    assert response.status_code == 200
+    assert [p.amount for p in Payment.query.all()] == [1200]
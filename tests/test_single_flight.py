@@ -0,0 +1,95 @@
+# tests/test_single_flight.py
+import threading
+
+from app.services.single_flight import SingleFlight
+
+
+def _run_concurrently(flight, key, fn, callers):
+    results = []
+    errors = []
+
+    def call():
+        try:
+            results.append(flight.do(key, fn))
+        except Exception as exc:  # noqa: BLE001
+            errors.append(exc)
+
+    threads = [threading.Thread(target=call) for _ in range(callers)]
+    for thread in threads:
+        thread.start()
+    return threads, results, errors
+
+
+def _wait_for_waiters(flight, count):
+    for _ in range(500):
+        if flight.stats()['waiting'] >= count:
+            return
+        threading.Event().wait(0.01)
+    raise AssertionError('waiters never arrived')
+
+
+def test_concurrent_calls_share_one_execution():
+    flight = SingleFlight('test')
+    release = threading.Event()
+    runs = []
+
+    def lookup():
+        runs.append(1)
+        release.wait(5)
+        return 'row'
+
+    threads, results, errors = _run_concurrently(flight, 'k', lookup, 5)
+    _wait_for_waiters(flight, 4)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert (len(runs), results, errors) == (1, ['row'] * 5, [])
+    stats = flight.stats()
+    assert (stats['leaders'], stats['coalesced'], stats['in_flight']) == (1, 4, 0)
+
+
+def test_leader_error_reaches_waiters_and_is_not_kept():
+    flight = SingleFlight('test')
+    release = threading.Event()
+
+    def lookup():
+        release.wait(5)
+        raise LookupError('db down')
+
+    threads, results, errors = _run_concurrently(flight, 'k', lookup, 3)
+    _wait_for_waiters(flight, 2)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert results == [] and len(errors) == 3
+    assert all(isinstance(error, LookupError) for error in errors)
+    assert flight.do('k', lambda: 'fresh') == 'fresh'
+
+
+def test_reentrant_call_does_not_deadlock():
+    flight = SingleFlight('test')
+
+    assert flight.do('k', lambda: flight.do('k', lambda: 'inner')) == 'inner'
+
+
+def test_stuck_leader_times_out_waiters():
+    flight = SingleFlight('test', wait_seconds=0.05)
+    release = threading.Event()
+    threads, _, _ = _run_concurrently(flight, 'k', lambda: release.wait(5) and 'slow', 1)
+    while not flight.stats()['in_flight']:
+        threading.Event().wait(0.01)
+
+    assert flight.do('k', lambda: 'own') == 'own'
+    assert flight.stats()['timeouts'] == 1
+    release.set()
+    threads[0].join()
+
+
+def test_distinct_keys_do_not_coalesce():
+    flight = SingleFlight('test')
+
+    assert [flight.do(key, lambda key=key: key) for key in 'ab'] == ['a', 'b']
+    assert flight.stats()['coalesced'] == 0
+
@@ -0,0 +1,121 @@
+# tests/test_sms_outbox.py
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.models import SmsOutbox, SmsStatus, db
+from app.services import sms_outbox
+from app.services.circuit_breaker import CircuitBreaker
+from app.services.sms_transport import FakeTransport, set_transport
+
+
+@pytest.fixture
+def transport(app):
+    transport = FakeTransport()
+    set_transport(app, transport)
+    return transport
+
+
+def _queue(recipients, message='Hello', now=None):
+    sms_outbox.enqueue(recipients, message, 'test', now=now)
+    db.session.commit()
+
+
+def _rows():
+    db.session.expire_all()
+    return {row.recipient: row for row in SmsOutbox.query.order_by(SmsOutbox.id)}
+
+
+def test_claims_do_not_overlap_and_lease_expires(app):
+    now = datetime.utcnow()
+    _queue(['254700000001', '254700000002', '254700000003'], now=now)
+
+    first = sms_outbox.claim_batch(limit=2, now=now)
+    second = sms_outbox.claim_batch(limit=10, now=now)
+    assert len(first) == 2 and len(second) == 1
+    assert not {row.id for row in first} & {row.id for row in second}
+    assert sms_outbox.claim_batch(now=now) == []
+    assert {row.status for row in _rows().values()} == {SmsStatus.SENDING.value}
+
+    # A crashed worker's rows come back once the lease runs out.
+    later = now + timedelta(seconds=sms_outbox.SMS_OUTBOX_LEASE_SECONDS + 1)
+    assert len(sms_outbox.claim_batch(now=later)) == 3
+
+
+def test_future_rows_are_not_claimed(app):
+    now = datetime.utcnow()
+    _queue(['254700000001'], now=now + timedelta(minutes=5))
+
+    assert sms_outbox.claim_batch(now=now) == []
+
+
+def test_process_due_groups_same_text_and_marks_sent(app, transport):
+    _queue(['254700000001', '254700000002'], message='Delivery tomorrow')
+    _queue(['254700000003'], message='Renewal due')
+
+    assert sms_outbox.process_due() == (3, 0, 0)
+
+    assert sorted(transport.sent) == [
+        ('Delivery tomorrow', ['254700000001', '254700000002']),
+        ('Renewal due', ['254700000003']),
+    ]
+    rows = _rows()
+    assert {row.status for row in rows.values()} == {SmsStatus.SENT.value}
+    assert all(row.claim_token is None and row.provider_message_id for row in rows.values())
+
+
+def test_failed_send_is_retried_with_backoff_then_dead(app, monkeypatch):
+    set_transport(app, FakeTransport(fail_every=1))
+    monkeypatch.setattr(sms_outbox, 'SMS_MAX_ATTEMPTS', 2)
+    _queue(['254700000001'])
+
+    assert sms_outbox.process_due() == (0, 1, 0)
+    row = _rows()['254700000001']
+    assert (row.status, row.attempts) == (SmsStatus.PENDING.value, 1)
+    assert row.next_attempt_at > datetime.utcnow()
+    assert 'fake transport failure' in row.last_error
+
+    SmsOutbox.query.update({SmsOutbox.next_attempt_at: datetime.utcnow()})
+    db.session.commit()
+    assert sms_outbox.process_due() == (0, 0, 1)
+    assert _rows()['254700000001'].status == SmsStatus.DEAD.value
+
+
+def test_open_breaker_skips_claiming(app, transport):
+    transport.breaker = CircuitBreaker('test-sms', failure_threshold=1, reset_seconds=60)
+    transport.breaker.record_failure()
+    _queue(['254700000001'])
+
+    assert sms_outbox.process_due() == (0, 0, 0)
+
+    row = _rows()['254700000001']
+    assert (row.status, row.claim_token, row.attempts) == (SmsStatus.PENDING.value, None, 0)
+    assert transport.sent == []
+
+
+def test_unattempted_sends_are_deferred_without_using_an_attempt(app):
+    now = datetime.utcnow()
+    _queue(['254700000001'], now=now)
+    rows = sms_outbox.claim_batch(now=now)
+
+    sms_outbox.record_results([(rows[0], None)], now=now, defer_seconds=30)
+
+    row = _rows()['254700000001']
+    assert (row.status, row.attempts, row.last_error) == (SmsStatus.PENDING.value, 0, 'circuit open')
+    assert row.next_attempt_at == now + timedelta(seconds=30)
+
+
+def test_group_sends_splits_duplicates_and_caps_recipients():
+    class Row:
+        def __init__(self, recipient, message):
+            self.recipient, self.message = recipient, message
+
+    rows = [Row('a', 'x'), Row('a', 'x'), Row('b', 'x'), Row('c', 'x'), Row('a', 'y')]
+
+    groups = sms_outbox.group_sends(rows, size=2)
+
+    assert [[(r.recipient, r.message) for r in group] for group in groups] == [
+        [('a', 'x'), ('b', 'x')],
+        [('a', 'x'), ('c', 'x')],
+        [('a', 'y')],
+    ]
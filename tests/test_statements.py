@@ -0,0 +1,31 @@
+# tests/test_statements.py
+from datetime import datetime
+
+from app.services import statements
+
+
+def test_statements_follow_access_not_status(make_subscription):
+    current = make_subscription(period_days=5)
+    extended_but_stale_status = make_subscription(status='Expired', period_days=5)
+    lapsed_but_active_status = make_subscription(period_days=-1)
+
+    ids = {
+        header['id']
+        for jobs in statements._statement_jobs(datetime.utcnow(), batch_size=1)
+        for header, _ in jobs
+    }
+
+    assert ids == {current.id, extended_but_stale_status.id}
+    assert lapsed_but_active_status.id not in ids
+
+
+def test_generate_statements_in_spawned_pool(tmp_path, make_subscription, make_payment):
+    subs = [make_subscription(period_days=5) for _ in range(3)]
+    make_payment(subs[0], payment_status='Confirmed')
+
+    written = statements.generate_statements(str(tmp_path / 'out'), workers=2, batch_size=1)
+
+    assert written == 3
+    files = sorted(p.name for p in (tmp_path / 'out').iterdir())
+    assert len(files) == 3
+    assert all((tmp_path / 'out' / name).read_bytes().startswith(b'%PDF') for name in files)
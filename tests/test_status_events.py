@@ -0,0 +1,41 @@
+# tests/test_status_events.py
+import pytest
+
+from app.routes import subscription as subscription_routes
+
+
+@pytest.fixture
+def events_on(app):
+    app.config['STATUS_EVENTS'] = True
+
+
+def test_status_stream_is_a_bounded_long_poll(client, events_on, make_subscription, make_payment, monkeypatch):
+    monkeypatch.setattr(subscription_routes, 'STATUS_STREAM_SECONDS', 0.2)
+    payment = make_payment(make_subscription(status='Pending'))
+
+    body = client.get(f'/subscribe/events/{payment.checkout_request_id}').get_data(as_text=True)
+
+    assert body.startswith('event: status\ndata: {"status": "pending"}')
+    assert body.endswith('event: timeout\ndata: {}\n\n')
+
+
+def test_status_stream_ends_at_final_status(client, events_on, make_subscription, make_payment):
+    payment = make_payment(make_subscription(status='Pending'), status='Failed')
+
+    body = client.get(f'/subscribe/events/{payment.checkout_request_id}').get_data(as_text=True)
+
+    assert body == 'event: status\ndata: {"status": "failed"}\n\n'
+
+
+def test_sync_workers_poll_instead_of_streaming(client, make_subscription, make_payment):
+    payment = make_payment(make_subscription(status='Pending'))
+
+    assert client.get(f'/subscribe/events/{payment.checkout_request_id}').status_code == 404
+    page = client.get(f'/subscribe/pending/{payment.checkout_request_id}').get_data(as_text=True)
+    assert 'const useEvents = false &&' in page
+
+
+def test_pending_page_streams_when_enabled(client, events_on):
+    page = client.get('/subscribe/pending/NESTGOLD-1-1').get_data(as_text=True)
+
+    assert 'const useEvents = true &&' in page
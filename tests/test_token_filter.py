@@ -0,0 +1,55 @@
+# tests/test_token_filter.py
+from sqlalchemy import delete, insert, select
+
+from app.models import PaymentToken, db
+from app.services import payment_tokens, token_filter
+
+
+def _token_rows(payment_id):
+    return [dict(row._mapping) for row in db.session.execute(
+        select(PaymentToken.token, PaymentToken.payment_id, PaymentToken.subscription_id).where(
+            PaymentToken.payment_id == payment_id
+        )
+    )]
+
+
+def test_init_app_builds_filter_at_startup(app, make_subscription, make_payment):
+    make_payment(make_subscription())
+    app.extensions.pop('token_filter', None)
+
+    app.config['TOKEN_FILTER_PRELOAD'] = True
+    token_filter.init_app(app)
+
+    assert token_filter.get_filter()._bloom is not None
+
+
+def test_catch_up_finds_lower_id_committed_late(app, make_subscription, make_payment, monkeypatch):
+    monkeypatch.setattr(token_filter, 'TOKEN_FILTER_SYNC_SECONDS', 0)
+    sub = make_subscription()
+    late = make_payment(sub)
+    make_payment(sub)
+    # The lower id's tokens are not visible yet when this worker builds its filter.
+    late_rows = _token_rows(late.id)
+    db.session.execute(delete(PaymentToken).where(PaymentToken.payment_id == late.id))
+    db.session.commit()
+    guard = token_filter.get_filter()
+    guard.rebuild()
+    assert late.tracking_code not in guard._bloom
+
+    # Now it commits, from another worker (no in-process publish).
+    db.session.execute(insert(PaymentToken), late_rows)
+    db.session.commit()
+
+    assert guard.may_exist(late.tracking_code)
+    assert payment_tokens.resolve(late.tracking_code).payment_id == late.id
+
+
+def test_overlap_does_not_inflate_count(app, make_subscription, make_payment, monkeypatch):
+    monkeypatch.setattr(token_filter, 'TOKEN_FILTER_SYNC_SECONDS', 0)
+    make_payment(make_subscription())
+    guard = token_filter.get_filter()
+    guard.rebuild()
+    count = guard._bloom.count
+
+    assert not guard.may_exist('NOT-ISSUED-TOKEN')
+    assert guard._bloom.count == count